@@ -0,0 +1,94 @@
+"""
+Compare the response decoding pipelines on synthetic payloads shaped like the real ones:
+    - dict: Model(**json.loads(body)), what the request modules used to do
+    - orjson: Model(**orjson.loads(body))
+    - json: Model.model_validate_json(body), the JSON path of parse_response
+    - python: Model.model_validate(loads(body)), the PYTHON path of parse_response (orjson when installed)
+    - auto: validate_json(Model, body), what parse_response does: the json path unless the model
+      is pinned in nwpu.utils.decode.DECODE_PATHS. The faster of json and python is printed, the
+      models faster on the python path are the ones to pin.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_decode.py [--items 30] [--number 200]
+"""
+import argparse
+import json
+import sys
+import timeit
+from typing import Callable, Dict, Type
+
+from pydantic import BaseModel
+
+from fixtures import sample
+from nwpu.ecampus.ec_struct import ECampusNewsFeedContentItem, ECampusNewsFeedContentResponse
+from nwpu.market.market_struct import MarketItemListRecord, MarketItemListResponse
+from nwpu.mail.mail_struct import MailListResponse, MailListItem
+from nwpu.utils.decode import JSON, PYTHON, decode_path, loads, validate_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def news_feed(items: int) -> bytes:
+    data = sample(ECampusNewsFeedContentResponse)
+    data['data']['allContents'] = [sample(ECampusNewsFeedContentItem) for _ in range(items)]
+    data['data']['count'] = items
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+def market_items(items: int) -> bytes:
+    data = sample(MarketItemListResponse)
+    data['data']['records'] = [sample(MarketItemListRecord) for _ in range(items)]
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+def mail_list(items: int) -> bytes:
+    data = sample(MailListResponse)
+    data['var'] = [sample(MailListItem) for _ in range(items)]
+    return json.dumps(data, ensure_ascii=False).encode()
+
+
+PAYLOADS: Dict[str, tuple[Callable[[int], bytes], Type[BaseModel]]] = {
+    'news_feed': (news_feed, ECampusNewsFeedContentResponse),
+    'market_items': (market_items, MarketItemListResponse),
+    'mail_list': (mail_list, MailListResponse),
+}
+
+
+def pipelines(model: Type[BaseModel]) -> Dict[str, Callable[[bytes], BaseModel]]:
+    result = {'dict': lambda body: model(**json.loads(body))}
+    if orjson is not None:
+        result['orjson'] = lambda body: model(**orjson.loads(body))
+    result['json'] = model.model_validate_json
+    result['python'] = lambda body: model.model_validate(loads(body))
+    result['auto'] = lambda body: validate_json(model, body)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=30, help='items per response')
+    parser.add_argument('--number', type=int, default=200, help='decodes per measure')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for name, (build, model) in PAYLOADS.items():
+        body = build(args.items)
+        results = dict()
+        for pipeline, decode in pipelines(model).items():
+            decode(body)
+            best = min(timeit.repeat(lambda: decode(body), number=args.number, repeat=args.repeat))
+            results[pipeline] = best / args.number
+        baseline = results['dict']
+        faster = JSON if results['json'] <= results['python'] else PYTHON
+        print(f'{name} ({len(body) / 1024:.1f} KiB, {args.items} items, '
+              f'auto uses {decode_path(model)}, {faster} is faster)')
+        for pipeline, seconds in results.items():
+            print(f'    {pipeline:8} {seconds * 1e6:10.1f} us   x{baseline / seconds:.2f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
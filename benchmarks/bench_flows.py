@@ -0,0 +1,178 @@
+"""
+Offline benchmark of the login, listing and pagination flows, against the mock campus.
+Reports the operations per second, the p50 / p99 latency of an operation and the peak RSS of the client.
+
+    - login: password login then the service ticket exchanges of every service, on a fresh session.
+    - listing: news feed, market items and mail list pages, on one logged in session.
+    - pagination: all the pages of the market item list, --prefetch pages at a time (1: one after the other).
+
+Usage:
+    cd benchmarks
+    PYTHONPATH=.. python bench_flows.py [--flow listing] [--latency 0.02] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import json
+import math
+import resource
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from aiohttp import TraceConfig
+
+from mock_server import mock_connector, start_in_process
+from nwpu.ecampus.ec_struct import ECampusNewsFeedContentRequest
+from nwpu.mail.mail_struct import MailListRequest
+from nwpu.market.market_struct import MarketItemListRequest
+from nwpu.oa.broker import SessionBroker
+from nwpu.oa.oa_request import OaRequest
+from nwpu.oa.pool import PoolAccount, password_login
+from nwpu.utils.client import create_session
+from nwpu.utils.singleflight import default_group
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    if not values:
+        return math.nan
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class RequestCounter:
+    """
+    Counts the http requests of the sessions, redirects included.
+    """
+    def __init__(self):
+        self.count = 0
+        self.trace = TraceConfig()
+        self.trace.on_request_end.append(self._on_request)
+        self.trace.on_request_redirect.append(self._on_request)
+
+    async def _on_request(self, *args):
+        self.count += 1
+
+
+counter = RequestCounter()
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is in KiB on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def login(connector) -> SessionBroker:
+    sess = create_session(connector=connector, trace_configs=[counter.trace])
+    oa = OaRequest(sess)
+    if not await password_login(oa, PoolAccount('2020000001', 'password')):
+        raise RuntimeError("Mock login failed.")
+    broker = SessionBroker(oa)
+    await broker.authorize_all()
+    return broker
+
+
+async def run(operation: Callable[[int], Awaitable[None]], operations: int, concurrency: int) -> Dict[str, float]:
+    """
+    Run the operation `operations` times, `concurrency` at a time.
+    :param operation: operation(index)
+    """
+    latencies = list()
+    queue = iter(range(operations))
+
+    async def worker():
+        for index in queue:
+            start = time.perf_counter()
+            await operation(index)
+            latencies.append(time.perf_counter() - start)
+
+    requests = counter.count
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    requests = counter.count - requests
+    return dict(operations=operations,
+                requests=requests,
+                seconds=round(elapsed, 3),
+                ops_per_second=round(operations / elapsed, 1),
+                requests_per_second=round(requests / elapsed, 1),
+                p50_ms=round(percentile(latencies, 0.5) * 1000, 2),
+                p99_ms=round(percentile(latencies, 0.99) * 1000, 2),
+                peak_rss_mib=round(peak_rss_mib(), 1))
+
+
+async def bench(args: argparse.Namespace, port: int) -> Dict[str, Dict[str, float]]:
+    connector = mock_connector(port)
+    results = dict()
+    broker = await login(connector)
+
+    if args.flow in ('all', 'login'):
+        async def login_operation(index: int):
+            broker = await login(connector)
+            await broker.sess.close()
+        results['login'] = await run(login_operation, max(1, args.operations // 10), args.concurrency)
+
+    if args.flow in ('all', 'listing'):
+        ecampus, market, mail = broker.clients['ecampus'], broker.clients['market'], broker.clients['mail']
+
+        async def listing_operation(index: int):
+            kind = index % 3
+            if kind == 0:
+                await ecampus.get_news_feed_content(ECampusNewsFeedContentRequest(column_id='1', page_size=args.items))
+            elif kind == 1:
+                await market.get_item_list(MarketItemListRequest(page_size=args.items))
+            else:
+                await mail.get_mail_list(MailListRequest(limit=args.items))
+        results['listing'] = await run(listing_operation, args.operations, args.concurrency)
+
+    if args.flow in ('all', 'pagination'):
+        market = broker.clients['market']
+        pages = math.ceil(args.total / args.items)
+
+        async def pagination_operation(index: int):
+            async for page in market.iter_item_list(MarketItemListRequest(page_size=args.items),
+                                                    prefetch=args.prefetch).pages():
+                pass
+        results['pagination'] = await run(pagination_operation, max(1, args.operations // pages),
+                                          args.concurrency)
+
+    await broker.sess.close()
+    await connector.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flow', choices=('all', 'login', 'listing', 'pagination'), default='all')
+    parser.add_argument('--operations', type=int, default=600)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added by the server to every response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--items', type=int, default=30, help='items per page')
+    parser.add_argument('--string-size', type=int, default=1, help='scales the strings of the payloads')
+    parser.add_argument('--total', type=int, default=300, help='items of the paged endpoints')
+    parser.add_argument('--prefetch', type=int, default=4, help='pages requested concurrently by the pagination flow')
+    parser.add_argument('--fixtures', default=None, help='directory of recorded fixtures')
+    parser.add_argument('--coalesce', action='store_true',
+                        help='share the identical concurrent requests (single flight), off to measure every request')
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    args = parser.parse_args()
+    default_group.enabled = args.coalesce
+
+    process, port = start_in_process(latency=args.latency, jitter=args.jitter, items=args.items,
+                                     string_size=args.string_size, total=args.total,
+                                     fixtures_dir=args.fixtures)
+    try:
+        results = asyncio.run(bench(args, port))
+    finally:
+        process.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for flow, result in results.items():
+            print(f"{flow:11} " + '  '.join(f"{key}={value}" for key, value in result.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Import time of the package entry points, each measured in a fresh interpreter.
+Reports the median wall time of the import, the number of modules it loaded and
+whether pycryptodome and the service models were loaded.
+
+Usage:
+    cd benchmarks
+    PYTHONPATH=.. python bench_import.py [--runs 15] [--json]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from typing import Dict
+
+TARGETS = (
+    'nwpu',
+    'nwpu.utils.crypto',
+    'nwpu.utils.client',
+    'nwpu.oa.oa_request',
+    'nwpu.oa.broker',
+    'nwpu.ecampus.ec_request',
+)
+
+PROBE = '''
+import sys, time, json
+before = set(sys.modules)
+start = time.perf_counter()
+import {target}
+elapsed = time.perf_counter() - start
+loaded = set(sys.modules) - before
+print(json.dumps(dict(
+    ms=elapsed * 1000,
+    modules=len(loaded),
+    crypto=any(x.startswith('Crypto') for x in loaded),
+    structs=sorted(x.rsplit('.', 1)[-1] for x in loaded if x.endswith('_struct') and not x.startswith('_')),
+)))
+'''
+
+
+def measure(target: str, runs: int) -> Dict[str, object]:
+    samples = list()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(target=target)],
+                             check=True, capture_output=True, text=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return dict(median_ms=round(statistics.median(x['ms'] for x in samples), 1),
+                min_ms=round(min(x['ms'] for x in samples), 1),
+                modules=samples[-1]['modules'],
+                crypto=samples[-1]['crypto'],
+                structs=len(set(samples[-1]['structs'])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=15)
+    parser.add_argument('--json', action='store_true', help='print the results as json')
+    parser.add_argument('targets', nargs='*', default=TARGETS)
+    args = parser.parse_args()
+
+    results = {target: measure(target, args.runs) for target in args.targets}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for target, result in results.items():
+            print(f"{target:26} " + '  '.join(f"{key}={value}" for key, value in result.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,375 @@
+"""
+Record / replay of real campus traffic, for load tests shaped like the real sessions.
+
+Capture: CassetteRecorder is a client middleware recording every request / response pair
+(redirect hops included) of a real session, with the credentials redacted:
+
+    recorder = CassetteRecorder()
+    sess = create_session(middlewares=[recorder])
+    ... log in with OaRequest, use the service clients ...
+    recorder.cassette.save('login.jsonl')
+
+Replay: ReplayServer serves the recorded responses from a local https server, reached with
+mock_connector(port), and replay() sends the recorded requests again, N times faster and / or
+from many concurrent virtual users:
+
+    PYTHONPATH=.. python cassette.py replay login.jsonl --speed 4 --fanout 32
+    PYTHONPATH=.. python cassette.py export login.jsonl fixtures/   # fixtures of mock_server.py
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import ClientRequest, ClientResponse, ClientSession, web
+from aiohttp.client_middlewares import ClientHandlerType
+from multidict import CIMultiDict
+from yarl import URL
+
+from mock_server import mock_connector, self_signed_context
+from nwpu.utils.client import create_session
+from nwpu.utils.metrics import endpoint_name
+
+REDACTED = 'REDACTED'
+REDACTED_HEADERS = ('Cookie', 'Set-Cookie', 'Authorization', 'X-Id-Token', 'Proxy-Authorization')
+# query string and form fields carrying credentials, tickets or session ids (code and state: OAuth redirects)
+REDACTED_FIELDS = ('password', 'username', 'ticket', 'token', 'code', 'sid', 'state', 'mfaState', 'execution',
+                   'fpVisitorId', 'idToken', 'apptoken', 'gid', 'stateKey')
+# json bodies: the paths of the credentials, keys separated by dots, * for every item of a list.
+# Only these are redacted, a `code` or `state` of a json body is usually the status of the response.
+REDACTED_REQUEST_PATHS = ('gid', 'code', 'password', 'username')
+REDACTED_RESPONSE_PATHS = ('data.gid', 'data.state', 'data.stateKey', 'data.qrCode.apptoken')
+# hop by hop headers, not replayed
+SKIPPED_HEADERS = ('Content-Length', 'Transfer-Encoding', 'Content-Encoding', 'Connection', 'Date', 'Server')
+# sent by replay(), so that every virtual user gets the recorded responses in its own order
+USER_HEADER = 'X-Cassette-User'
+
+
+class Interaction:
+    """
+    One request / response pair.
+    """
+    offset: float  # seconds since the start of the recording
+    duration: float
+    method: str
+    url: str
+    request_headers: Dict[str, str]
+    request_body: bytes
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+    def __init__(self, offset: float, duration: float, method: str, url: str,
+                 request_headers: Dict[str, str], request_body: bytes,
+                 status: int, headers: List[Tuple[str, str]], body: bytes):
+        self.offset = offset
+        self.duration = duration
+        self.method = method
+        self.url = url
+        self.request_headers = request_headers
+        self.request_body = request_body
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def tag(self) -> str:
+        return endpoint_name(self.url)
+
+    def to_json(self) -> dict:
+        return dict(offset=self.offset, duration=self.duration, method=self.method, url=self.url,
+                    request_headers=self.request_headers,
+                    request_body=base64.b64encode(self.request_body).decode(),
+                    status=self.status, headers=self.headers,
+                    body=base64.b64encode(self.body).decode())
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Interaction':
+        return cls(data['offset'], data['duration'], data['method'], data['url'],
+                   data['request_headers'], base64.b64decode(data['request_body']),
+                   data['status'], [tuple(x) for x in data['headers']], base64.b64decode(data['body']))
+
+
+class Cassette:
+    interactions: List[Interaction]
+
+    def __init__(self, interactions: Optional[Iterable[Interaction]] = None):
+        self.interactions = list(interactions or ())
+
+    def save(self, path: str | Path):
+        with open(path, 'w') as f:
+            for interaction in self.interactions:
+                f.write(json.dumps(interaction.to_json()) + '\n')
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'Cassette':
+        with open(path) as f:
+            return cls(Interaction.from_json(json.loads(line)) for line in f if line.strip())
+
+    @property
+    def duration(self) -> float:
+        return max((x.offset + x.duration for x in self.interactions), default=0.0)
+
+
+def redact_url(url: URL, fields: Iterable[str] = REDACTED_FIELDS) -> URL:
+    fields = set(fields)
+    if not any(x in fields for x in url.query):
+        return url
+    return url.with_query([(k, REDACTED if k in fields else v) for k, v in url.query.items()])
+
+
+def _redact_path(value: Any, path: List[str]) -> Any:
+    if not path:
+        return REDACTED if isinstance(value, (str, int)) and not isinstance(value, bool) else value
+    key, rest = path[0], path[1:]
+    if isinstance(value, list) and key == '*':
+        return [_redact_path(x, rest) for x in value]
+    if isinstance(value, dict) and key in value:
+        return {**value, key: _redact_path(value[key], rest)}
+    return value
+
+
+def redact_value(value: Any, paths: Iterable[str]) -> Any:
+    """
+    Redact the values at the given paths of a decoded json document, e.g. 'data.qrCode.apptoken'.
+    """
+    for path in paths:
+        value = _redact_path(value, path.split('.'))
+    return value
+
+
+def redact_body(body: bytes, content_type: str, fields: Iterable[str] = REDACTED_FIELDS,
+                paths: Iterable[str] = REDACTED_RESPONSE_PATHS) -> bytes:
+    """
+    :param fields: the fields of a form body.
+    :param paths: the paths of a json body.
+    """
+    if not body:
+        return body
+    if 'json' in content_type:
+        try:
+            return json.dumps(redact_value(json.loads(body), paths), ensure_ascii=False).encode()
+        except ValueError:
+            return body
+    if 'x-www-form-urlencoded' in content_type:
+        return redact_url(URL('/').with_query(body.decode()), fields).raw_query_string.encode()
+    return body
+
+
+class CassetteRecorder:
+    """
+    aiohttp client middleware recording the traffic of a session into a Cassette.
+    The response bodies are read, and cached by aiohttp, before being handed back.
+    :param fields: the query string and form fields to redact.
+    :param headers: the headers to redact.
+    :param request_paths: the json paths to redact in the request bodies.
+    :param response_paths: the json paths to redact in the response bodies.
+    """
+    cassette: Cassette
+
+    def __init__(self, fields: Iterable[str] = REDACTED_FIELDS, headers: Iterable[str] = REDACTED_HEADERS,
+                 request_paths: Iterable[str] = REDACTED_REQUEST_PATHS,
+                 response_paths: Iterable[str] = REDACTED_RESPONSE_PATHS):
+        self.cassette = Cassette()
+        self.fields = tuple(fields)
+        self.request_paths = tuple(request_paths)
+        self.response_paths = tuple(response_paths)
+        self.headers = tuple(x.lower() for x in headers)
+        self._start: Optional[float] = None
+
+    def _redact_headers(self, headers) -> List[Tuple[str, str]]:
+        result = list()
+        for name, value in headers.items():
+            if name in SKIPPED_HEADERS:
+                continue
+            if name.lower() in self.headers:
+                value = REDACTED
+            elif name.lower() == 'location':
+                value = str(redact_url(URL(value), self.fields))
+            result.append((name, value))
+        return result
+
+    async def __call__(self, req: ClientRequest, handler: ClientHandlerType) -> ClientResponse:
+        loop = asyncio.get_running_loop()
+        if self._start is None:
+            self._start = loop.time()
+        start = loop.time()
+        request_body = b''
+        if req.body:
+            try:
+                request_body = await req.body.as_bytes() if not isinstance(req.body, bytes) else req.body
+            except Exception:
+                # streamed bodies are not recorded
+                request_body = b''
+        resp = await handler(req)
+        body = await resp.read()
+        self.cassette.interactions.append(Interaction(
+            offset=start - self._start,
+            duration=loop.time() - start,
+            method=req.method,
+            url=str(redact_url(req.url, self.fields)),
+            request_headers=dict(self._redact_headers(req.headers)),
+            request_body=redact_body(request_body, req.headers.get('Content-Type', ''), self.fields,
+                                     self.request_paths),
+            status=resp.status,
+            headers=self._redact_headers(resp.headers),
+            body=redact_body(body, resp.content_type, self.fields, self.response_paths)))
+        return resp
+
+
+class ReplayServer:
+    """
+    Serves the responses of a cassette, reached with mock_connector(port).
+    A request is matched by method, host, path and func parameter; the recorded responses of the same
+    request are served in turn, to every virtual user of replay() separately.
+    :param speed: the recorded server durations are divided by speed, 0 to answer at once.
+    """
+    port: int
+
+    def __init__(self, cassette: Cassette, speed: float = 1.0, port: int = 0):
+        self.speed = speed
+        self.port = port
+        self._responses: Dict[tuple, List[Interaction]] = dict()
+        self._served: Dict[Tuple[str, tuple], int] = dict()
+        for interaction in cassette.interactions:
+            self._responses.setdefault(self.key(interaction.method, URL(interaction.url)), list()).append(interaction)
+        self._runner: Optional[web.AppRunner] = None
+        self._tmp: Optional[tempfile.TemporaryDirectory] = None
+
+    @staticmethod
+    def key(method: str, url: URL) -> tuple:
+        return method, url.host, url.path, url.query.get('func')
+
+    async def handle(self, request: web.Request) -> web.Response:
+        url = URL.build(scheme='https', host=request.host.split(':', 1)[0], path=request.path, query=request.query)
+        key = self.key(request.method, url)
+        recorded = self._responses.get(key)
+        if not recorded:
+            return web.Response(status=404, text=f"Not recorded: {request.method} {url}")
+        served = request.headers.get(USER_HEADER, ''), key
+        index = self._served.get(served, 0)
+        self._served[served] = index + 1
+        interaction = recorded[index % len(recorded)]
+        if request.can_read_body:
+            await request.read()
+        if self.speed > 0:
+            await asyncio.sleep(interaction.duration / self.speed)
+        return web.Response(status=interaction.status, body=interaction.body,
+                            headers=CIMultiDict(interaction.headers))
+
+    async def __aenter__(self) -> 'ReplayServer':
+        self._tmp = tempfile.TemporaryDirectory()
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', self.port,
+                          ssl_context=self_signed_context(Path(self._tmp.name))).start()
+        self.port = self._runner.addresses[0][1]
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+        self._tmp.cleanup()
+
+
+async def replay(cassette: Cassette, sess: ClientSession, speed: float = 1.0, fanout: int = 1) -> Dict[str, float]:
+    """
+    Send the recorded requests again, keeping their order and their spacing divided by speed.
+    :param cassette:
+    :param sess: a session reaching the replay target, e.g. create_session(connector=mock_connector(port)).
+    :param speed: 2 replays twice faster, 0 sends the requests back to back.
+    :param fanout: the number of virtual users replaying the cassette concurrently.
+    :return: the statistics of the replay.
+    """
+    latencies = list()
+    errors = 0
+    loop = asyncio.get_running_loop()
+
+    async def user(index: int):
+        nonlocal errors
+        start = loop.time()
+        for interaction in cassette.interactions:
+            if speed > 0:
+                delay = start + interaction.offset / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            headers = {k: v for k, v in interaction.request_headers.items() if v != REDACTED}
+            headers[USER_HEADER] = str(index)
+            sent = time.perf_counter()
+            async with sess.request(interaction.method, URL(interaction.url, encoded=True), headers=headers,
+                                    data=interaction.request_body or None, allow_redirects=False) as resp:
+                await resp.read()
+                if resp.status != interaction.status:
+                    errors += 1
+            latencies.append(time.perf_counter() - sent)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(x) for x in range(fanout)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    requests = len(latencies)
+    return dict(users=fanout,
+                requests=requests,
+                mismatched_statuses=errors,
+                seconds=round(elapsed, 3),
+                requests_per_second=round(requests / elapsed, 1),
+                p50_ms=round(latencies[int(0.5 * (requests - 1))] * 1000, 2) if latencies else math.nan,
+                p99_ms=round(latencies[int(0.99 * (requests - 1))] * 1000, 2) if latencies else math.nan)
+
+
+def export_fixtures(cassette: Cassette, directory: str | Path) -> List[str]:
+    """
+    Write the last recorded json body of every endpoint as "<tag>.json", for MockCampus(fixtures_dir=...).
+    :return: the exported tags.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    bodies = dict()
+    for interaction in cassette.interactions:
+        content_type = dict((k.lower(), v) for k, v in interaction.headers).get('content-type', '')
+        if interaction.status == 200 and 'json' in content_type and '.' in interaction.tag:
+            bodies[interaction.tag] = interaction.body
+    for tag, body in bodies.items():
+        (directory / f"{tag}.json").write_bytes(body)
+    return sorted(bodies.keys())
+
+
+async def _replay_command(args: argparse.Namespace):
+    cassette = Cassette.load(args.cassette)
+    async with ReplayServer(cassette, speed=args.speed) as server:
+        connector = mock_connector(server.port)
+        async with create_session(connector=connector) as sess:
+            result = await replay(cassette, sess, speed=args.speed, fanout=args.fanout)
+        await connector.close()
+    print(json.dumps(result, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help='replay a cassette against its recorded responses')
+    replay_parser.add_argument('cassette')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='0 for back to back requests')
+    replay_parser.add_argument('--fanout', type=int, default=1, help='concurrent virtual users')
+    export_parser = commands.add_parser('export', help='export the json bodies as mock server fixtures')
+    export_parser.add_argument('cassette')
+    export_parser.add_argument('directory')
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        asyncio.run(_replay_command(args))
+    else:
+        for tag in export_fixtures(Cassette.load(args.cassette), args.directory):
+            print(tag)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
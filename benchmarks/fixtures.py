@@ -0,0 +1,310 @@
+"""
+Synthetic fixtures for every campus endpoint, generated from the response models.
+
+A fixture is keyed by the endpoint tag of nwpu.utils.metrics (e.g. "ECampusUrl.USER_CARD").
+Recorded responses can replace the synthetic ones: a "<tag>.json" file in the fixtures directory
+given to the mock server is served as is (cassette.py exports them from a recorded session).
+"""
+import json
+import typing
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from types import NoneType, UnionType
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from nwpu.bus.bus_request import BusUrls
+from nwpu.bus.bus_struct import BusRouteByTypeResponse, BusRouteDetailResponse, BusUserAppointmentResponse
+from nwpu.classroom.classroom_request import IdleClassroomUrl
+from nwpu.classroom.classroom_struct import IdleClassroomAllCampusResponse, IdleClassroomByTimeResponse, \
+    IdleClassroomDetailResponse, IdleClassroomListResponse, IdleClassroomRoomTypeResponse, \
+    IdleClassroomSeatCodeResponse, IdleClassroomTeachingBuildingResponse, IdleClassroomTeachingWeeksResponse
+from nwpu.ecampus.ec_request import ECampusUrl
+from nwpu.ecampus.ec_struct import ECampusAddUserEventResponse, ECampusDeleteUserEventResponse, \
+    ECampusHasNewEmailResponse, ECampusNewsFeedColumnListResponse, ECampusNewsFeedContentResponse, \
+    ECampusUserBorrowBooksResponse, ECampusUserCardResponse, ECampusUserConsumptionHistoryResponse, \
+    ECampusUserEventCalendarResponse, ECampusUserEventsResponse, ECampusUserInfoAccurateResponse, \
+    ECampusUserInfoResponse, ECampusUserNetworkFeeResponse, ECampusUserPapersResponse, ECampusUserPropertyResponse
+from nwpu.edu.edu_request import EduUrls
+from nwpu.edu.edu_struct import EduNotificationResponse
+from nwpu.mail.mail_request import MailUrls
+from nwpu.mail.mail_struct import AllMailContactGroupResponse, MailCategoryResponse, MailListResponse, \
+    ReadMailResponse, SearchContactResponse
+from nwpu.market.market_request import MarketUrls
+from nwpu.market.market_struct import MarketCampusInfoResponse, MarketComplaintTypeResponse, \
+    MarketItemClassificationResponse, MarketItemDetailResponse, MarketItemListResponse, MarketSelfInfoResponse, \
+    MarketUnreadMessageCountResponse, MarketUserMessageResponse
+from nwpu.oa.mfa import CheckMfaRequiredResponse, MfaInitResponse
+from nwpu.oa.oa_request import OaRequestUrl
+from nwpu.oa.qrcode import QrCometResponse, QrInitResponse
+from nwpu.oa.dyncode import SmsLoginSendCodeResponse
+
+COREMAIL_JSON = 'text/x-json'
+# a 1x1 png, for the image endpoints
+PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082')
+
+
+def _tag(url_class: type, name: str) -> str:
+    assert isinstance(getattr(url_class, name), str)
+    return f"{url_class.__name__}.{name}"
+
+
+class Paging:
+    """
+    Where the items of a paged endpoint are, and how the page is requested.
+    """
+    list_path: tuple[str, ...]
+    page_param: Optional[str]
+    size_param: Optional[str]
+    offset_param: Optional[str]
+    total_path: Optional[tuple[str, ...]]
+
+    def __init__(self, list_path: tuple[str, ...],
+                 page_param: Optional[str] = None,
+                 size_param: Optional[str] = None,
+                 offset_param: Optional[str] = None,
+                 total_path: Optional[tuple[str, ...]] = None):
+        self.list_path = list_path
+        self.page_param = page_param
+        self.size_param = size_param
+        self.offset_param = offset_param
+        self.total_path = total_path
+
+
+class Fixture:
+    tag: str
+    model: Optional[Type[BaseModel]]
+    content_type: str
+    body: Optional[bytes]
+    paging: Optional[Paging]
+    patch: Optional[Callable[[dict], None]]
+
+    def __init__(self, tag: str,
+                 model: Optional[Type[BaseModel]] = None,
+                 content_type: str = 'application/json',
+                 body: Optional[bytes] = None,
+                 paging: Optional[Paging] = None,
+                 patch: Optional[Callable[[dict], None]] = None):
+        """
+        :param tag: the endpoint tag.
+        :param model: the response model the payload is generated from.
+        :param content_type:
+        :param body: a fixed body, for the non json endpoints.
+        :param paging: for the paged endpoints, the items are then generated per request.
+        :param patch: adjusts the generated payload, e.g. to skip mfa.
+        """
+        self.tag = tag
+        self.model = model
+        self.content_type = content_type
+        self.body = body
+        self.paging = paging
+        self.patch = patch
+
+
+def sample_value(annotation: Any, items: int = 3, string_size: int = 1) -> Any:
+    """
+    A json value accepted by the annotation, preferring strings so that every field is populated.
+    :param annotation:
+    :param items: the length of the lists.
+    :param string_size: the strings are 'value' repeated string_size times.
+    """
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, UnionType):
+        args = [x for x in typing.get_args(annotation) if x not in (NoneType, Any)]
+        return sample_value(args[0], items, string_size) if args else 'value' * string_size
+    if origin in (list, List):
+        args = typing.get_args(annotation)
+        return [sample_value(args[0], items, string_size) if args else 'value' * string_size for _ in range(items)]
+    if origin in (dict, typing.Dict):
+        return {'key': 'value' * string_size}
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel):
+            return sample(annotation, items, string_size)
+        if issubclass(annotation, Enum):
+            return next(iter(annotation)).value
+        if issubclass(annotation, bool):
+            return True
+        if issubclass(annotation, int):
+            return 1700000000
+        if issubclass(annotation, float):
+            return 1.5
+        if issubclass(annotation, datetime):
+            return '2024-01-01 00:00:00'
+    return 'value' * string_size
+
+
+def sample(model: Type[BaseModel], items: int = 3, string_size: int = 1) -> dict:
+    """
+    A json object populating every field of the model, keyed by alias.
+    """
+    return {field.alias or name: sample_value(field.annotation, items, string_size)
+            for name, field in model.model_fields.items()}
+
+
+def _skip_mfa(data: dict):
+    data['data']['need'] = False
+
+
+def _qr_scanned(data: dict):
+    data['code'] = 0
+    data['data']['qrCode']['status'] = 2
+
+
+FIXTURES: Dict[str, Fixture] = {x.tag: x for x in (
+    # oa, the login page and the service tickets are handled by the mock server
+    Fixture(_tag(OaRequestUrl, 'OA_QR_INIT'), QrInitResponse),
+    Fixture(_tag(OaRequestUrl, 'OA_QR_IMAGE'), content_type='image/png', body=PNG),
+    Fixture(_tag(OaRequestUrl, 'OA_QR_COMET'), QrCometResponse, patch=_qr_scanned),
+    Fixture(_tag(OaRequestUrl, 'OA_SMS_SEND'), SmsLoginSendCodeResponse),
+    Fixture(_tag(OaRequestUrl, 'OA_PWD_DETECT'), CheckMfaRequiredResponse, patch=_skip_mfa),
+    Fixture(_tag(OaRequestUrl, 'OA_MFA_INIT'), MfaInitResponse),
+    # ecampus
+    Fixture(_tag(ECampusUrl, 'HAS_NEW_EMAIL'), ECampusHasNewEmailResponse),
+    Fixture(_tag(ECampusUrl, 'USER_INFO'), ECampusUserInfoResponse),
+    Fixture(_tag(ECampusUrl, 'USER_INFO_ACCURATE'), ECampusUserInfoAccurateResponse),
+    Fixture(_tag(ECampusUrl, 'USER_PORTRAIT'), content_type='image/png', body=PNG),
+    Fixture(_tag(ECampusUrl, 'USER_PAPER'), ECampusUserPapersResponse),
+    Fixture(_tag(ECampusUrl, 'USER_CARD'), ECampusUserCardResponse),
+    Fixture(_tag(ECampusUrl, 'USER_CONSUMPTION_HISTORY'), ECampusUserConsumptionHistoryResponse),
+    Fixture(_tag(ECampusUrl, 'USER_NETWORK_FEE'), ECampusUserNetworkFeeResponse),
+    Fixture(_tag(ECampusUrl, 'USER_BORROW_BOOKS'), ECampusUserBorrowBooksResponse),
+    Fixture(_tag(ECampusUrl, 'USER_PROPERTY'), ECampusUserPropertyResponse),
+    Fixture(_tag(ECampusUrl, 'USER_EVENTS'), ECampusUserEventsResponse),
+    Fixture(_tag(ECampusUrl, 'NEWS_FEED_COLUMN_LIST'), ECampusNewsFeedColumnListResponse),
+    Fixture(_tag(ECampusUrl, 'NEWS_FEED_CONTENT'), ECampusNewsFeedContentResponse,
+            paging=Paging(('data', 'allContents'), page_param='pageNo', size_param='pageSize',
+                          total_path=('data', 'count'))),
+    Fixture(_tag(ECampusUrl, 'USER_EVENT_CALENDAR'), ECampusUserEventCalendarResponse),
+    Fixture(_tag(ECampusUrl, 'USER_EVENT_CREATE'), ECampusAddUserEventResponse),
+    Fixture(_tag(ECampusUrl, 'USER_EVENT_DELETE'), ECampusDeleteUserEventResponse),
+    # mail
+    Fixture(_tag(MailUrls, 'MAIL_CATEGORY'), MailCategoryResponse, COREMAIL_JSON),
+    Fixture(_tag(MailUrls, 'MAIL_LIST'), MailListResponse, COREMAIL_JSON,
+            paging=Paging(('var',), size_param='limit', offset_param='start', total_path=('total',))),
+    Fixture(_tag(MailUrls, 'MAIL_USER_AVATAR'), content_type='image/png', body=PNG),
+    Fixture(_tag(MailUrls, 'MAIL_READ_MAIL'), ReadMailResponse, COREMAIL_JSON),
+    Fixture(_tag(MailUrls, 'MAIL_GET_ALL_CONTACTS'), AllMailContactGroupResponse, COREMAIL_JSON),
+    Fixture(_tag(MailUrls, 'MAIL_SEARCH_CONTACT'), SearchContactResponse, COREMAIL_JSON),
+    # bus
+    Fixture(_tag(BusUrls, 'BUS_APPOINTMENTS'), BusUserAppointmentResponse),
+    Fixture(_tag(BusUrls, 'BUS_ROUTES'), BusRouteByTypeResponse),
+    Fixture(_tag(BusUrls, 'BUS_ROUTE_DETAILS'), BusRouteDetailResponse),
+    # edu
+    Fixture(_tag(EduUrls, 'NOTIFICATION'), EduNotificationResponse),
+    # idle classroom
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_ALL_CAMPUS'), IdleClassroomAllCampusResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_TEACHING_BUILDINGS'), IdleClassroomTeachingBuildingResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_TEACHING_WEEKS'), IdleClassroomTeachingWeeksResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_IDLE_LIST'), IdleClassroomListResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_SELECT_BY_TIME'), IdleClassroomByTimeResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_ROOM_TYPES'), IdleClassroomRoomTypeResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_SEAT_CODES'), IdleClassroomSeatCodeResponse),
+    Fixture(_tag(IdleClassroomUrl, 'CLASSROOM_IDLE_DETAILS'), IdleClassroomDetailResponse,
+            paging=Paging(('data', 'records'), page_param='current', size_param='size',
+                          total_path=('data', 'total'))),
+    # market
+    Fixture(_tag(MarketUrls, 'MARKET_SELF_INFO'), MarketSelfInfoResponse),
+    Fixture(_tag(MarketUrls, 'MARKET_ITEM_CLASSIFICATION'), MarketItemClassificationResponse),
+    Fixture(_tag(MarketUrls, 'MARKET_COMPLAINT_TYPE'), MarketComplaintTypeResponse),
+    Fixture(_tag(MarketUrls, 'MARKET_CAMPUS_INFO'), MarketCampusInfoResponse),
+    Fixture(_tag(MarketUrls, 'MARKET_UNREAD_MSG_COUNT'), MarketUnreadMessageCountResponse),
+    Fixture(_tag(MarketUrls, 'MARKET_MSG_LIST'), MarketUserMessageResponse),
+    Fixture(_tag(MarketUrls, 'MARKET_ITEM_LIST'), MarketItemListResponse,
+            paging=Paging(('data', 'records'), page_param='current', size_param='size',
+                          total_path=('data', 'total'))),
+    Fixture(_tag(MarketUrls, 'MARKET_ITEM_DETAIL'), MarketItemDetailResponse),
+)}
+
+
+def _get(data: Any, path: tuple[str, ...]) -> Any:
+    for key in path:
+        data = data[key]
+    return data
+
+
+def _set(data: dict, path: tuple[str, ...], value: Any):
+    # the objects along the path are copied, the payloads are shared between the requests
+    for key in path[:-1]:
+        data[key] = dict(data[key])
+        data = data[key]
+    data[path[-1]] = value
+
+
+class FixtureSet:
+    """
+    The payloads served by the mock server, generated once per endpoint.
+    """
+    items: int
+    string_size: int
+    total: int
+    directory: Optional[Path]
+
+    def __init__(self, items: int = 30, string_size: int = 1, total: int = 300, directory: Optional[Path] = None):
+        """
+        :param items: the length of the lists of the payloads.
+        :param string_size: scales the strings of the payloads.
+        :param total: the number of items of the paged endpoints.
+        :param directory: the recorded fixtures, served instead of the generated ones.
+        """
+        self.items = items
+        self.string_size = string_size
+        self.total = total
+        self.directory = Path(directory) if directory is not None else None
+        self._payloads: Dict[str, Any] = dict()
+        self._bodies: Dict[str, bytes] = dict()
+
+    def recorded(self, tag: str) -> Optional[bytes]:
+        if self.directory is None:
+            return None
+        path = self.directory / f"{tag}.json"
+        return path.read_bytes() if path.exists() else None
+
+    def payload(self, fixture: Fixture) -> dict:
+        if fixture.tag not in self._payloads:
+            recorded = self.recorded(fixture.tag)
+            if recorded is not None:
+                data = json.loads(recorded)
+            else:
+                data = sample(fixture.model, self.items, self.string_size)
+                if fixture.patch is not None:
+                    fixture.patch(data)
+            self._payloads[fixture.tag] = data
+        return self._payloads[fixture.tag]
+
+    def body(self, fixture: Fixture) -> bytes:
+        """
+        :return: the body of a non paged endpoint.
+        """
+        if fixture.body is not None:
+            return fixture.body
+        if fixture.tag not in self._bodies:
+            self._bodies[fixture.tag] = json.dumps(self.payload(fixture), ensure_ascii=False).encode()
+        return self._bodies[fixture.tag]
+
+    def page(self, fixture: Fixture, params: Dict[str, Any]) -> bytes:
+        """
+        :param fixture: a paged endpoint.
+        :param params: the query / form / json parameters of the request.
+        :return: the body of the requested page, the items are numbered by their position.
+        """
+        paging = fixture.paging
+        size = int(params.get(paging.size_param) or self.items)
+        if paging.offset_param is not None:
+            start = int(params.get(paging.offset_param) or 0)
+        else:
+            start = (int(params.get(paging.page_param) or 1) - 1) * size
+        data = dict(self.payload(fixture))
+        template = _get(data, paging.list_path)[0]
+        items = list()
+        for index in range(start, min(start + size, self.total)):
+            item = dict(template)
+            if 'id' in item:
+                item['id'] = str(index)
+            items.append(item)
+        _set(data, paging.list_path, items)
+        if paging.total_path is not None:
+            _set(data, paging.total_path, self.total)
+        return json.dumps(data, ensure_ascii=False).encode()
@@ -0,0 +1,277 @@
+"""
+Local mock of the campus services, for offline benchmarks.
+
+Every campus host is served by a single https server on 127.0.0.1. The client sessions reach it
+through mock_connector(port), whose resolver maps all the hosts to the server: the urls, cookies and
+redirects are the real ones, so the request modules run unchanged.
+
+The CAS login and the service ticket exchanges are emulated, the api endpoints serve the
+fixtures of fixtures.py.
+
+Usage:
+    async with MockCampus(latency=0.02) as campus:
+        sess = create_session(connector=campus.connector())
+        ...
+"""
+import asyncio
+import base64
+import itertools
+import json
+import multiprocessing
+import random
+import socket
+import ssl
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from aiohttp import TCPConnector, web
+from aiohttp.abc import AbstractResolver, ResolveResult
+from Crypto.PublicKey import RSA
+from yarl import URL
+
+from fixtures import FIXTURES, FixtureSet
+from nwpu.utils.client import create_connector
+from nwpu.utils.metrics import endpoint_name
+
+CAS_HOST = 'uis.nwpu.edu.cn'
+MAIL_HOST = 'mail.nwpu.edu.cn'
+CAS_COOKIE = 'TGC'
+LOGIN_PAGE = '''<html><body><form method="post">
+<input type="hidden" name="execution" value="{execution}"/>
+</form></body></html>'''
+LANDING_PAGE = '<html><body>mock</body></html>'
+
+
+def _jwt(payload: Dict[str, Any]) -> str:
+    def encode(data: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    return f"{encode({'alg': 'none'})}.{encode(payload)}.signature"
+
+
+def self_signed_context(directory: Path) -> ssl.SSLContext:
+    """
+    A server ssl context with a throwaway self-signed certificate, made with the openssl command.
+    """
+    cert, key = directory / 'cert.pem', directory / 'key.pem'
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=nwpu.edu.cn', '-keyout', str(key), '-out', str(cert)],
+                   check=True, capture_output=True)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+class MockResolver(AbstractResolver):
+    """
+    Resolves every host to the mock server.
+    """
+    def __init__(self, port: int):
+        self.port = port
+
+    async def resolve(self, host: str, port: int = 0, family: int = 0) -> List[ResolveResult]:
+        return [ResolveResult(hostname=host, host='127.0.0.1', port=self.port,
+                              family=socket.AF_INET, proto=0, flags=0)]
+
+    async def close(self):
+        pass
+
+
+def mock_connector(port: int, **kwargs) -> TCPConnector:
+    """
+    A connector sending every request to the mock server listening on port, the certificate is not verified.
+    :param port:
+    :param kwargs: passed to create_connector.
+    """
+    return create_connector(resolver=MockResolver(port), ssl=False, **kwargs)
+
+
+class MockCampus:
+    """
+    The mock server.
+    :param latency: seconds added to every response.
+    :param jitter: random extra seconds, up to jitter.
+    :param items: the length of the lists of the payloads.
+    :param string_size: scales the strings of the payloads.
+    :param total: the number of items of the paged endpoints.
+    :param fixtures_dir: recorded fixtures, served instead of the generated ones.
+    """
+    latency: float
+    jitter: float
+    fixtures: FixtureSet
+    port: int
+    requests: Dict[str, int]
+
+    def __init__(self,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 items: int = 30,
+                 string_size: int = 1,
+                 total: int = 300,
+                 fixtures_dir: Optional[Path] = None,
+                 port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fixtures = FixtureSet(items, string_size, total, fixtures_dir)
+        self.port = port
+        self.requests = dict()
+        self.public_key = RSA.generate(1024).public_key().export_key().decode()
+        self._tickets = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._tmp: Optional[tempfile.TemporaryDirectory] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/{path:.*}', self.dispatch)
+        return app
+
+    async def start(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', self.port,
+                           ssl_context=self_signed_context(Path(self._tmp.name)))
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._tmp is not None:
+            self._tmp.cleanup()
+
+    async def __aenter__(self) -> 'MockCampus':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def connector(self, **kwargs) -> TCPConnector:
+        return mock_connector(self.port, **kwargs)
+
+    def _ticket(self) -> str:
+        return f"ST-{next(self._tickets)}-mock"
+
+    @staticmethod
+    def _redirect(location: str | URL, cookies: Optional[Dict[str, str]] = None) -> web.Response:
+        resp = web.Response(status=302, headers={'Location': str(location)})
+        for name, value in (cookies or dict()).items():
+            resp.set_cookie(name, value, path='/', secure=True, httponly=True)
+        return resp
+
+    def _service_redirect(self, service: str) -> web.Response:
+        # the ecampus front end reads the ticket, a jwt with the id token, from the url
+        if 'ecampus.nwpu.edu.cn' in service:
+            ticket = _jwt({'idToken': _jwt({'sub': 'mock', 'exp': 4102444800})})
+        else:
+            ticket = self._ticket()
+        return self._redirect(f"{service}{'&' if '?' in service else '?'}ticket={ticket}")
+
+    async def cas_login(self, request: web.Request) -> web.Response:
+        service = request.query.get('service', '')
+        if request.method == 'POST':
+            await request.post()
+            if not service:
+                resp = web.Response(text=LANDING_PAGE, content_type='text/html')
+                resp.set_cookie(CAS_COOKIE, f"TGT-{self._ticket()}", path='/cas', secure=True)
+                return resp
+            resp = self._service_redirect(service)
+            resp.set_cookie(CAS_COOKIE, f"TGT-{self._ticket()}", path='/cas', secure=True)
+            return resp
+        if CAS_COOKIE in request.cookies:
+            if service:
+                return self._service_redirect(service)
+            return self._redirect('https://uis.nwpu.edu.cn/cas/home')
+        return web.Response(text=LOGIN_PAGE.format(execution=self._ticket()), content_type='text/html')
+
+    async def cas_authorize(self, request: web.Request) -> web.Response:
+        redirect_uri = request.query.get('redirect_uri', f'https://{MAIL_HOST}/cmcuapi/sso/callback')
+        if CAS_COOKIE not in request.cookies:
+            return self._redirect(f'https://{CAS_HOST}/cas/login?service={quote(str(request.url), safe="")}')
+        return self._redirect(f"{redirect_uri}?code={self._ticket()}")
+
+    async def service(self, request: web.Request) -> web.Response:
+        """
+        The pages of the services: the ticket exchanges and the landing pages.
+        """
+        host = request.host.split(':', 1)[0]
+        if host == MAIL_HOST and request.path == '/cmcuapi/sso/oauth2':
+            callback = quote(f'https://{MAIL_HOST}/cmcuapi/sso/callback', safe='')
+            return self._redirect(f'https://{CAS_HOST}/cas/oauth2.0/authorize?response_type=code'
+                                  f'&client_id=mail&redirect_uri={callback}')
+        if host == MAIL_HOST and 'code' in request.query:
+            return self._redirect(f'https://{MAIL_HOST}/coremail/XT5/index.jsp',
+                                  {'Coremail.sid': f'sid{next(self._tickets)}', 'Coremail': 'mock'})
+        if 'ticket' in request.query:
+            cookies = {'SESSION': self._ticket()}
+            # idle classroom and market pass their token to the ui in the url
+            if 'redirect_uri' in request.query:
+                token = _jwt({'sub': 'mock', 'exp': 4102444800})
+                return self._redirect(URL(request.query['redirect_uri']).update_query(token=token), cookies)
+            return self._redirect(f'https://{host}/', cookies)
+        return web.Response(text=LANDING_PAGE, content_type='text/html')
+
+    async def params(self, request: web.Request) -> Dict[str, Any]:
+        params = dict(request.query)
+        if request.can_read_body:
+            if request.content_type == 'application/json':
+                body = await request.json()
+                if isinstance(body, dict):
+                    params.update(body)
+            else:
+                params.update(await request.post())
+        return params
+
+    async def dispatch(self, request: web.Request) -> web.Response:
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        url = URL.build(scheme='https', host=request.host.split(':', 1)[0],
+                        path=request.path, query=request.query)
+        tag = endpoint_name(url)
+        self.requests[tag] = self.requests.get(tag, 0) + 1
+
+        if url.host == CAS_HOST:
+            if request.path == '/cas/login':
+                return await self.cas_login(request)
+            if request.path == '/cas/oauth2.0/authorize':
+                return await self.cas_authorize(request)
+            if request.path == '/cas/jwt/publicKey':
+                return web.Response(text=self.public_key)
+
+        fixture = FIXTURES.get(tag)
+        if fixture is None:
+            return await self.service(request)
+        if fixture.paging is not None:
+            body = self.fixtures.page(fixture, await self.params(request))
+        else:
+            if request.can_read_body:
+                await request.read()
+            body = self.fixtures.body(fixture)
+        return web.Response(body=body, content_type=fixture.content_type)
+
+
+def _serve(queue: multiprocessing.Queue, kwargs: Dict[str, Any]):
+    async def serve():
+        async with MockCampus(**kwargs) as campus:
+            queue.put(campus.port)
+            await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_in_process(**kwargs) -> Tuple[multiprocessing.Process, int]:
+    """
+    Run the mock server in a child process, so that it does not share the cpu and the memory
+    measures of the benchmarked client.
+    :param kwargs: passed to MockCampus.
+    :return: the process, to be terminated, and the port of the server.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(queue, kwargs), daemon=True)
+    process.start()
+    return process, queue.get(timeout=30)
@@ -0,0 +1,85 @@
+"""
+NWPU campus services client.
+
+The names below are loaded on first access (PEP 562): `import nwpu` does not import aiohttp,
+pydantic or the models of the services, a service is only loaded when it is used.
+
+    import nwpu
+    sess = nwpu.create_session()
+    oa = nwpu.OaRequest(sess)
+"""
+import importlib
+
+# typing is not imported either
+TYPE_CHECKING = False
+
+# public name -> module defining it
+_LAZY: dict[str, str] = {
+    # login and session sharing
+    'OaRequest': 'nwpu.oa.oa_request',
+    'SessionBroker': 'nwpu.oa.broker',
+    'AccountPool': 'nwpu.oa.pool',
+    'PoolAccount': 'nwpu.oa.pool',
+    'password_login': 'nwpu.oa.pool',
+    'QrLoginDriver': 'nwpu.oa.qr_login',
+    'MfaOrchestrator': 'nwpu.oa.mfa_login',
+    'PublicKeyManager': 'nwpu.oa.pubkey',
+    # service clients
+    'BusRequest': 'nwpu.bus.bus_request',
+    'EduRequest': 'nwpu.edu.edu_request',
+    'ECampusRequest': 'nwpu.ecampus.ec_request',
+    'IdleClassroomRequest': 'nwpu.classroom.classroom_request',
+    'MailRequest': 'nwpu.mail.mail_request',
+    'MarketRequest': 'nwpu.market.market_request',
+    # utilities
+    'create_connector': 'nwpu.utils.client',
+    'create_session': 'nwpu.utils.client',
+    'CredentialStore': 'nwpu.utils.store',
+    'TokenRefresher': 'nwpu.utils.refresh',
+    'Resilience': 'nwpu.utils.resilience',
+    'ResponseCache': 'nwpu.utils.cache',
+    'SQLiteBackend': 'nwpu.utils.cache',
+    'Paginator': 'nwpu.utils.paginate',
+    'MetricsRecorder': 'nwpu.utils.metrics',
+    'set_instrumentation': 'nwpu.utils.metrics',
+}
+
+_SUBPACKAGES = ('bus', 'classroom', 'ecampus', 'edu', 'mail', 'market', 'oa', 'utils')
+
+__all__ = list(_LAZY.keys())
+
+if TYPE_CHECKING:
+    from nwpu.bus.bus_request import BusRequest
+    from nwpu.classroom.classroom_request import IdleClassroomRequest
+    from nwpu.ecampus.ec_request import ECampusRequest
+    from nwpu.edu.edu_request import EduRequest
+    from nwpu.mail.mail_request import MailRequest
+    from nwpu.market.market_request import MarketRequest
+    from nwpu.oa.broker import SessionBroker
+    from nwpu.oa.mfa_login import MfaOrchestrator
+    from nwpu.oa.oa_request import OaRequest
+    from nwpu.oa.pool import AccountPool, PoolAccount, password_login
+    from nwpu.oa.pubkey import PublicKeyManager
+    from nwpu.oa.qr_login import QrLoginDriver
+    from nwpu.utils.cache import ResponseCache, SQLiteBackend
+    from nwpu.utils.client import create_connector, create_session
+    from nwpu.utils.metrics import MetricsRecorder, set_instrumentation
+    from nwpu.utils.paginate import Paginator
+    from nwpu.utils.refresh import TokenRefresher
+    from nwpu.utils.resilience import Resilience
+    from nwpu.utils.store import CredentialStore
+
+
+def __getattr__(name: str) -> object:
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        # cached, the next accesses do not go through __getattr__
+        globals()[name] = value
+        return value
+    if name in _SUBPACKAGES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals().keys()) | set(__all__) | set(_SUBPACKAGES))
@@ -1,7 +1,5 @@
 from aiohttp import ClientSession
 
-from utils.common import DEFAULT_HEADER
-
 
 class IdleClassroomOaUrl:
     OA_URL = "https://uis.nwpu.edu.cn/cas/login?service=https%3A%2F%2Fidle-classroom.nwpu.edu.cn%2Flogin%2Fcas%3Fredirect_uri%3Dhttps%3A%2F%2Fidle-classroom.nwpu.edu.cn%2Fui%2FleisureClassroom"
@@ -13,7 +11,7 @@ class IdleClassroomOaRequest:
 
     @staticmethod
     async def authorize(sess: ClientSession) -> str:
-        resp = await sess.get(IdleClassroomOaUrl.OA_URL, allow_redirects=True, headers=DEFAULT_HEADER)
+        resp = await sess.get(IdleClassroomOaUrl.OA_URL, allow_redirects=True)
         redirects = [x.url for x in resp.history]
         redirects.append(resp.url)
         print(redirects)
@@ -1,9 +1,13 @@
 from aiohttp import ClientSession
 
-from classroom.classroom_oa import IdleClassroomOaRequest
-from classroom.classroom_struct import *
-from utils.common import DEFAULT_HEADER
-from utils.parse import concat_url
+from nwpu.classroom.classroom_oa import IdleClassroomOaRequest
+from nwpu.classroom.classroom_struct import *
+from nwpu.utils.parse import concat_url
+from nwpu.utils.cache import ResponseCache, cached_get, token_identity
+from nwpu.utils.decode import parse_response
+from nwpu.utils.metrics import register_endpoints
+from nwpu.utils.paginate import DEFAULT_PREFETCH, Paginator
+from nwpu.utils.singleflight import single_flight
 
 
 class IdleClassroomUrl:
@@ -18,12 +22,27 @@ class IdleClassroomUrl:
     CLASSROOM_SEAT_CODES = "https://idle-classroom.nwpu.edu.cn/api/base/dict/children/room_type"
     CLASSROOM_IDLE_DETAILS = "https://idle-classroom.nwpu.edu.cn/api/idleclassroom/detail"
 
+
+register_endpoints(IdleClassroomUrl)
+
+
 class IdleClassroomRequest:
     sess: ClientSession
-    headers: dict = DEFAULT_HEADER.copy()
+    # the X-Id-Token, the other headers are the ones of the session
+    headers: dict
+    cache: Optional[ResponseCache] = None
+    identity: Optional[str] = None
 
-    def __init__(self, sess: ClientSession, x_token: str):
+    def __init__(self, sess: ClientSession, x_token: str, cache: Optional[ResponseCache] = None):
+        """
+        :param sess:
+        :param x_token:
+        :param cache: caches the campus, building, week, room type and seat code lists.
+        """
         self.sess: ClientSession = sess
+        self.headers = dict()
+        self.cache = cache
+        self.identity = token_identity(x_token)
 
         if x_token:
             self.headers['X-Id-Token'] = x_token
@@ -35,23 +54,26 @@ class IdleClassroomRequest:
         self.headers['X-Id-Token'] = token
         return token
 
+    @single_flight
     async def get_all_campus(self) -> IdleClassroomAllCampusResponse:
-        resp = await self.sess.get(IdleClassroomUrl.CLASSROOM_ALL_CAMPUS,
-                                    headers=self.headers)
-        return IdleClassroomAllCampusResponse(**await resp.json())
+        return await cached_get(self.sess, IdleClassroomUrl.CLASSROOM_ALL_CAMPUS, IdleClassroomAllCampusResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_teaching_buildings(self, campus_name: str) -> IdleClassroomTeachingBuildingResponse:
-        resp = await self.sess.get(
-            concat_url(IdleClassroomUrl.CLASSROOM_TEACHING_BUILDINGS, campus_name),
-            headers=self.headers)
-        return IdleClassroomTeachingBuildingResponse(**await resp.json())
+        return await cached_get(self.sess,
+                                concat_url(IdleClassroomUrl.CLASSROOM_TEACHING_BUILDINGS, campus_name),
+                                IdleClassroomTeachingBuildingResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_teaching_weeks(self, campus_name) -> IdleClassroomTeachingWeeksResponse:
-        resp = await self.sess.get(
-            concat_url(IdleClassroomUrl.CLASSROOM_TEACHING_WEEKS, campus_name),
-            headers=self.headers)
-        return IdleClassroomTeachingWeeksResponse(**await resp.json())
+        return await cached_get(self.sess,
+                                concat_url(IdleClassroomUrl.CLASSROOM_TEACHING_WEEKS, campus_name),
+                                IdleClassroomTeachingWeeksResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_idle_classroom_list(self, req: IdleClassroomListRequest) -> IdleClassroomListResponse:
         """
         list all the classrooms, with idle time attached.
@@ -62,8 +84,9 @@ class IdleClassroomRequest:
             IdleClassroomUrl.CLASSROOM_IDLE_LIST,
             params=req.model_dump(),
             headers=self.headers)
-        return IdleClassroomListResponse(**await resp.json())
+        return await parse_response(resp, IdleClassroomListResponse)
 
+    @single_flight
     async def get_idle_classroom_count_by_time(self, req: IdleClassroomByTimeRequest) -> IdleClassroomByTimeResponse:
         """
         list the count of the classrooms that satisfy the requirements.
@@ -75,23 +98,35 @@ class IdleClassroomRequest:
             IdleClassroomUrl.CLASSROOM_SELECT_BY_TIME,
             params=req.model_dump(by_alias=True, exclude_none=True),
             headers=self.headers)
-        return IdleClassroomByTimeResponse(**await resp.json())
+        return await parse_response(resp, IdleClassroomByTimeResponse)
 
+    @single_flight
     async def get_room_type(self, campus_name: str) -> IdleClassroomRoomTypeResponse:
-        resp = await self.sess.get(
-            concat_url(IdleClassroomUrl.CLASSROOM_ROOM_TYPES, campus_name),
-            headers=self.headers)
-        return IdleClassroomRoomTypeResponse(**await resp.json())
+        return await cached_get(self.sess,
+                                concat_url(IdleClassroomUrl.CLASSROOM_ROOM_TYPES, campus_name),
+                                IdleClassroomRoomTypeResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_seat_code(self) -> IdleClassroomSeatCodeResponse:
-        resp = await self.sess.get(
-            IdleClassroomUrl.CLASSROOM_SEAT_CODES,
-            headers=self.headers)
-        return IdleClassroomSeatCodeResponse(**await resp.json())
+        return await cached_get(self.sess, IdleClassroomUrl.CLASSROOM_SEAT_CODES, IdleClassroomSeatCodeResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_idle_classroom_detail(self, req: IdleClassroomDetailRequest) -> IdleClassroomDetailResponse:
         resp = await self.sess.get(
             IdleClassroomUrl.CLASSROOM_IDLE_DETAILS,
             params=req.model_dump(by_alias=True, exclude_none=True),
             headers=self.headers)
-        return IdleClassroomDetailResponse(**await resp.json())
+        return await parse_response(resp, IdleClassroomDetailResponse)
+
+    def iter_idle_classroom_detail(self, req: IdleClassroomDetailRequest,
+                                   prefetch: int = DEFAULT_PREFETCH) -> Paginator:
+        """
+        All the idle classrooms, from the page of the request on.
+        :param req:
+        :param prefetch: pages requested concurrently.
+        :return: async iterator of the classroom records, .pages() for the responses.
+        """
+        return Paginator(self.get_idle_classroom_detail, req, records='data.records', total='data.total',
+                         page_field='current_page', size_field='page_size', prefetch=prefetch)
@@ -1,10 +1,8 @@
-import base64
-import json
 import urllib.parse
 
 from aiohttp import ClientSession
 
-from utils.common import DEFAULT_HEADER
+from nwpu.utils.parse import decode_jwt_payload
 
 
 class ECampusOaUrl:
@@ -48,14 +46,11 @@ class ECampusOaRequest:
         :param ticket:
         :return:
         """
-        b64 = ticket.split('.')[1]
-        b64_decoded = base64.b64decode(b64).decode(encoding='utf-8')
-        json_data = json.loads(b64_decoded)
-        return json_data['idToken']
+        return decode_jwt_payload(ticket)['idToken']
 
     @staticmethod
     async def authorize(sess: ClientSession) -> str:
-        resp = await sess.get(ECampusOaUrl.REDIRECT, headers=DEFAULT_HEADER, allow_redirects=False)
+        resp = await sess.get(ECampusOaUrl.REDIRECT, allow_redirects=False)
         redirected: str = resp.headers['Location']
         if 'https://ecampus.nwpu.edu.cn' in redirected:
             parsed = urllib.parse.parse_qs(redirected)
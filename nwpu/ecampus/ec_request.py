@@ -1,10 +1,16 @@
 import random
+from typing import Iterable, Optional
 
 from aiohttp import ClientSession
 
-from ecampus.ec_oa import ECampusOaRequest
-from ecampus.ec_struct import *
-from utils.common import DEFAULT_HEADER
+from nwpu.ecampus.ec_oa import ECampusOaRequest
+from nwpu.ecampus.ec_struct import *
+from nwpu.utils.cache import ResponseCache, cached_get, token_identity
+from nwpu.utils.decode import parse_response
+from nwpu.utils.lazy import response_model
+from nwpu.utils.metrics import register_endpoints
+from nwpu.utils.paginate import DEFAULT_PREFETCH, Paginator
+from nwpu.utils.singleflight import single_flight
 
 
 class ECampusUrl:
@@ -25,12 +31,24 @@ class ECampusUrl:
     USER_EVENT_CREATE = "https://ecampus.nwpu.edu.cn/portal-api/v1/calendar/share/schedule/save"
     USER_EVENT_DELETE = "https://ecampus.nwpu.edu.cn/portal-api/v1/calendar/share/schedule/deleteSchedule"
 
+
+register_endpoints(ECampusUrl)
+
+
 class ECampusRequest:
     sess: ClientSession
-    headers: dict = DEFAULT_HEADER.copy()
+    cache: Optional[ResponseCache] = None
+    identity: Optional[str] = None
 
-    def __init__(self, sess: ClientSession, x_token: str):
+    def __init__(self, sess: ClientSession, x_token: str, cache: Optional[ResponseCache] = None):
+        """
+        :param sess:
+        :param x_token:
+        :param cache: caches the news feed columns and the event calendars, per user.
+        """
         self.sess: ClientSession = sess
+        self.cache = cache
+        self.identity = token_identity(x_token)
 
         if x_token:
             self.sess.headers['X-Id-Token'] = x_token
@@ -48,30 +66,34 @@ class ECampusRequest:
         self.sess.headers['X-Id-Token'] = token
         return token
     
+    @single_flight
     async def get_new_email(self) -> ECampusHasNewEmailResponse:
         """
         Get new email status.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.HAS_NEW_EMAIL, headers=self.headers)
-        return ECampusHasNewEmailResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.HAS_NEW_EMAIL)
+        return await parse_response(resp, ECampusHasNewEmailResponse)
     
+    @single_flight
     async def get_user_info(self) -> ECampusUserInfoResponse:
         """
         Get user info.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_INFO, headers=self.headers)
-        return ECampusUserInfoResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_INFO)
+        return await parse_response(resp, ECampusUserInfoResponse)
 
+    @single_flight
     async def get_user_info_accurate(self) -> ECampusUserInfoAccurateResponse:
         """
         Get user info accurate.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_INFO_ACCURATE, headers=self.headers)
-        return ECampusUserInfoAccurateResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_INFO_ACCURATE)
+        return await parse_response(resp, ECampusUserInfoAccurateResponse)
     
+    @single_flight
     async def get_user_portrait(self) -> bytes:
         """
         Get user portrait.
@@ -80,80 +102,102 @@ class ECampusRequest:
         req = ECampusUserPortraitRequest(x_token=self.sess.headers['X-Id-Token'],
             random_number=random.randint(100, 999))
         resp = await self.sess.get(ECampusUrl.USER_PORTRAIT, 
-                                   headers=self.headers, 
                                    params=req.model_dump(by_alias=True))
         
         return await resp.read()
     
+    @single_flight
     async def get_user_papers(self) -> ECampusUserPapersResponse:
         """
         Get user papers.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_PAPER, headers=self.headers)
-        return ECampusUserPapersResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_PAPER)
+        return await parse_response(resp, ECampusUserPapersResponse)
     
+    @single_flight
     async def get_user_card(self) -> ECampusUserCardResponse:
         """
         Get user card.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_CARD, headers=self.headers)
-        return ECampusUserCardResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_CARD)
+        return await parse_response(resp, ECampusUserCardResponse)
 
+    @single_flight
     async def get_user_consumption_history(self, req: ECampusUserConsumptionHistoryRequest) -> ECampusUserConsumptionHistoryResponse:
         """
         Get user consumption history.
         :return:
         """
         resp = await self.sess.get(ECampusUrl.USER_CONSUMPTION_HISTORY,
-                                   headers=self.headers,
                                    params=req.model_dump(by_alias=True))
-        return ECampusUserConsumptionHistoryResponse(**await resp.json())
+        return await parse_response(resp, ECampusUserConsumptionHistoryResponse)
+
+    def iter_user_consumption_history(self, req: ECampusUserConsumptionHistoryRequest,
+                                      prefetch: int = DEFAULT_PREFETCH) -> Paginator:
+        """
+        All the consumption records, from the page of the request on. The pages are numbered from 0.
+        :param req:
+        :param prefetch: pages requested concurrently.
+        :return: async iterator of the consumption items, .pages() for the responses.
+        """
+        return Paginator(self.get_user_consumption_history, req,
+                         records='data.data.cost_list', total='data.data.total_items',
+                         page_field='page_index', size_field='page_size', base=0, prefetch=prefetch)
     
+    @single_flight
     async def get_user_network_fee(self) -> ECampusUserNetworkFeeResponse:
         """
         Get user network fee.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_NETWORK_FEE, headers=self.headers)
-        return ECampusUserNetworkFeeResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_NETWORK_FEE)
+        return await parse_response(resp, ECampusUserNetworkFeeResponse)
     
+    @single_flight
     async def get_user_borrow_books(self) -> ECampusUserBorrowBooksResponse:
         """
         Get user borrow books.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_BORROW_BOOKS, headers=self.headers)
-        return ECampusUserBorrowBooksResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_BORROW_BOOKS)
+        return await parse_response(resp, ECampusUserBorrowBooksResponse)
     
+    @single_flight
     async def get_user_property(self) -> ECampusUserPropertyResponse:
         """
         Get user property.
         needs further testing
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_PROPERTY, headers=self.headers)
-        return ECampusUserPropertyResponse(**await resp.json())
+        resp = await self.sess.get(ECampusUrl.USER_PROPERTY)
+        return await parse_response(resp, ECampusUserPropertyResponse)
     
-    async def get_user_events(self, request: ECampusUserEventsRequest) -> ECampusUserEventsResponse:
+    @single_flight
+    async def get_user_events(self, request: ECampusUserEventsRequest,
+                              lazy: bool = False,
+                              fields: Optional[Iterable[str]] = None) -> ECampusUserEventsResponse:
         """
         Get user events.
+        :param request:
+        :param lazy: the calendar entries are LazyModel, validated field by field on access.
+        :param fields: only validate and keep these fields of the calendar entries.
         :return:
         """
         resp = await self.sess.get(ECampusUrl.USER_EVENTS,
-                                   headers=self.headers,
                                    params=request.model_dump(by_alias=True)) # temporary hack
-        return ECampusUserEventsResponse(**await resp.json())
+        return await parse_response(
+            resp, response_model(ECampusUserEventsResponse, ECampusUserEventsCalendarEntry, lazy, fields))
 
+    @single_flight
     async def get_user_event_calendars(self) -> ECampusUserEventCalendarResponse:
         """
         Get user events.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.USER_EVENT_CALENDAR,
-                                   headers=self.headers,)
-        return ECampusUserEventCalendarResponse(**await resp.json())
+        return await cached_get(self.sess, ECampusUrl.USER_EVENT_CALENDAR, ECampusUserEventCalendarResponse,
+                                self.cache, self.identity)
 
     async def add_user_event(self, request: ECampusAddUserEventRequest) -> ECampusAddUserEventResponse:
         """
@@ -161,9 +205,8 @@ class ECampusRequest:
         :return:
         """
         resp = await self.sess.post(ECampusUrl.USER_EVENT_CREATE,
-                                   headers=self.headers,
                                    json=request.model_dump(by_alias=True))
-        return ECampusAddUserEventResponse(**await resp.json())
+        return await parse_response(resp, ECampusAddUserEventResponse)
 
     async def delete_user_event(self, request: ECampusDeleteUserEventRequest) -> ECampusDeleteUserEventResponse:
         """
@@ -171,25 +214,48 @@ class ECampusRequest:
         :return:
         """
         resp = await self.sess.post(ECampusUrl.USER_EVENT_DELETE,
-                                   headers=self.headers,
                                    data=request.model_dump(by_alias=True))
-        return ECampusDeleteUserEventResponse(**await resp.json())
+        return await parse_response(resp, ECampusDeleteUserEventResponse)
 
+    @single_flight
     async def get_news_feed_columns(self) -> ECampusNewsFeedColumnListResponse:
         """
         Get user news feed columns.
         :return:
         """
-        resp = await self.sess.get(ECampusUrl.NEWS_FEED_COLUMN_LIST,
-                                   headers=self.headers,)
-        return ECampusNewsFeedColumnListResponse(**await resp.json())
+        return await cached_get(self.sess, ECampusUrl.NEWS_FEED_COLUMN_LIST, ECampusNewsFeedColumnListResponse,
+                                self.cache, self.identity)
 
-    async def get_news_feed_content(self, request: ECampusNewsFeedContentRequest) -> ECampusNewsFeedContentResponse:
+    @single_flight
+    async def get_news_feed_content(self, request: ECampusNewsFeedContentRequest,
+                                    lazy: bool = False,
+                                    fields: Optional[Iterable[str]] = None) -> ECampusNewsFeedContentResponse:
         """
         Get user news feed content.
+        :param request:
+        :param lazy: the news items are LazyModel, validated field by field on access.
+        :param fields: only validate and keep these fields of the news items, e.g. {'id', 'title', 'create_time'}
         :return:
         """
         resp = await self.sess.get(ECampusUrl.NEWS_FEED_CONTENT,
-                                   headers=self.headers,
                                    params=request.model_dump(by_alias=True))
-        return ECampusNewsFeedContentResponse(**await resp.json())
+        return await parse_response(
+            resp, response_model(ECampusNewsFeedContentResponse, ECampusNewsFeedContentItem, lazy, fields))
+
+    def iter_news_feed_content(self, request: ECampusNewsFeedContentRequest,
+                               prefetch: int = DEFAULT_PREFETCH,
+                               lazy: bool = False,
+                               fields: Optional[Iterable[str]] = None) -> Paginator:
+        """
+        All the news of a column, from the page of the request on.
+        :param request:
+        :param prefetch: pages requested concurrently.
+        :param lazy: see get_news_feed_content.
+        :param fields: see get_news_feed_content.
+        :return: async iterator of the news items, .pages() for the responses.
+        """
+        async def fetch(page: ECampusNewsFeedContentRequest) -> ECampusNewsFeedContentResponse:
+            return await self.get_news_feed_content(page, lazy, fields)
+
+        return Paginator(fetch, request, records='data.all_contents', total='data.count',
+                         page_field='page_number', size_field='page_size', prefetch=prefetch)
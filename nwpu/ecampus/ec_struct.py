@@ -4,7 +4,7 @@ from typing import Optional, List, Dict, Any
 
 from pydantic import BaseModel, Field
 
-from utils.common import BoolString
+from nwpu.utils.common import BoolString
 
 USER_EVENT_TZ_NAME = "GMT+8:00 - 中国标准时间"
 
@@ -3,8 +3,6 @@ from typing import List
 from aiohttp import ClientSession
 from yarl import URL
 
-from utils.common import DEFAULT_HEADER
-
 
 class EduOaUrl:
     REDIRECT = 'https://uis.nwpu.edu.cn/cas/login?service=https%3A%2F%2Fjwxt.nwpu.edu.cn%2Fstudent%2Fsso-login'
@@ -16,5 +14,5 @@ class EduOaRequest:
 
     @staticmethod
     async def authorize(sess: ClientSession) -> List[URL]:
-        resp = await sess.get(EduOaUrl.REDIRECT, headers=DEFAULT_HEADER, allow_redirects=True)
+        resp = await sess.get(EduOaUrl.REDIRECT, allow_redirects=True)
         return [x.url for x in resp.history]
\ No newline at end of file
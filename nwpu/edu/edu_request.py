@@ -1,21 +1,27 @@
 from aiohttp import ClientSession
 
-from edu.edu_oa import EduOaRequest
-from edu.edu_struct import EduNotificationResponse
-from utils.common import DEFAULT_HEADER
+from nwpu.edu.edu_oa import EduOaRequest
+from nwpu.edu.edu_struct import EduNotificationResponse
+from nwpu.utils.decode import parse_response
+from nwpu.utils.metrics import register_endpoints
+from nwpu.utils.singleflight import single_flight
+
 
 class EduUrls:
     NOTIFICATION = "https://jwxt.nwpu.edu.cn/student/my-notification/get-notifications"
 
 
+register_endpoints(EduUrls)
+
+
 class EduRequest:
-    headers: dict = DEFAULT_HEADER.copy()
     def __init__(self, sess: ClientSession, force_auth: bool = False):
         self.sess = sess
 
         if force_auth:
             EduOaRequest.authorize(sess)
 
+    @single_flight
     async def get_notification(self) -> EduNotificationResponse:
-        resp = await self.sess.get(EduUrls.NOTIFICATION, headers=self.headers)
-        return EduNotificationResponse(**await resp.json())
+        resp = await self.sess.get(EduUrls.NOTIFICATION)
+        return await parse_response(resp, EduNotificationResponse)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import zlib
+from typing import Optional
+
+from nwpu.mail.mail_struct import ReadMailResponse
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bodies (
+    -- sha256 of the Mail json
+    digest TEXT PRIMARY KEY,
+    -- the json, zlib compressed
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mails (
+    account TEXT NOT NULL,
+    mid TEXT NOT NULL,
+    digest TEXT NOT NULL REFERENCES bodies (digest),
+    -- the ReadMailResponse json without the mail: mailInfo...
+    meta TEXT NOT NULL,
+    PRIMARY KEY (account, mid)
+);
+'''
+
+
+class MailBodyCache:
+    """
+    Content addressed cache of the read mails (ReadMailResponse): the bodies (Mail) are stored once
+    by the sha256 of their json, the (account, mid) of every copy point to them with their own
+    mailInfo. A mail sent to many of the cached mailboxes is stored once.
+
+    A read mail does not change, the entries do not expire. The mailInfo is the one of the
+    first read, see MailIndex for the current flags and folder.
+    """
+    path: str
+    hits: int
+    misses: int
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        :param path: the SQLite database, in memory by default.
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self.db.close()
+
+    def get(self, account: str, mid: str) -> Optional[ReadMailResponse]:
+        row = self.db.execute('SELECT meta, data FROM mails JOIN bodies USING (digest) '
+                              'WHERE account = ? AND mid = ?', (account, mid)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        meta = json.loads(row[0])
+        meta['var']['mail'] = json.loads(zlib.decompress(row[1]))
+        return ReadMailResponse.model_validate(meta)
+
+    def put(self, account: str, mid: str, mail: ReadMailResponse) -> str:
+        """
+        :return: the digest of the body.
+        """
+        data = mail.body.mail.model_dump_json(by_alias=True).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        meta = mail.model_dump_json(by_alias=True, exclude={'body': {'mail'}})
+        self.db.execute('INSERT OR IGNORE INTO bodies VALUES (?, ?)', (digest, zlib.compress(data)))
+        self.db.execute('INSERT OR REPLACE INTO mails VALUES (?, ?, ?, ?)', (account, mid, digest, meta))
+        self.db.commit()
+        return digest
+
+    def delete(self, account: str, mid: str):
+        """
+        Forget a mail, its body is dropped once no mail points to it.
+        """
+        self.db.execute('DELETE FROM mails WHERE account = ? AND mid = ?', (account, mid))
+        self.db.execute('DELETE FROM bodies WHERE digest NOT IN (SELECT digest FROM mails)')
+        self.db.commit()
+
+    def __len__(self) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM mails').fetchone()[0]
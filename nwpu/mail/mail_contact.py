@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from nwpu.mail.mail_request import MailRequest
+from nwpu.mail.mail_struct import (AllMailContactGroupItem, SearchContactFormRequest, SearchContactItem,
+                                   UserAvatarRequest)
+from nwpu.utils.singleflight import SingleFlight
+
+DEFAULT_PAGE_SIZE = 200
+DEFAULT_AVATAR_BYTES = 64 * 1024 * 1024
+
+
+class ContactDirectory:
+    """
+    The address book of a mailbox, downloaded once and indexed by e-mail, name and group.
+    search_contact has no offset: the contacts are loaded with one request, repeated with
+    `limit` raised to the total when the first one did not get them all.
+    Concurrent loads share one download; the directory is reloaded after max_age seconds.
+
+    Usage:
+        contacts = ContactDirectory(mail)
+        item = await contacts.lookup('someone@nwpu.edu.cn')
+    """
+    mail: MailRequest
+    page_size: int
+    max_age: Optional[float]
+    groups: Dict[str, AllMailContactGroupItem]
+    contacts: List[SearchContactItem]
+    loaded_at: Optional[float]
+    loads: int
+
+    def __init__(self, mail: MailRequest, page_size: int = DEFAULT_PAGE_SIZE, max_age: Optional[float] = 3600):
+        """
+        :param mail:
+        :param page_size: limit of the first search_contact request.
+        :param max_age: seconds before the directory is downloaded again, None to keep it.
+        """
+        self.mail = mail
+        self.page_size = page_size
+        self.max_age = max_age
+        self.groups = dict()
+        self.contacts = list()
+        self.loaded_at = None
+        self.loads = 0
+        self._by_email: Dict[str, SearchContactItem] = dict()
+        self._by_name: Dict[str, List[SearchContactItem]] = dict()
+        self._by_group: Dict[str, List[SearchContactItem]] = dict()
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self.loaded_at is not None and (self.max_age is None or time.time() - self.loaded_at < self.max_age)
+
+    async def _download(self) -> List[SearchContactItem]:
+        request = SearchContactFormRequest(limit=self.page_size)
+        while True:
+            resp = await self.mail.search_contact(request)
+            if len(resp.list) >= resp.total or request.limit >= resp.total:
+                return resp.list
+            request = request.model_copy(update={'limit': resp.total})
+
+    def _index(self, groups: List[AllMailContactGroupItem], contacts: List[SearchContactItem]):
+        self.groups = {x.id: x for x in groups}
+        self.contacts = contacts
+        self._by_email = dict()
+        self._by_name = dict()
+        self._by_group = dict()
+        for contact in contacts:
+            self._by_email.setdefault(contact.email_pref.lower(), contact)
+            self._by_name.setdefault(contact.contact_name.lower(), list()).append(contact)
+            for group in contact.groups:
+                self._by_group.setdefault(group, list()).append(contact)
+
+    async def load(self, force: bool = False):
+        """
+        Download the groups and the contacts, unless the directory is fresh.
+        :param force: download even if fresh.
+        """
+        if not force and self._fresh():
+            return
+        async with self._lock:
+            # loaded by another caller while waiting for the lock
+            if not force and self._fresh():
+                return
+            groups, contacts = await asyncio.gather(self.mail.get_all_contact_group(), self._download())
+            self._index(groups.contact_groups, contacts)
+            self.loaded_at = time.time()
+            self.loads += 1
+
+    async def lookup(self, email: str) -> Optional[SearchContactItem]:
+        """
+        :return: the contact of an e-mail address, case insensitive.
+        """
+        await self.load()
+        return self._by_email.get(email.strip().lower())
+
+    async def find(self, name: str) -> List[SearchContactItem]:
+        """
+        :return: the contacts whose name or e-mail contains the text, the exact names first.
+        """
+        await self.load()
+        text = name.strip().lower()
+        exact = self._by_name.get(text, list())
+        return exact + [x for x in self.contacts
+                        if x not in exact and (text in x.contact_name.lower() or text in x.email_pref.lower())]
+
+    async def members(self, group_id: str) -> List[SearchContactItem]:
+        """
+        :return: the contacts of a group, see groups for the ids.
+        """
+        await self.load()
+        return self._by_group.get(group_id, list())
+
+
+class AvatarCache:
+    """
+    Avatars kept on disk, one file per avatar, the least recently used ones are deleted past
+    max_bytes. Shared by the users, concurrent requests of the same avatar share one download.
+
+    Usage:
+        avatars = AvatarCache('avatars')
+        image = await avatars.get(mail, '2020000001')
+    """
+    directory: str
+    max_bytes: int
+    size: int
+    hits: int
+    misses: int
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_AVATAR_BYTES):
+        """
+        :param directory: created if missing, the avatars already in it are kept.
+        :param max_bytes: the total size of the avatars.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._flights = SingleFlight()
+        # file name -> size, least recently used first
+        self._files: OrderedDict[str, int] = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+        entries = [x for x in os.scandir(directory) if x.is_file() and x.name.endswith('.avatar')]
+        for entry in sorted(entries, key=lambda x: x.stat().st_atime):
+            self._files[entry.name] = entry.stat().st_size
+            self.size += entry.stat().st_size
+        self._evict()
+
+    @staticmethod
+    def _name(account: str, request: UserAvatarRequest) -> str:
+        key = f"{account}\n{request.model_dump_json(by_alias=True)}"
+        return hashlib.sha256(key.encode()).hexdigest() + '.avatar'
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._files:
+            name, size = self._files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def _read(self, name: str) -> Optional[bytes]:
+        if name not in self._files:
+            return None
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.size -= self._files.pop(name)
+            return None
+        self._files.move_to_end(name)
+        # the atime orders the files of the next run, it is not updated by every file system
+        os.utime(path)
+        return data
+
+    def _write(self, name: str, data: bytes):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.directory, name))
+        self.size += len(data) - self._files.pop(name, 0)
+        self._files[name] = len(data)
+        self._evict()
+
+    async def _fetch(self, mail: MailRequest, request: UserAvatarRequest, name: str) -> bytes:
+        async with await mail.open_user_avatar(request) as resp:
+            data = await resp.read()
+            if resp.status != 200 or not resp.content_type.startswith('image/'):
+                # e.g. the json error of an expired sid, not cached
+                raise ValueError(f"not an avatar: HTTP {resp.status} {resp.content_type} {data[:100]!r}")
+        self._write(name, data)
+        return data
+
+    async def get(self, mail: MailRequest, account: str,
+                  request: UserAvatarRequest = UserAvatarRequest()) -> bytes:
+        """
+        :param mail: MailRequest of the account, used if the avatar is not cached.
+        :param account: the key of the mailbox, e.g. the student id.
+        :param request: UserAvatarRequest
+        :return: the image. ValueError if the server did not answer an image, e.g. the sid expired.
+        """
+        name = self._name(account, request)
+        data = self._read(name)
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        return await self._flights.do(name, lambda: self._fetch(mail, request, name))
+
+    def invalidate(self, account: str, request: UserAvatarRequest = UserAvatarRequest()):
+        name = self._name(account, request)
+        if name in self._files:
+            self.size -= self._files.pop(name)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._files)
@@ -0,0 +1,223 @@
+import asyncio
+import hashlib
+import os
+import re
+from typing import BinaryIO, Dict, Iterable, Optional, Union
+
+import aiohttp
+
+from nwpu.mail.mail_request import MailRequest
+from nwpu.mail.mail_struct import MailAttachment, MailAttachmentRequest
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# suffix of the partial downloads, resumed with a Range request
+PART_SUFFIX = '.part'
+
+Destination = Union[str, os.PathLike, BinaryIO, bytearray, memoryview]
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+# the content types of the Coremail error answers, e.g. an expired sid
+ERROR_CONTENT_TYPES = ('json', 'html')
+
+
+def _hash_file(path: str, hasher, chunk_size: int):
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+
+
+def _write_chunk(file: BinaryIO, hasher, chunk: bytes):
+    file.write(chunk)
+    hasher.update(chunk)
+
+
+async def _in_executor(func, *args):
+    # the file io and the hashing of a large attachment would block the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+async def _check_response(resp: aiohttp.ClientResponse, content_type: Optional[str]):
+    """
+    ValueError unless the response is the attachment: a 200 / 206, not an error page.
+    :param content_type: the MailAttachment.content_type, a json or html attachment is accepted.
+    """
+    error_page = any(x in resp.content_type for x in ERROR_CONTENT_TYPES) and \
+        (content_type is None or resp.content_type != content_type.split(';')[0].strip().lower())
+    if resp.status not in (200, 206) or error_page:
+        data = await resp.content.read(100)
+        raise ValueError(f"not an attachment: HTTP {resp.status} {resp.content_type} {data!r}")
+
+
+def _check(hasher, sha256: Optional[str]):
+    if sha256 is not None and hasher.hexdigest() != sha256.lower():
+        raise ValueError(f"sha256 mismatch: expected {sha256}, got {hasher.hexdigest()}")
+
+
+async def _to_buffer(resp: aiohttp.ClientResponse, buffer: Union[bytearray, memoryview], hasher) -> int:
+    # copied in memory, the hashing of a chunk is short
+    view = memoryview(buffer).cast('B')
+    written = 0
+    async for chunk in resp.content.iter_any():
+        end = written + len(chunk)
+        if end > len(view):
+            raise ValueError(f"buffer too small: {len(view)} bytes")
+        view[written:end] = chunk
+        hasher.update(chunk)
+        written = end
+    return written
+
+
+async def _to_file(resp: aiohttp.ClientResponse, file: BinaryIO, hasher) -> int:
+    written = 0
+    # iter_any: the chunks as they are received, not copied into fixed size ones
+    async for chunk in resp.content.iter_any():
+        await _in_executor(_write_chunk, file, hasher, chunk)
+        written += len(chunk)
+    return written
+
+
+async def _to_path(mail: MailRequest, request: MailAttachmentRequest, path: str, sha256: Optional[str],
+                   resume: bool, chunk_size: int, content_type: Optional[str]) -> int:
+    part = path + PART_SUFFIX
+    offset = os.path.getsize(part) if resume and os.path.exists(part) else 0
+    hasher = hashlib.sha256()
+    if offset and sha256 is not None:
+        await _in_executor(_hash_file, part, hasher, chunk_size)
+    resp = await mail.open_attachment(request, offset)
+    async with resp:
+        if resp.status == 416:
+            total = resp.headers.get('Content-Range', '').rpartition('/')[2]
+            if offset == 0 or total != str(offset):
+                raise ValueError(f"range not satisfiable: {part} has {offset} bytes")
+            # the partial download was already complete
+            written = 0
+        elif resp.status == 206:
+            await _check_response(resp, content_type)
+            match = _CONTENT_RANGE.match(resp.headers.get('Content-Range', ''))
+            if match is None or int(match.group(1)) != offset:
+                raise ValueError(f"unexpected Content-Range: {resp.headers.get('Content-Range')}")
+            with open(part, 'ab') as f:
+                written = await _to_file(resp, f, hasher)
+        else:
+            await _check_response(resp, content_type)
+            # the Range was ignored, the whole attachment is sent again
+            offset = 0
+            hasher = hashlib.sha256()
+            with open(part, 'wb') as f:
+                written = await _to_file(resp, f, hasher)
+    try:
+        _check(hasher, sha256)
+    except ValueError:
+        os.remove(part)
+        raise
+    os.replace(part, path)
+    return offset + written
+
+
+async def download_attachment(mail: MailRequest, request: MailAttachmentRequest, destination: Destination,
+                              sha256: Optional[str] = None, resume: bool = True,
+                              chunk_size: int = DEFAULT_CHUNK_SIZE, content_type: Optional[str] = None) -> int:
+    """
+    Download an attachment, the body is streamed into the destination chunk by chunk, the file writes
+    and the hashing run in the default executor.
+    :param mail: MailRequest
+    :param request: MailAttachmentRequest
+    :param destination: a path, a binary file opened for writing, or a bytearray / memoryview filled from
+        its start. A path is written to `<path>.part` then renamed; an interrupted download is resumed
+        from the `.part` file with a Range request.
+    :param sha256: the expected hex digest, ValueError if the attachment does not match.
+    :param resume: resume from an existing `.part` file, for a path destination.
+    :param chunk_size: read size when hashing a resumed `.part` file.
+    :param content_type: the MailAttachment.content_type. A json or html answer is taken for a Coremail
+        error page (ValueError, nothing written) unless the attachment has that type.
+    :return: the size of the attachment.
+    """
+    if isinstance(destination, (str, os.PathLike)):
+        return await _to_path(mail, request, os.fspath(destination), sha256, resume, chunk_size, content_type)
+    hasher = hashlib.sha256()
+    async with await mail.open_attachment(request) as resp:
+        await _check_response(resp, content_type)
+        if isinstance(destination, (bytearray, memoryview)):
+            written = await _to_buffer(resp, destination, hasher)
+        else:
+            written = await _to_file(resp, destination, hasher)
+    _check(hasher, sha256)
+    return written
+
+
+def attachment_filename(attachment: MailAttachment) -> str:
+    """
+    A safe file name for the attachment: its name without directories, or its id.
+    """
+    name = os.path.basename(attachment.filename.replace('\\', '/')).strip()
+    if name in ('', '.', '..'):
+        return attachment.id
+    return name
+
+
+class AttachmentDownloader:
+    """
+    Downloads attachments concurrently, at most `concurrency` at a time.
+
+    Usage:
+        downloader = AttachmentDownloader(mail, concurrency=4)
+        resp = await mail.read_mail(ReadMailFormRequest(mid=mail_id))
+        paths = await downloader.download_all(mail_id, resp.body.mail.attachments, 'downloads')
+    """
+    mail: MailRequest
+    concurrency: int
+    resume: bool
+    chunk_size: int
+
+    def __init__(self, mail: MailRequest, concurrency: int = 4, resume: bool = True,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """
+        :param mail:
+        :param concurrency: downloads in flight at the same time.
+        :param resume: resume the interrupted downloads from their `.part` file.
+        :param chunk_size: read size when hashing a resumed `.part` file.
+        """
+        self.mail = mail
+        self.concurrency = concurrency
+        self.resume = resume
+        self.chunk_size = chunk_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def download(self, request: MailAttachmentRequest, destination: Destination,
+                       sha256: Optional[str] = None, content_type: Optional[str] = None) -> int:
+        """
+        download_attachment, waiting for a free slot.
+        :return: the size of the attachment.
+        """
+        async with self._semaphore:
+            return await download_attachment(self.mail, request, destination, sha256=sha256,
+                                             resume=self.resume, chunk_size=self.chunk_size,
+                                             content_type=content_type)
+
+    async def download_all(self, mail_id: str, attachments: Iterable[MailAttachment], directory: str,
+                           checksums: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """
+        Download the attachments of a mail into a directory.
+        :param mail_id: Mail.id
+        :param attachments: Mail.attachments
+        :param directory: created if missing.
+        :param checksums: attachment id -> expected sha256.
+        :return: attachment id -> path, in the order of the attachments.
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = dict()
+        content_types = dict()
+        used = set()
+        for attachment in attachments:
+            content_types[attachment.id] = attachment.content_type
+            name = attachment_filename(attachment)
+            if name in used:
+                name = f"{attachment.id}_{name}"
+            used.add(name)
+            paths[attachment.id] = os.path.join(directory, name)
+        checksums = checksums or dict()
+        await asyncio.gather(*(
+            self.download(MailAttachmentRequest(mail_id=mail_id, part=x), path, sha256=checksums.get(x),
+                          content_type=content_types[x])
+            for x, path in paths.items()))
+        return paths
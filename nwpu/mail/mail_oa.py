@@ -2,8 +2,6 @@ from pydantic import BaseModel, Field
 from aiohttp import ClientSession, ClientResponse
 from urllib.parse import unquote, quote
 
-from nwpu.utils.common import DEFAULT_HEADER
-
 
 class MailOaUrl:
     MAIL_OA_LOCAL = 'https://mail.nwpu.edu.cn/cmcuapi/sso/oauth2'
@@ -35,10 +33,10 @@ class MailOaRequest:
         GET, has redirect
         :return redirected url, should be applied later in oa login.
         """
-        async with (self.sess.get(MailOaUrl.MAIL_OA_LOCAL, allow_redirects=False, headers=DEFAULT_HEADER) as resp):
+        async with (self.sess.get(MailOaUrl.MAIL_OA_LOCAL, allow_redirects=False) as resp):
             if resp.status == 302:
                 redirect_once = resp.headers['Location']
-                async with self.sess.get(redirect_once, allow_redirects=False, headers=DEFAULT_HEADER) as resp:
+                async with self.sess.get(redirect_once, allow_redirects=False) as resp:
                     return resp.headers['Location'].split('?', 1)[1].removeprefix('service=')
             return ''
 
@@ -46,13 +44,13 @@ class MailOaRequest:
         """
         :return:
         """
-        async with self.sess.get(MailOaUrl.MAIL_OA_REDIRECTED_OA, allow_redirects=True, headers=DEFAULT_HEADER) as resp:
+        async with self.sess.get(MailOaUrl.MAIL_OA_REDIRECTED_OA, allow_redirects=True) as resp:
             cookie = resp.cookies.get('SESSION')
             return cookie.value
 
     @staticmethod
     async def authorize(session: ClientSession):
-        async with session.get(MailOaUrl.MAIL_OA_LOCAL, allow_redirects=True, headers=DEFAULT_HEADER) as resp:
+        async with session.get(MailOaUrl.MAIL_OA_LOCAL, allow_redirects=True) as resp:
             return extract_sid(session)
 
 
@@ -1,10 +1,20 @@
+import asyncio
+from itertools import islice
+from typing import AsyncIterator, Iterable, Optional, Set
+
 import aiohttp
 from aiohttp.streams import StreamReader
 
+from nwpu.mail.mail_cache import MailBodyCache
 from nwpu.mail.mail_oa import extract_sid
 from nwpu.mail.mail_struct import *
-from nwpu.utils.common import DEFAULT_HEADER
 from nwpu.utils.parse import StringArgsBuilder
+from nwpu.utils.decode import parse_response
+from nwpu.utils.metrics import register_endpoints
+from nwpu.utils.paginate import DEFAULT_PREFETCH, Paginator
+
+# readMessage requests in flight in read_mails
+DEFAULT_READ_CONCURRENCY = 4
 
 
 class MailUrls:
@@ -14,6 +24,16 @@ class MailUrls:
     MAIL_READ_MAIL = "https://mail.nwpu.edu.cn/coremail/XT5/jsp/readMessage.jsp"
     MAIL_GET_ALL_CONTACTS = "https://mail.nwpu.edu.cn/coremail/s/json"
     MAIL_SEARCH_CONTACT = "https://mail.nwpu.edu.cn/coremail/XT5/jsp/contact.jsp"
+    MAIL_ATTACHMENT = "https://mail.nwpu.edu.cn/coremail/mbox-data"
+
+
+register_endpoints(MailUrls, funcs={
+    'MAIL_CATEGORY': 'getAllFolders',
+    'MAIL_LIST': 'mbox:listMessages',
+    'MAIL_USER_AVATAR': 'user:AgetHeadImageData',
+    'MAIL_GET_ALL_CONTACTS': 'pab:getAllGroups',
+    'MAIL_SEARCH_CONTACT': 'pab:search',
+})
 
 
 class MailRequest:
@@ -41,10 +61,9 @@ class MailRequest:
                 .add_param("sid", self.sid)
                 .add_param("func", "getAllFolders")
                 .build(),
-            data=form,
-            headers=DEFAULT_HEADER)
+            data=form)
 
-        return MailCategoryResponse(**await resp.json(content_type="text/x-json"))
+        return await parse_response(resp, MailCategoryResponse, "text/x-json")
 
     async def get_mail_list(self, request_json: MailListRequest) -> MailListResponse:
         """
@@ -58,9 +77,18 @@ class MailRequest:
                 .add_param("sid", self.sid)
                 .add_param("func", "mbox:listMessages")
                 .build(),
-            json=json_data,
-            headers=DEFAULT_HEADER)
-        return MailListResponse(**await resp.json(content_type="text/x-json"))
+            json=json_data)
+        return await parse_response(resp, MailListResponse, "text/x-json")
+
+    def iter_mail_list(self, request_json: MailListRequest, prefetch: int = DEFAULT_PREFETCH) -> Paginator:
+        """
+        All the mails of the list, from request_json.start on, request_json.limit per request.
+        :param request_json: MailListRequest
+        :param prefetch: pages requested concurrently.
+        :return: async iterator of the MailListItem, .pages() for the responses.
+        """
+        return Paginator(self.get_mail_list, request_json, records='categories', total='total',
+                         page_field='start', size_field='limit', offset=True, prefetch=prefetch)
 
 
     async def get_user_avatar(self, request_json: UserAvatarRequest) -> StreamReader:
@@ -69,16 +97,23 @@ class MailRequest:
         :param request_json: UserAvatarRequest
         :return: UserAvatarResponse
         """
+        return (await self.open_user_avatar(request_json)).content
+
+    async def open_user_avatar(self, request_json: UserAvatarRequest) -> aiohttp.ClientResponse:
+        """
+        get_user_avatar, returning the response: with an expired sid, the body is a json error
+        instead of an image. The caller reads the body or releases the response.
+        :param request_json: UserAvatarRequest
+        :return: the response.
+        """
         json_data = request_json.model_dump(by_alias=True)
-        resp = await self.session.post(
+        return await self.session.post(
             StringArgsBuilder(MailUrls.MAIL_USER_AVATAR)
                 .add_param("sid", self.sid)
                 .add_param("func", "user:AgetHeadImageData")
             .build(),
-            json=json_data,
-            headers=DEFAULT_HEADER
+            json=json_data
         )
-        return resp.content
 
     async def read_mail(self, request_data: ReadMailFormRequest) -> ReadMailResponse:
         """
@@ -86,15 +121,84 @@ class MailRequest:
         :param request_data: ReadMailFormRequest
         :return: ReadMailResponse
         """
-        data = request_data.model_dump(by_alias=True)
-        print(data)
+        form = request_data.model_dump(by_alias=True)
         resp = await self.session.post(
             StringArgsBuilder(MailUrls.MAIL_READ_MAIL)
-                .add_params(**data)
+                .add_param("sid", self.sid)
                 .build(),
-            data=data,
-            headers=DEFAULT_HEADER)
-        return ReadMailResponse(**await resp.json(content_type="text/x-json"))
+            data=form)
+        return await parse_response(resp, ReadMailResponse, "text/x-json")
+
+    async def read_mails(self, mids: Iterable[str], concurrency: int = DEFAULT_READ_CONCURRENCY,
+                         cache: Optional[MailBodyCache] = None, account: str = "") -> AsyncIterator[ReadMailResponse]:
+        """
+        Read many mails, `concurrency` readMessage requests at a time.
+        :param mids: the mail ids, the duplicates are read once.
+        :param concurrency: requests in flight.
+        :param cache: the mails found in it are not requested, the others are added to it.
+        :param account: the key of the mailbox in the cache, e.g. the student id.
+        :return: async iterator of the ReadMailResponse as they finish, the cached ones first.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1.")
+        todo = list()
+        for mid in dict.fromkeys(mids):
+            mail = cache.get(account, mid) if cache is not None else None
+            if mail is not None:
+                yield mail
+            else:
+                todo.append(mid)
+
+        remaining = iter(todo)
+        pending: Set[asyncio.Task] = set()
+        mid_of = dict()
+
+        def start(mid: str):
+            task = asyncio.create_task(self.read_mail(ReadMailFormRequest(mid=mid)))
+            mid_of[task] = mid
+            pending.add(task)
+
+        try:
+            for mid in islice(remaining, concurrency):
+                start(mid)
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    mail = task.result()
+                    mid = next(remaining, None)
+                    if mid is not None:
+                        start(mid)
+                    if cache is not None and mail.code == "S_OK":
+                        cache.put(account, mid_of.pop(task), mail)
+                    yield mail
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def open_attachment(self, request: MailAttachmentRequest, offset: int = 0) -> aiohttp.ClientResponse:
+        """
+        Start the download of an attachment, the body is left unread.
+        The caller reads resp.content and releases the response, see mail_download.py.
+        :param request: MailAttachmentRequest
+        :param offset: resume from this byte, with a Range request. The server may ignore it
+            and answer the whole attachment with a 200.
+        :return: the response: 200, 206 (from offset) or 416 (offset past the end).
+        """
+        headers = dict()
+        if offset > 0:
+            headers['Range'] = f"bytes={offset}-"
+        resp = await self.session.post(
+            StringArgsBuilder(MailUrls.MAIL_ATTACHMENT)
+                .add_param("sid", self.sid)
+                .add_params(**request.model_dump(by_alias=True))
+                .build(),
+            headers=headers)
+        if resp.status == 416:
+            return resp
+        resp.raise_for_status()
+        return resp
 
     async def get_all_contact_group(self) -> AllMailContactGroupResponse:
         """
@@ -105,9 +209,8 @@ class MailRequest:
             StringArgsBuilder(MailUrls.MAIL_GET_ALL_CONTACTS)
                 .add_param("sid", self.sid)
                 .add_param("func", "pab:getAllGroups")
-                .build(),
-            headers=DEFAULT_HEADER)
-        return AllMailContactGroupResponse(**await resp.json(content_type="text/x-json"))
+                .build())
+        return await parse_response(resp, AllMailContactGroupResponse, "text/x-json")
 
     async def search_contact(self, request_data: SearchContactFormRequest) -> SearchContactResponse:
         """
@@ -121,6 +224,5 @@ class MailRequest:
                 .add_param("sid", self.sid)
                 .add_param("func", "pab:search")
                 .build(),
-            data=form_data,
-            headers=DEFAULT_HEADER)
-        return SearchContactResponse(**await resp.json(content_type="text/x-json"))
\ No newline at end of file
+            data=form_data)
+        return await parse_response(resp, SearchContactResponse, "text/x-json")
\ No newline at end of file
@@ -0,0 +1,227 @@
+import html
+import re
+import sqlite3
+from typing import Iterable, List, Optional, Set
+
+from nwpu.mail.mail_cache import MailBodyCache
+from nwpu.mail.mail_request import DEFAULT_READ_CONCURRENCY, MailRequest
+from nwpu.mail.mail_struct import ReadMailResponse
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS search_docs (
+    rowid INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    mid TEXT NOT NULL,
+    received_date TEXT,
+    subject TEXT NOT NULL,
+    from_ TEXT NOT NULL,
+    -- the text of the body, for the snippets
+    text TEXT NOT NULL,
+    UNIQUE (account, mid)
+);
+-- the columns hold the bigrams of the CJK text, see cjk_bigrams
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    subject, from_, to_, content, attachments,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+'''
+
+# characters around the first match in SearchHit.snippet
+SNIPPET_CONTEXT = 32
+
+_TAG = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]+>', re.S | re.I)
+_SPACE = re.compile(r'\s+')
+_CJK = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+')
+
+
+def html_to_text(content: str) -> str:
+    """
+    The text of a mail body, without the tags, scripts and styles.
+    """
+    return _SPACE.sub(' ', html.unescape(_TAG.sub(' ', content))).strip()
+
+
+def cjk_bigrams(text: str) -> str:
+    """
+    The CJK runs of the text split into overlapping bigrams, '教务处' -> ' 教务 务处 ': unicode61 does not
+    split the Chinese text into words, a run would be a single token. The other text is left as is.
+    """
+    def split(match: re.Match) -> str:
+        run = match.group(0)
+        if len(run) == 1:
+            return f" {run} "
+        return ' ' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + ' '
+    return _CJK.sub(split, text)
+
+
+def _phrase(term: str) -> str:
+    """
+    The FTS5 query of a search term: its tokens as a phrase, the last one a prefix.
+    """
+    return '"{}"*'.format(cjk_bigrams(term).strip().replace('"', '""'))
+
+
+def _snippet(text: str, terms: List[str]) -> str:
+    lowered = text.lower()
+    found = [(i, x) for i, x in ((lowered.find(x.lower()), x) for x in terms) if i >= 0]
+    if not found:
+        return text[:2 * SNIPPET_CONTEXT]
+    index, term = min(found)
+    start = max(0, index - SNIPPET_CONTEXT)
+    end = index + len(term)
+    return ('...' if start > 0 else '') + text[start:index] + '[' + text[index:end] + ']' + \
+        text[end:end + SNIPPET_CONTEXT] + ('...' if end + SNIPPET_CONTEXT < len(text) else '')
+
+
+class SearchHit:
+    account: str
+    mid: str
+    subject: str
+    from_: str
+    received_date: Optional[str]
+    snippet: str
+    rank: float
+
+    def __init__(self, account: str, mid: str, subject: str, from_: str, received_date: Optional[str],
+                 snippet: str, rank: float):
+        self.account = account
+        self.mid = mid
+        self.subject = subject
+        self.from_ = from_
+        self.received_date = received_date
+        self.snippet = snippet
+        self.rank = rank
+
+    def __repr__(self) -> str:
+        return f"SearchHit(account={self.account!r}, mid={self.mid!r}, subject={self.subject!r})"
+
+
+class MailSearchIndex:
+    """
+    Local full-text index (SQLite FTS5) of the read mails of many accounts: the subject, the
+    sender and recipients, the text of the body and the attachment file names.
+    The queries are answered offline, ranked by bm25.
+
+    Usage:
+        search = MailSearchIndex('search.db')
+        await search.index(mail, '2020000001', mail_index.ids('2020000001', MailListFID.inbox))
+        hits = search.search('教务处 考试', account='2020000001')
+    """
+    path: str
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        :param path: the SQLite database, can be the one of MailIndex.
+        """
+        self.path = path
+        self.db = sqlite3.connect(path)
+        if path != ':memory:':
+            self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def add(self, account: str, mail: ReadMailResponse):
+        """
+        Index a read mail, replacing its previous version. Committed by the caller or by commit().
+        """
+        body = mail.body
+        mid = body.info.mail_id
+        self._remove(account, mid)
+        text = html_to_text(body.mail.main_part_data.content)
+        from_ = ' '.join(body.mail.from_)
+        cursor = self.db.execute('INSERT INTO search_docs (account, mid, received_date, subject, from_, text) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 (account, mid, body.info.received_date, body.mail.subject, from_, text))
+        columns = (body.mail.subject,
+                   from_,
+                   ' '.join(body.mail.to + body.mail.cc),
+                   text,
+                   ' '.join(x.filename for x in body.mail.attachments))
+        self.db.execute('INSERT INTO search_fts (rowid, subject, from_, to_, content, attachments) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (cursor.lastrowid, *(cjk_bigrams(x) for x in columns)))
+
+    def _remove(self, account: str, mid: str):
+        row = self.db.execute('SELECT rowid FROM search_docs WHERE account = ? AND mid = ?', (account, mid)).fetchone()
+        if row is not None:
+            self.db.execute('DELETE FROM search_fts WHERE rowid = ?', row)
+            self.db.execute('DELETE FROM search_docs WHERE rowid = ?', row)
+
+    def remove(self, account: str, mids: Iterable[str]):
+        """
+        Drop deleted mails from the index.
+        """
+        for mid in mids:
+            self._remove(account, mid)
+        self.db.commit()
+
+    def commit(self):
+        self.db.commit()
+
+    def mids(self, account: str) -> Set[str]:
+        """
+        :return: the indexed mail ids of an account.
+        """
+        return {x for x, in self.db.execute('SELECT mid FROM search_docs WHERE account = ?', (account,))}
+
+    async def index(self, mail: MailRequest, account: str, mids: Iterable[str],
+                    cache: Optional[MailBodyCache] = None,
+                    concurrency: int = DEFAULT_READ_CONCURRENCY,
+                    commit_every: int = 50) -> int:
+        """
+        Read and index the mails that are not indexed yet, each one as soon as it is read.
+        :param mail: MailRequest of the account.
+        :param account: the key of the mailbox, e.g. the student id.
+        :param mids: the mails to index, e.g. MailIndex.ids(account, fid).
+        :param cache: passed to read_mails, the cached mails are not requested again.
+        :param concurrency: readMessage requests in flight.
+        :param commit_every: commit after this many mails, an interrupted run keeps its progress.
+        :return: the number of mails indexed.
+        """
+        indexed = self.mids(account)
+        todo = [x for x in mids if x not in indexed]
+        count = 0
+        try:
+            async for read in mail.read_mails(todo, concurrency=concurrency, cache=cache, account=account):
+                if read.code != "S_OK":
+                    continue
+                self.add(account, read)
+                count += 1
+                if count % commit_every == 0:
+                    self.db.commit()
+        finally:
+            self.db.commit()
+        return count
+
+    def search(self, query: str, account: Optional[str] = None, limit: int = 20, offset: int = 0,
+               raw: bool = False) -> List[SearchHit]:
+        """
+        :param query: the terms, separated by spaces, all of them must match, the last word of a term
+            as a prefix: 'dead' matches 'deadline'. Or an FTS5 query if raw, with its CJK text given
+            through cjk_bigrams.
+        :param account: search one mailbox, all of them if None.
+        :param limit:
+        :param offset:
+        :param raw: query is passed to FTS5 as is (OR, NEAR, column filters...).
+        :return: the matching mails, best first.
+        """
+        terms = query.split()
+        if not terms:
+            return list()
+        match = query if raw else ' '.join(_phrase(x) for x in terms)
+        conditions = 'search_fts MATCH ?'
+        params = [match]
+        if account is not None:
+            conditions += ' AND d.account = ?'
+            params.append(account)
+        rows = self.db.execute(
+            "SELECT d.account, d.mid, d.subject, d.from_, d.received_date, d.text, "
+            "bm25(search_fts) AS rank "
+            "FROM search_fts JOIN search_docs d ON d.rowid = search_fts.rowid "
+            f"WHERE {conditions} ORDER BY rank, d.received_date DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset)).fetchall()
+        return [SearchHit(account, mid, subject, from_, received_date, _snippet(text, terms), rank)
+                for account, mid, subject, from_, received_date, text, rank in rows]
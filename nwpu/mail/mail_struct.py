@@ -250,7 +250,13 @@ class MailAttachmentRequest(BaseModel):
     POST
     https://mail.nwpu.edu.cn/coremail/mbox-data?part=<attachment_id>&mid=<mail_id>&mode=download
     """
-    pass
+    mail_id: str = Field(alias="mid")
+    # MailAttachment.id
+    part: str
+    mode: str = "download"
+
+    class Config:
+        populate_by_name = True
 
 
 class AllMailContactGroupRequest(BaseModel):
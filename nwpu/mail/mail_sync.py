@@ -0,0 +1,325 @@
+import re
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from nwpu.mail.mail_request import MailRequest
+from nwpu.mail.mail_struct import MailListFID, MailListItem, MailListOrder, MailListOrderFlag, MailListRequest
+from nwpu.utils.paginate import DEFAULT_PREFETCH
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    hmid TEXT NOT NULL,
+    fid INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    from_ TEXT NOT NULL,
+    to_ TEXT NOT NULL,
+    -- normalised by normalize_mail_date, sorted as text
+    received_date TEXT NOT NULL,
+    modified_date TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    read INTEGER NOT NULL,
+    summary TEXT,
+    -- the full MailListItem, as json
+    data TEXT NOT NULL,
+    PRIMARY KEY (account, id)
+);
+CREATE INDEX IF NOT EXISTS messages_folder ON messages (account, fid, received_date);
+CREATE INDEX IF NOT EXISTS messages_hmid ON messages (account, hmid);
+CREATE TABLE IF NOT EXISTS folders (
+    account TEXT NOT NULL,
+    fid INTEGER NOT NULL,
+    -- received date of the newest synced message
+    watermark TEXT,
+    total INTEGER NOT NULL DEFAULT 0,
+    syncs INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL,
+    reconciled_at REAL,
+    PRIMARY KEY (account, fid)
+);
+'''
+
+MAIL_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# the dates of Coremail, e.g. '2024-01-05 08:03:00', tolerating missing zero padding and seconds
+_MAIL_DATE = re.compile(r'\s*(\d{4})-(\d{1,2})-(\d{1,2})[ T](\d{1,2}):(\d{1,2})(?::(\d{1,2}))?\s*')
+
+
+def parse_mail_date(value: str) -> datetime:
+    """
+    :param value: a receivedDate / modifiedDate of a MailListItem.
+    :return: the date. ValueError on an unknown format, rather than comparing it as text.
+    """
+    match = _MAIL_DATE.fullmatch(value)
+    if match is None:
+        raise ValueError(f"Unexpected mail date format: {value!r}")
+    return datetime(*(int(x or 0) for x in match.groups()))
+
+
+def normalize_mail_date(value: str) -> str:
+    """
+    :return: the date as 'YYYY-MM-DD HH:MM:SS', which sorts as text in date order.
+    """
+    return parse_mail_date(value).strftime(MAIL_DATE_FORMAT)
+
+
+class FolderState:
+    watermark: Optional[str]
+    total: int
+    syncs: int
+    synced_at: Optional[float]
+    reconciled_at: Optional[float]
+
+    def __init__(self, watermark: Optional[str] = None, total: int = 0, syncs: int = 0,
+                 synced_at: Optional[float] = None, reconciled_at: Optional[float] = None):
+        self.watermark = watermark
+        self.total = total
+        self.syncs = syncs
+        self.synced_at = synced_at
+        self.reconciled_at = reconciled_at
+
+
+class MailIndex:
+    """
+    Local SQLite index of the mail headers (MailListItem) of many accounts, keyed by account and mail id.
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def state(self, account: str, fid: int) -> FolderState:
+        row = self.db.execute('SELECT watermark, total, syncs, synced_at, reconciled_at FROM folders '
+                              'WHERE account = ? AND fid = ?', (account, fid)).fetchone()
+        return FolderState(*row) if row is not None else FolderState()
+
+    def save_state(self, account: str, fid: int, state: FolderState):
+        self.db.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (account, fid, state.watermark, state.total, state.syncs,
+                         state.synced_at, state.reconciled_at))
+
+    def modified_dates(self, account: str, ids: Iterable[str]) -> Dict[str, str]:
+        """
+        :return: mail id -> modified date, for the ids in the index.
+        """
+        ids = list(ids)
+        result = dict()
+        # under the default limit of 999 sqlite variables
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            result.update(self.db.execute(
+                f"SELECT id, modified_date FROM messages WHERE account = ? AND id IN ({','.join('?' * len(chunk))})",
+                (account, *chunk)).fetchall())
+        return result
+
+    def upsert(self, account: str, items: Iterable[MailListItem]):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(account, x.id, x.hmid, x.fid, x.subject, x.sender, x.from_, x.to, normalize_mail_date(x.received_date),
+              x.modified_date,
+              x.size, int(bool(x.flags and x.flags.read)), x.summary, x.model_dump_json(by_alias=True))
+             for x in items])
+
+    def ids(self, account: str, fid: int) -> Set[str]:
+        return {x for x, in self.db.execute('SELECT id FROM messages WHERE account = ? AND fid = ?', (account, fid))}
+
+    def count(self, account: str, fid: int) -> int:
+        return self.db.execute('SELECT COUNT(*) FROM messages WHERE account = ? AND fid = ?',
+                               (account, fid)).fetchone()[0]
+
+    def delete(self, account: str, ids: Iterable[str]):
+        self.db.executemany('DELETE FROM messages WHERE account = ? AND id = ?', [(account, x) for x in ids])
+
+    def newest(self, account: str, fid: int) -> Optional[str]:
+        return self.db.execute('SELECT MAX(received_date) FROM messages WHERE account = ? AND fid = ?',
+                               (account, fid)).fetchone()[0]
+
+    def messages(self, account: str, fid: int = MailListFID.inbox, unread_only: bool = False,
+                 limit: int = 100, offset: int = 0) -> List[MailListItem]:
+        """
+        The indexed headers of a folder, newest first.
+        """
+        rows = self.db.execute(
+            'SELECT data FROM messages WHERE account = ? AND fid = ?' + (' AND read = 0' if unread_only else '') +
+            ' ORDER BY received_date DESC LIMIT ? OFFSET ?', (account, int(fid), limit, offset))
+        return [MailListItem.model_validate_json(x) for x, in rows]
+
+    def get(self, account: str, mail_id: str) -> Optional[MailListItem]:
+        row = self.db.execute('SELECT data FROM messages WHERE account = ? AND id = ?', (account, mail_id)).fetchone()
+        return MailListItem.model_validate_json(row[0]) if row is not None else None
+
+
+class SyncResult:
+    added: int
+    updated: int
+    deleted: int
+    requests: int
+    reconciled: bool
+
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.deleted = 0
+        self.requests = 0
+        self.reconciled = False
+
+    def __repr__(self) -> str:
+        return (f"SyncResult(added={self.added}, updated={self.updated}, deleted={self.deleted}, "
+                f"requests={self.requests}, reconciled={self.reconciled})")
+
+
+class MailSync:
+    """
+    Incremental sync of a mail folder into a MailIndex.
+
+    The listing is read newest first (receivedDate, descending) and stops at the watermark, the received
+    date of the newest message of the last sync: only the new messages are downloaded.
+    The server total then tells whether messages were deleted or moved away; if so, or every
+    `reconcile_every` syncs, the whole folder is listed again to drop the deleted messages and
+    pick up the flag changes (read...) of the older ones, detected from their modified date.
+
+    The changes are collected while listing and written at the end, in one transaction without any
+    await in it: the syncs of many accounts can share a MailIndex, a failed sync writes nothing and
+    does not roll back the others.
+
+    Usage:
+        index = MailIndex('mail.db')
+        result = await MailSync(mail, index, '2020000001').sync()
+        unread = index.messages('2020000001', unread_only=True)
+    """
+    mail: MailRequest
+    index: MailIndex
+    account: str
+    page_size: int
+    reconcile_every: Optional[int]
+    prefetch: int
+
+    def __init__(self, mail: MailRequest, index: MailIndex, account: str,
+                 page_size: int = 100,
+                 reconcile_every: Optional[int] = 24,
+                 prefetch: int = DEFAULT_PREFETCH):
+        """
+        :param mail:
+        :param index:
+        :param account: the key of the mailbox in the index, e.g. the student id.
+        :param page_size: messages per listing request.
+        :param reconcile_every: force a full listing every this many syncs, None to only reconcile
+            when the total does not match.
+        :param prefetch: pages requested concurrently by the full listing.
+        """
+        self.mail = mail
+        self.index = index
+        self.account = account
+        self.page_size = page_size
+        self.reconcile_every = reconcile_every
+        self.prefetch = prefetch
+
+    def _request(self, fid: int, start: int = 0) -> MailListRequest:
+        return MailListRequest(fid=fid, start=start, limit=self.page_size,
+                               sort_by=MailListOrderFlag.receivedDate, sort_order=MailListOrder.descending,
+                               return_total=True,
+                               # the pinned mails would come first, older than the watermark
+                               top_first=False)
+
+    def _merge(self, items: List[MailListItem], changes: Dict[str, MailListItem], result: SyncResult):
+        """
+        Collect the new and modified items into changes, mail id -> item.
+        """
+        known = self.index.modified_dates(self.account, (x.id for x in items if x.id not in changes))
+        known.update((x, y.modified_date) for x, y in changes.items())
+        for item in items:
+            if known.get(item.id) == item.modified_date:
+                continue
+            if item.id in known:
+                result.updated += 1
+            else:
+                result.added += 1
+            changes[item.id] = item
+
+    async def _new_messages(self, fid: int, watermark: Optional[str], changes: Dict[str, MailListItem],
+                            result: SyncResult) -> int:
+        """
+        List the folder newest first, down to the watermark.
+        :return: the total of the folder on the server.
+        """
+        start = 0
+        total = 0
+        # compared as dates, not as text: a format change raises instead of stopping the sync
+        since = parse_mail_date(watermark) if watermark is not None else None
+        while True:
+            resp = await self.mail.get_mail_list(self._request(fid, start))
+            result.requests += 1
+            items = resp.categories or []
+            total = resp.total or 0
+            # the messages received at the watermark are listed again, the upsert skips them
+            fresh = [x for x in items if since is None or parse_mail_date(x.received_date) >= since]
+            self._merge(fresh, changes, result)
+            start += len(items)
+            if len(fresh) < len(items) or not items or start >= total:
+                return total
+
+    async def _reconcile(self, fid: int, changes: Dict[str, MailListItem], result: SyncResult) -> tuple[int, Set[str]]:
+        """
+        List the whole folder, the pages concurrently.
+        :return: the total of the folder on the server, the ids of the deleted mails.
+        """
+        seen = set()
+        total = 0
+        paginator = self.mail.iter_mail_list(self._request(fid), prefetch=self.prefetch)
+        async for page in paginator.pages():
+            result.requests += 1
+            items = page.categories or []
+            total = page.total or 0
+            seen.update(x.id for x in items)
+            self._merge(items, changes, result)
+        deleted = self.index.ids(self.account, fid) - seen
+        result.deleted += len(deleted)
+        result.reconciled = True
+        return total, deleted
+
+    async def sync(self, fid: int = MailListFID.inbox, full: bool = False) -> SyncResult:
+        """
+        :param fid: the folder.
+        :param full: list the whole folder, to reconcile the deletions and the flag changes.
+        :return: what changed in the index.
+        """
+        fid = int(fid)
+        result = SyncResult()
+        changes: Dict[str, MailListItem] = dict()
+        deleted: Set[str] = set()
+        state = self.index.state(self.account, fid)
+        due = self.reconcile_every is not None and state.syncs % self.reconcile_every == self.reconcile_every - 1
+        if state.watermark is None or full or due:
+            total, deleted = await self._reconcile(fid, changes, result)
+        else:
+            total = await self._new_messages(fid, state.watermark, changes, result)
+            if self.index.count(self.account, fid) + result.added != total:
+                # deleted or moved away
+                total, deleted = await self._reconcile(fid, changes, result)
+
+        # no await from here on, the transaction only holds the changes of this sync
+        try:
+            self.index.upsert(self.account, changes.values())
+            self.index.delete(self.account, deleted)
+            if result.reconciled:
+                state.reconciled_at = time.time()
+            state.watermark = self.index.newest(self.account, fid)
+            state.total = total
+            state.syncs += 1
+            state.synced_at = time.time()
+            self.index.save_state(self.account, fid, state)
+            self.index.db.commit()
+        except BaseException:
+            self.index.db.rollback()
+            raise
+        return result
@@ -1,7 +1,5 @@
 from aiohttp import ClientSession
 
-from utils.common import DEFAULT_HEADER
-
 
 class MarketOaUrl:
     OA_URL = "https://uis.nwpu.edu.cn/cas/login?service=https%3A%2F%2Fsecondhand-market.nwpu.edu.cn%2Flogin%2Fcas%3Fredirect_uri%3Dhttps%3A%2F%2Fsecondhand-market.nwpu.edu.cn%2Fui%2F"
@@ -13,7 +11,7 @@ class MarketOaRequest:
 
     @staticmethod
     async def authorize(sess: ClientSession) -> str:
-        resp = await sess.get(MarketOaUrl.OA_URL, allow_redirects=True, headers=DEFAULT_HEADER)
+        resp = await sess.get(MarketOaUrl.OA_URL, allow_redirects=True)
         redirects = [x.url for x in resp.history]
         redirects.append(resp.url)
         print(redirects)
@@ -1,9 +1,16 @@
+from typing import Iterable, Optional
+
 from aiohttp import ClientSession
 
 from nwpu.market.market_oa import MarketOaRequest
 from nwpu.market.market_struct import *
 from nwpu.utils.parse import concat_url
-from nwpu.utils.common import DEFAULT_HEADER
+from nwpu.utils.cache import ResponseCache, cached_get, token_identity
+from nwpu.utils.decode import parse_response
+from nwpu.utils.lazy import response_model
+from nwpu.utils.metrics import register_endpoints
+from nwpu.utils.paginate import DEFAULT_PREFETCH, Paginator
+from nwpu.utils.singleflight import single_flight
 
 
 class MarketUrls:
@@ -16,11 +23,26 @@ class MarketUrls:
     MARKET_ITEM_LIST = "https://secondhand-market.nwpu.edu.cn/api/second/page"
     MARKET_ITEM_DETAIL = "https://secondhand-market.nwpu.edu.cn/api/second/detail"
 
+
+register_endpoints(MarketUrls)
+
+
 class MarketRequest:
     sess: ClientSession
-    headers: dict = DEFAULT_HEADER.copy()
-    def __init__(self, session: ClientSession, x_token: str):
+    # the X-Id-Token, the other headers are the ones of the session
+    headers: dict
+    cache: Optional[ResponseCache] = None
+    identity: Optional[str] = None
+    def __init__(self, session: ClientSession, x_token: str, cache: Optional[ResponseCache] = None):
+        """
+        :param session:
+        :param x_token:
+        :param cache: caches the item classification, complaint type and campus dictionaries.
+        """
         self.sess = session
+        self.headers = dict()
+        self.cache = cache
+        self.identity = token_identity(x_token)
 
         if x_token:
             self.headers['X-Id-Token'] = x_token
@@ -32,60 +54,104 @@ class MarketRequest:
         self.headers['X-Id-Token'] = token
         return token
 
+    @single_flight
     async def get_self_info(self) -> MarketSelfInfoResponse:
         resp = await self.sess.get(
             MarketUrls.MARKET_SELF_INFO,
             headers=self.headers)
 
-        return MarketSelfInfoResponse(**await resp.json())
+        return await parse_response(resp, MarketSelfInfoResponse)
 
+    @single_flight
     async def get_item_classification(self) -> MarketItemClassificationResponse:
-        resp = await self.sess.get(
-            MarketUrls.MARKET_ITEM_CLASSIFICATION,
-            headers=self.headers)
-
-        return MarketItemClassificationResponse(**await resp.json())
+        return await cached_get(self.sess, MarketUrls.MARKET_ITEM_CLASSIFICATION, MarketItemClassificationResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_complaint_type(self) -> MarketComplaintTypeResponse:
-        resp = await self.sess.get(
-            MarketUrls.MARKET_COMPLAINT_TYPE,
-            headers=self.headers)
-
-        return MarketComplaintTypeResponse(**await resp.json())
+        return await cached_get(self.sess, MarketUrls.MARKET_COMPLAINT_TYPE, MarketComplaintTypeResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_campus_info(self) -> MarketCampusInfoResponse:
-        resp = await self.sess.get(
-            MarketUrls.MARKET_CAMPUS_INFO,
-            headers=self.headers)
-
-        return MarketCampusInfoResponse(**await resp.json())
+        return await cached_get(self.sess, MarketUrls.MARKET_CAMPUS_INFO, MarketCampusInfoResponse,
+                                self.cache, self.identity, self.headers)
 
+    @single_flight
     async def get_unread_message_count(self) -> MarketUnreadMessageCountResponse:
         resp = await self.sess.get(
             MarketUrls.MARKET_UNREAD_MSG_COUNT,
             headers=self.headers)
 
-        return MarketUnreadMessageCountResponse(**await resp.json())
+        return await parse_response(resp, MarketUnreadMessageCountResponse)
 
+    @single_flight
     async def get_message_list(self, request: MarketUserMessageRequest = MarketUserMessageRequest()) -> MarketUserMessageResponse:
         resp = await self.sess.get(
             MarketUrls.MARKET_MSG_LIST,
             headers=self.headers,
             json=request.model_dump())
 
-        return MarketUserMessageResponse(**await resp.json())
-
-    async def get_item_list(self, request: MarketItemListRequest = MarketItemListRequest()) -> MarketItemListResponse:
+        return await parse_response(resp, MarketUserMessageResponse)
+
+    def iter_message_list(self, request: MarketUserMessageRequest = MarketUserMessageRequest(),
+                          prefetch: int = DEFAULT_PREFETCH) -> Paginator:
+        """
+        All the messages, from the page of the request on.
+        :param request:
+        :param prefetch: pages requested concurrently.
+        :return: async iterator of the message records, .pages() for the responses.
+        """
+        return Paginator(self.get_message_list, request, records='data.records', total='data.total',
+                         page_field='current_page', size_field='page_size', prefetch=prefetch)
+
+    @single_flight
+    async def get_item_list(self, request: MarketItemListRequest = MarketItemListRequest(),
+                            lazy: bool = False,
+                            fields: Optional[Iterable[str]] = None) -> MarketItemListResponse:
+        """
+        :param request:
+        :param lazy: the records are LazyModel, validated field by field on access.
+        :param fields: only validate and keep these fields of the records.
+        :return:
+        """
         resp = await self.sess.get(
             MarketUrls.MARKET_ITEM_LIST,
             headers=self.headers,
             params=request.model_dump(by_alias=True, exclude_none=True))
 
-        return MarketItemListResponse(**await resp.json())
-
-    async def get_item_detail(self, item_id: str | int) -> MarketItemDetailResponse:
+        return await parse_response(resp, response_model(MarketItemListResponse, MarketItemListRecord, lazy, fields))
+
+    def iter_item_list(self, request: MarketItemListRequest = MarketItemListRequest(),
+                       prefetch: int = DEFAULT_PREFETCH,
+                       lazy: bool = False,
+                       fields: Optional[Iterable[str]] = None) -> Paginator:
+        """
+        All the items, from the page of the request on.
+        :param request:
+        :param prefetch: pages requested concurrently.
+        :param lazy: see get_item_list.
+        :param fields: see get_item_list.
+        :return: async iterator of the item records, .pages() for the responses.
+        """
+        async def fetch(page: MarketItemListRequest) -> MarketItemListResponse:
+            return await self.get_item_list(page, lazy, fields)
+
+        return Paginator(fetch, request, records='data.records', total='data.total',
+                         page_field='current_page', size_field='page_size', prefetch=prefetch)
+
+    @single_flight
+    async def get_item_detail(self, item_id: str | int,
+                              lazy: bool = False,
+                              fields: Optional[Iterable[str]] = None) -> MarketItemDetailResponse:
+        """
+        :param item_id:
+        :param lazy: the item is a LazyModel, validated field by field on access.
+        :param fields: only validate and keep these fields of the item.
+        :return:
+        """
         resp = await self.sess.get(
             concat_url(MarketUrls.MARKET_ITEM_DETAIL, str(item_id)),
             headers=self.headers)
 
-        return MarketItemDetailResponse(**await resp.json())
+        return await parse_response(resp, response_model(MarketItemDetailResponse, MarketItemDetailData, lazy, fields))
@@ -0,0 +1,201 @@
+import asyncio
+import importlib
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiohttp import ClientSession
+
+from nwpu.oa.oa_request import OaRequest
+from nwpu.utils.cache import ResponseCache
+from nwpu.utils.refresh import TokenRefresher
+
+# authorize(sess) -> service ticket result (token, sid, redirect history...)
+AuthorizeFunc = Callable[[ClientSession], Awaitable[Any]]
+# factory(sess, authorize result) -> ready-to-use client
+ClientFactory = Callable[[ClientSession, Any], Any]
+
+
+class BrokerService:
+    name: str
+    authorize: AuthorizeFunc
+    factory: ClientFactory
+    # the api hosts of the service, used for token refreshing
+    hosts: tuple[str, ...]
+    # the api answers an expired token with a `code` in a json body, see TokenRefresher.register
+    sniff_body: bool
+
+    def __init__(self, name: str, authorize: AuthorizeFunc, factory: ClientFactory, hosts: Iterable[str] = (),
+                 sniff_body: bool = False):
+        self.name = name
+        self.authorize = authorize
+        self.factory = factory
+        self.hosts = tuple(hosts)
+        self.sniff_body = sniff_body
+
+
+def lazy(path: str, with_result: bool = True) -> Callable:
+    """
+    A callable importing its target on first call, so that the service modules (and their
+    pydantic models) are only loaded for the services in use.
+    :param path: "module:attribute", e.g. "nwpu.bus.bus_request:BusRequest"
+    :param with_result: pass the authorize result to a client factory, False for the clients built from the session only.
+    """
+    module, _, attribute = path.partition(':')
+
+    def call(*args):
+        target = importlib.import_module(module)
+        for name in attribute.split('.'):
+            target = getattr(target, name)
+        return target(*args) if with_result else target(args[0])
+
+    return call
+
+
+DEFAULT_SERVICES: Dict[str, BrokerService] = {
+    'bus': BrokerService('bus', lazy('nwpu.bus.bus_oa:BusOaRequest.authorize'),
+                         lazy('nwpu.bus.bus_request:BusRequest', with_result=False),
+                         ('hq-bus.nwpu.edu.cn',)),
+    'edu': BrokerService('edu', lazy('nwpu.edu.edu_oa:EduOaRequest.authorize'),
+                         lazy('nwpu.edu.edu_request:EduRequest', with_result=False),
+                         ('jwxt.nwpu.edu.cn',)),
+    'classroom': BrokerService('classroom', lazy('nwpu.classroom.classroom_oa:IdleClassroomOaRequest.authorize'),
+                               lazy('nwpu.classroom.classroom_request:IdleClassroomRequest'),
+                               ('idle-classroom.nwpu.edu.cn',)),
+    'ecampus': BrokerService('ecampus', lazy('nwpu.ecampus.ec_oa:ECampusOaRequest.authorize'),
+                             lazy('nwpu.ecampus.ec_request:ECampusRequest'),
+                             ('ecampus.nwpu.edu.cn', 'portal-service.nwpu.edu.cn', 'authx-service.nwpu.edu.cn'),
+                             sniff_body=True),
+    'market': BrokerService('market', lazy('nwpu.market.market_oa:MarketOaRequest.authorize'),
+                            lazy('nwpu.market.market_request:MarketRequest'),
+                            ('secondhand-market.nwpu.edu.cn',), sniff_body=True),
+    # the sid is part of the url of every mail request, so it cannot be refreshed transparently
+    'mail': BrokerService('mail', lazy('nwpu.mail.mail_oa:MailOaRequest.authorize'),
+                          lazy('nwpu.mail.mail_request:MailRequest')),
+}
+
+
+class SessionBroker:
+    """
+    Shares one CAS login between all the service clients.
+    The session of the given OaRequest should have finished one of the login flows
+    (password / qr / sms), so that the CAS cookies are in its cookie jar.
+    The service ticket exchanges are then run concurrently on the same session.
+    """
+    oa: OaRequest
+    services: Dict[str, BrokerService]
+    results: Dict[str, Any]
+    clients: Dict[str, Any]
+    cache: Optional[ResponseCache]
+
+    def __init__(self, oa: OaRequest, services: Optional[Iterable[str]] = None,
+                 cache: Optional[ResponseCache] = None):
+        """
+        :param oa:
+        :param services: the names of DEFAULT_SERVICES to use, all of them by default.
+        :param cache: shared by the clients which cache their reference data.
+        """
+        self.oa = oa
+        self.cache = cache
+        self.services = dict()
+        self.results = dict()
+        self.clients = dict()
+        for name in (services if services is not None else DEFAULT_SERVICES.keys()):
+            self.services[name] = DEFAULT_SERVICES[name]
+
+    @property
+    def sess(self) -> ClientSession:
+        return self.oa.sess
+
+    def register(self, name: str, authorize: AuthorizeFunc, factory: ClientFactory):
+        """
+        Register an extra service.
+        :param name: the key of the client in the result.
+        :param authorize: coroutine function doing the service ticket exchange on the session.
+        :param factory: builds the client from the session and the result of authorize.
+        :return: self
+        """
+        self.services[name] = BrokerService(name, authorize, factory)
+        return self
+
+    def _build(self, name: str, result: Any) -> Any:
+        client = self.services[name].factory(self.sess, result)
+        if self.cache is not None and hasattr(client, 'cache'):
+            client.cache = self.cache
+        return client
+
+    async def is_logged_in(self) -> bool:
+        """
+        Check whether the CAS session is still valid.
+        :return: True if the CAS login does not need to be performed again.
+        """
+        return not await self.oa.begin_login()
+
+    async def authorize(self, name: str) -> Any:
+        """
+        Run the service ticket exchange of a single service, and rebuild its client.
+        :param name: the registered name of the service.
+        :return: the client.
+        """
+        service = self.services[name]
+        result = await service.authorize(self.sess)
+        self.results[name] = result
+        self.clients[name] = self._build(name, result)
+        return self.clients[name]
+
+    def restore(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Rebuild the clients from previously obtained results (e.g. tokens loaded from a CredentialStore),
+        without running the service ticket exchanges.
+        :param results: authorize results keyed by service name.
+        :return: the clients, keyed by service name.
+        """
+        clients = dict()
+        for name, result in results.items():
+            if name in self.services:
+                self.results[name] = result
+                self.clients[name] = clients[name] = self._build(name, result)
+        return clients
+
+    @property
+    def tokens(self) -> Dict[str, str]:
+        """
+        The string results (X-Id-Tokens, Coremail sid) of the authorized services, suitable for storage.
+        """
+        return {name: result for name, result in self.results.items() if isinstance(result, str)}
+
+    def _refresh_func(self, name: str) -> Callable[[], Awaitable[Any]]:
+        service = self.services[name]
+        client = self.clients.get(name)
+
+        async def refresh():
+            # token clients update their own headers
+            if hasattr(client, 'get_token'):
+                result = await client.get_token()
+            else:
+                result = await service.authorize(self.sess)
+            self.results[name] = result
+            return result
+
+        return refresh
+
+    def attach_refresher(self, refresher: TokenRefresher) -> TokenRefresher:
+        """
+        Register the authorized clients to a TokenRefresher installed on the session,
+        so that expired tokens are refreshed with the matching authorize.
+        :param refresher:
+        :return: the refresher.
+        """
+        for name in self.clients.keys():
+            if self.services[name].hosts:
+                refresher.register(self.services[name].hosts, self._refresh_func(name),
+                                   self.services[name].sniff_body)
+        return refresher
+
+    async def authorize_all(self, *names: str) -> Dict[str, Any]:
+        """
+        Concurrently run the service ticket exchanges of the given services (all the registered ones by default).
+        :param names: the registered names of the services.
+        :return: the clients, keyed by service name.
+        """
+        names = names or tuple(self.services.keys())
+        clients = await asyncio.gather(*(self.authorize(name) for name in names))
+        return dict(zip(names, clients))
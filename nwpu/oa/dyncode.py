@@ -2,7 +2,7 @@ from typing import Optional, Any
 
 from pydantic import BaseModel, Field
 
-from utils.parse import generate_fake_browser_fingerprint
+from nwpu.utils.parse import generate_fake_browser_fingerprint
 
 class SmsLoginSendCodeRequest(BaseModel):
     """
@@ -28,7 +28,7 @@ class SmsLoginFormRequest(BaseModel):
     current_menu: int = Field(alias='currentMenu', default=2)
     #mfa_state: str = Field(alias='mfaState')
     geo_location: Optional[str] = Field(alias='geolocation', default='')
-    fingerprint: str = Field(alias='fpVisitorId', default=generate_fake_browser_fingerprint()[0])
+    fingerprint: str = Field(alias='fpVisitorId', default_factory=lambda: generate_fake_browser_fingerprint()[0])
     event_id: str = Field(alias='_eventId', default='submitPasswordlessToken')
     execution: str = Field(alias='execution', default='')
 
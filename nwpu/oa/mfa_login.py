@@ -0,0 +1,158 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from nwpu.oa.mfa import CheckMfaRequiredData, MfaInitResponse, MfaStatus, MfaVerifyMethod
+from nwpu.oa.oa_request import OaRequest
+from nwpu.oa.password import CheckMfaRequiredRequest, PasswordLoginFormRequest
+from nwpu.oa.pubkey import public_keys
+
+# code_callback(method) -> the verification code received through the channel (sms / email)
+CodeCallback = Callable[[MfaVerifyMethod], Awaitable[str]]
+
+MFA_FAILED_STATUSES = (MfaStatus.invalid, MfaStatus.cancel, MfaStatus.expired)
+
+
+class MfaOrchestrator:
+    """
+    Runs all the enabled mfa channels at the same time, resolves on the first verified one
+    and cancels the others.
+
+    App push needs no input and is polled until approved.
+    SMS and e-mail need the code_callback, which is awaited for the code once it has been sent;
+    without a callback only app push is used.
+
+    Usage:
+        async def ask_code(method: MfaVerifyMethod) -> str:
+            return await prompt(f'{method.name} code: ')
+
+        mfa = MfaOrchestrator(oa, ask_code)
+        redirects = await mfa.password_login('username', 'password', redirect_url)
+    """
+    oa: OaRequest
+    code_callback: Optional[CodeCallback]
+    methods: Optional[List[MfaVerifyMethod]]
+    poll_interval: float
+    timeout: float
+    max_attempts: int
+
+    def __init__(self, oa: OaRequest,
+                 code_callback: Optional[CodeCallback] = None,
+                 methods: Optional[Iterable[MfaVerifyMethod]] = None,
+                 poll_interval: float = 1.0,
+                 timeout: float = 300.0,
+                 max_attempts: int = 3):
+        """
+        :param oa:
+        :param code_callback: provides the codes sent by sms / e-mail.
+        :param methods: restrict the channels used, all the enabled ones by default.
+        :param poll_interval: seconds between two app push status checks.
+        :param timeout: seconds before giving up the whole verification.
+        :param max_attempts: how many codes may be tried per channel.
+        """
+        self.oa = oa
+        self.code_callback = code_callback
+        self.methods = list(methods) if methods is not None else None
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+
+    def enabled_methods(self, data: CheckMfaRequiredData) -> List[MfaVerifyMethod]:
+        """
+        The channels which will be started, from the mfa_type_* flags.
+        :param data:
+        :return:
+        """
+        methods = list()
+        if data.mfa_type_app_push:
+            methods.append(MfaVerifyMethod.app_push)
+        if self.code_callback is not None:
+            if data.mfa_type_secure_phone:
+                methods.append(MfaVerifyMethod.sms)
+            if data.mfa_type_secure_email:
+                methods.append(MfaVerifyMethod.email)
+        if self.methods is not None:
+            methods = [x for x in methods if x in self.methods]
+        return methods
+
+    async def _app_push(self, init: MfaInitResponse) -> bool:
+        await self.oa.mfa_send_app_push(init)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            status = (await self.oa.mfa_verify_app_push(init)).data.status
+            if status == MfaStatus.valid:
+                return True
+            if status in MFA_FAILED_STATUSES:
+                return False
+
+    async def _code(self, method: MfaVerifyMethod, init: MfaInitResponse) -> bool:
+        if method == MfaVerifyMethod.sms:
+            send, verify = self.oa.mfa_send_sms, self.oa.mfa_verify_sms
+        else:
+            send, verify = self.oa.mfa_send_email, self.oa.mfa_verify_email
+        await send(init)
+        for _ in range(self.max_attempts):
+            code = await self.code_callback(method)
+            status = (await verify(init, code)).data.status
+            if status == MfaStatus.valid:
+                return True
+            if status in (MfaStatus.cancel, MfaStatus.expired):
+                return False
+        return False
+
+    async def _channel(self, method: MfaVerifyMethod, state: str) -> bool:
+        init = await self.oa.begin_mfa(method, state)
+        if method == MfaVerifyMethod.app_push:
+            return await self._app_push(init)
+        return await self._code(method, init)
+
+    async def verify(self, data: CheckMfaRequiredData) -> MfaVerifyMethod:
+        """
+        Run the enabled channels concurrently.
+        :param data: CheckMfaRequiredResponse.data
+        :return: the channel which verified first.
+        :raise ValueError: if no channel is usable or all of them failed.
+        :raise asyncio.TimeoutError: if nothing was verified within timeout.
+        """
+        methods = self.enabled_methods(data)
+        if not methods:
+            raise ValueError("No usable mfa method.")
+
+        tasks: Dict[asyncio.Future, MfaVerifyMethod] = {
+            asyncio.ensure_future(self._channel(method, data.state)): method for method in methods}
+        errors = list()
+        try:
+            pending = set(tasks.keys())
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline - loop.time(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError("Mfa verification timed out.")
+                for task in done:
+                    if task.exception() is not None:
+                        errors.append(task.exception())
+                    elif task.result():
+                        return tasks[task]
+            raise ValueError(f"All mfa methods failed: {errors}")
+        finally:
+            for task in tasks.keys():
+                task.cancel()
+            await asyncio.gather(*tasks.keys(), return_exceptions=True)
+
+    async def password_login(self, username: str, password: str, redirect_url: str = '') -> list:
+        """
+        Full password login, going through mfa when required.
+        :param username:
+        :param password: the plain password.
+        :param redirect_url: the redirect url of the targeted application.
+        :return: The redirect history.
+        """
+        await self.oa.begin_login(redirect_url)
+        password = await public_keys.process_password(self.oa, password)
+        mfa = await self.oa.password_init(CheckMfaRequiredRequest(username=username, password=password))
+        if mfa.data.mfa_required:
+            await self.verify(mfa.data)
+        return await self.oa.finish_password_login(
+            PasswordLoginFormRequest(username=username, password=password, mfa_state=mfa.data.state),
+            redirect_url)
@@ -8,9 +8,11 @@ from nwpu.oa.mfa import CheckMfaRequiredResponse, MfaVerifyMethod, MfaInitRespon
     MfaCheckAppPushStatusResponse, MfaSendSmsResponse, MfaVerifySmsResponse, MfaVerifyMailResponse, MfaSendMailResponse
 from nwpu.oa.password import CheckMfaRequiredRequest, PasswordLoginFormRequest
 from nwpu.oa.qrcode import QrInitResponse, QrLoginFormRequest, QrCometResponse
-from nwpu.utils.common import DEFAULT_HEADER, timestamp_mill
+from nwpu.utils.common import timestamp_mill
 from nwpu.utils.parse import StringArgsBuilder, find_tracer_id
-from oa.dyncode import SmsLoginSendCodeRequest, SmsLoginSendCodeResponse, SmsLoginFormRequest
+from nwpu.oa.dyncode import SmsLoginSendCodeRequest, SmsLoginSendCodeResponse, SmsLoginFormRequest
+from nwpu.utils.decode import parse_response
+from nwpu.utils.metrics import register_endpoints
 
 
 class OaRequestUrl:
@@ -26,6 +28,9 @@ class OaRequestUrl:
     OA_MFA_INIT = "https://uis.nwpu.edu.cn/cas/mfa/initByType"
 
 
+register_endpoints(OaRequestUrl)
+
+
 class OaRequest:
     sess: ClientSession
     tracer_id: str
@@ -44,7 +49,6 @@ class OaRequest:
         """
         resp = await self.sess.get(
             OaRequestUrl.OA_LOGIN + (('?service=' + redirect_url) if redirect_url != '' else ''),
-            headers=DEFAULT_HEADER,
             allow_redirects=True)
         # if the user has not logged in.
         if not resp.history:
@@ -57,7 +61,7 @@ class OaRequest:
         Get the RSA PCKS1-1.5 public key.
         :return: the public key.
         """
-        resp = await self.sess.get(OaRequestUrl.OA_PUBLIC_KEY, headers=DEFAULT_HEADER)
+        resp = await self.sess.get(OaRequestUrl.OA_PUBLIC_KEY)
         return await resp.text()
 
     async def qr_init(self) -> QrInitResponse:
@@ -65,8 +69,8 @@ class OaRequest:
         Initialize the QR code login.
         :return:
         """
-        resp = await self.sess.post(OaRequestUrl.OA_QR_INIT, headers=DEFAULT_HEADER)
-        return QrInitResponse(**await resp.json())
+        resp = await self.sess.post(OaRequestUrl.OA_QR_INIT)
+        return await parse_response(resp, QrInitResponse)
 
     async def qr_get_image(self) -> bytes:
         """
@@ -78,7 +82,6 @@ class OaRequest:
             StringArgsBuilder(OaRequestUrl.OA_QR_IMAGE)
                 .add_param('r', str(ts_mill))
                 .build(),
-            headers=DEFAULT_HEADER,
         )
         return await resp.read()
 
@@ -87,8 +90,8 @@ class OaRequest:
         Probes the state of the QR code scanning.
         :return:
         """
-        resp = await self.sess.post(OaRequestUrl.OA_QR_COMET, headers=DEFAULT_HEADER)
-        return QrCometResponse(**await resp.json())
+        resp = await self.sess.post(OaRequestUrl.OA_QR_COMET)
+        return await parse_response(resp, QrCometResponse)
 
     async def password_init(self, form_data: CheckMfaRequiredRequest) -> CheckMfaRequiredResponse:
         """
@@ -99,10 +102,9 @@ class OaRequest:
         data = form_data.model_dump(by_alias=True)
         resp = await self.sess.post(
             OaRequestUrl.OA_PWD_DETECT,
-            headers=DEFAULT_HEADER,
             data=data,
         )
-        return CheckMfaRequiredResponse(**await resp.json())
+        return await parse_response(resp, CheckMfaRequiredResponse)
 
     async def sms_init(self, req: SmsLoginSendCodeRequest) -> SmsLoginSendCodeResponse:
         """
@@ -113,9 +115,8 @@ class OaRequest:
         data = req.model_dump(by_alias=True)
         resp = await self.sess.post(
             OaRequestUrl.OA_SMS_SEND,
-            headers=DEFAULT_HEADER,
             data=data,)
-        return SmsLoginSendCodeResponse(**await resp.json())
+        return await parse_response(resp, SmsLoginSendCodeResponse)
 
 
     async def finish_qr_login(self, form_data: QrLoginFormRequest, redirect_url ='') -> list[URL]:
@@ -134,7 +135,6 @@ class OaRequest:
             StringArgsBuilder(OaRequestUrl.OA_LOGIN)
                 .add_param('service', redirect_url)
                 .build(),
-            headers=DEFAULT_HEADER,
             data=data,
             allow_redirects=True
         )
@@ -158,7 +158,6 @@ class OaRequest:
 
         resp = await self.sess.post(
             OaRequestUrl.OA_LOGIN + (('?service=' + redirect_url) if redirect_url != '' else ''),
-            headers=DEFAULT_HEADER,
             allow_redirects=True,
             data=data)
 
@@ -174,7 +173,6 @@ class OaRequest:
 
         resp = await self.sess.post(
             OaRequestUrl.OA_LOGIN + (('?service=' + redirect_url) if redirect_url != '' else ''),
-            headers=DEFAULT_HEADER,
             allow_redirects=True,
             data=data)
 
@@ -185,11 +183,10 @@ class OaRequest:
 
     async def begin_mfa(self, mfa_type: MfaVerifyMethod, mfa_state: str) -> MfaInitResponse:
         resp = await self.sess.get(
-            OaRequestUrl.OA_MFA_INIT + '/' + mfa_type.value + '?state=' + mfa_state,
-            headers=DEFAULT_HEADER,)
+            OaRequestUrl.OA_MFA_INIT + '/' + mfa_type.value + '?state=' + mfa_state)
 
         print(await resp.text())
-        return MfaInitResponse(**await resp.json())
+        return await parse_response(resp, MfaInitResponse)
 
     async def mfa_send_app_push(self, mfa_init_response: MfaInitResponse) -> MfaSendAppPushResponse:
         attest_url = mfa_init_response.data.attest_server_url
@@ -197,10 +194,9 @@ class OaRequest:
 
         resp = await self.sess.post(
             attest_url + '/api/guard/apppush/send',
-            headers=DEFAULT_HEADER,
             json={'gid': gid})
 
-        return MfaSendAppPushResponse(**await resp.json())
+        return await parse_response(resp, MfaSendAppPushResponse)
 
     async def mfa_verify_app_push(self, mfa_init_response: MfaInitResponse) -> MfaCheckAppPushStatusResponse:
         attest_url = mfa_init_response.data.attest_server_url
@@ -208,10 +204,9 @@ class OaRequest:
 
         resp = await self.sess.post(
             attest_url + '/api/guard/apppush/status',
-            headers=DEFAULT_HEADER,
             json={'gid': gid})
 
-        return MfaCheckAppPushStatusResponse(**await resp.json())
+        return await parse_response(resp, MfaCheckAppPushStatusResponse)
 
 
     async def mfa_send_sms(self, mfa_init_response: MfaInitResponse) -> MfaSendAppPushResponse:
@@ -220,10 +215,9 @@ class OaRequest:
 
         resp = await self.sess.post(
             attest_url + '/api/guard/securephone/send',
-            headers=DEFAULT_HEADER,
             json={'gid': gid})
 
-        return MfaSendSmsResponse(**await resp.json())
+        return await parse_response(resp, MfaSendSmsResponse)
 
     async def mfa_verify_sms(self, mfa_init_response: MfaInitResponse, verify_code: str) -> MfaVerifySmsResponse:
         attest_url = mfa_init_response.data.attest_server_url
@@ -231,10 +225,9 @@ class OaRequest:
 
         resp = await self.sess.post(
             attest_url + '/api/guard/securephone/valid',
-            headers=DEFAULT_HEADER,
             json={'gid': gid, 'code': verify_code})
 
-        return MfaVerifySmsResponse(**await resp.json())
+        return await parse_response(resp, MfaVerifySmsResponse)
 
     async def mfa_send_email(self, mfa_init_response: MfaInitResponse) -> MfaSendMailResponse:
         attest_url = mfa_init_response.data.attest_server_url
@@ -242,10 +235,9 @@ class OaRequest:
 
         resp = await self.sess.post(
             attest_url + '/api/guard/secureemail/send',
-            headers=DEFAULT_HEADER,
             json={'gid': gid})
 
-        return MfaSendMailResponse(**await resp.json())
+        return await parse_response(resp, MfaSendMailResponse)
 
     async def mfa_verify_email(self, mfa_init_response: MfaInitResponse, verify_code: str) -> MfaVerifyMailResponse:
 
@@ -254,7 +246,6 @@ class OaRequest:
 
         resp = await self.sess.post(
             attest_url + '/api/guard/secureemail/valid',
-            headers=DEFAULT_HEADER,
             json={'gid': gid, 'code': verify_code})
 
-        return MfaVerifyMailResponse(**await resp.json())
\ No newline at end of file
+        return await parse_response(resp, MfaVerifyMailResponse)
\ No newline at end of file
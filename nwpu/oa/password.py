@@ -25,7 +25,7 @@ class PasswordLoginFormRequest(BaseModel):
     current_menu: int = Field(alias='currentMenu', default=1)
     mfa_state: str = Field(alias='mfaState')
     geo_location: Optional[str] = Field(alias='geolocation', default='')
-    fingerprint: str = Field(alias='fpVisitorId', default=generate_fake_browser_fingerprint()[0])
+    fingerprint: str = Field(alias='fpVisitorId', default_factory=lambda: generate_fake_browser_fingerprint()[0])
     event_id: str = Field(alias='_eventId', default='submit')
     execution: str = Field(alias='execution', default='')
 
@@ -0,0 +1,252 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from aiohttp import ClientSession, TCPConnector
+
+from nwpu.oa.oa_request import OaRequest
+from nwpu.oa.password import CheckMfaRequiredRequest, PasswordLoginFormRequest
+from nwpu.oa.pubkey import public_keys
+from nwpu.utils.client import create_connector, create_session
+
+
+class PoolAccount:
+    username: str
+    password: str
+    sess: Optional[ClientSession]
+    oa: Optional[OaRequest]
+    logged_in: bool
+    healthy: bool
+    in_use: bool
+    # loop time before which the account must not be handed out again
+    next_available: float
+    login_failures: int
+    last_error: Optional[BaseException]
+
+    def __init__(self, username: str, password: str):
+        self.username = username
+        self.password = password
+        self.sess = None
+        self.oa = None
+        self.logged_in = False
+        self.healthy = False
+        self.in_use = False
+        self.next_available = 0.0
+        self.login_failures = 0
+        self.last_error = None
+
+    @property
+    def available(self) -> bool:
+        return self.logged_in and self.healthy and not self.in_use
+
+
+# login(oa, account) -> True if logged in
+LoginFunc = Callable[[OaRequest, PoolAccount], Awaitable[bool]]
+# health_check(account) -> True if the account can still be used
+HealthCheckFunc = Callable[[PoolAccount], Awaitable[bool]]
+
+
+async def password_login(oa: OaRequest, account: PoolAccount, redirect_url: str = '') -> bool:
+    """
+    Default login of the pool: password login, without mfa.
+    :param oa:
+    :param account:
+    :param redirect_url:
+    :return: False if the account requires mfa.
+    """
+    await oa.begin_login(redirect_url)
+    password = await public_keys.process_password(oa, account.password)
+    mfa = await oa.password_init(CheckMfaRequiredRequest(username=account.username, password=password))
+    if mfa.data.mfa_required:
+        return False
+    await oa.finish_password_login(
+        PasswordLoginFormRequest(username=account.username, password=password, mfa_state=mfa.data.state),
+        redirect_url)
+    return not await oa.begin_login()
+
+
+async def cas_health_check(account: PoolAccount) -> bool:
+    """
+    Default health check of the pool: the CAS session is still logged in.
+    """
+    return not await account.oa.begin_login()
+
+
+class AccountPool:
+    """
+    Holds many authenticated identities, each with its own session and cookie jar.
+    The sessions share one connector, so the connections to the campus hosts are reused.
+
+    CAS logins run concurrently, bounded by max_concurrent_logins.
+    Every account is handed out at most once per min_interval seconds.
+
+    Usage:
+        pool = AccountPool(max_concurrent_logins=4, min_interval=0.5)
+        pool.add('2020000001', 'password')
+        await pool.login_all()
+        async with pool.use() as account:
+            ecampus = ECampusRequest(account.sess, await ECampusOaRequest.authorize(account.sess))
+    """
+    accounts: Dict[str, PoolAccount]
+    login: LoginFunc
+    health_check: HealthCheckFunc
+    min_interval: float
+    max_login_failures: int
+
+    def __init__(self,
+                 login: LoginFunc = password_login,
+                 health_check: HealthCheckFunc = cas_health_check,
+                 max_concurrent_logins: int = 4,
+                 min_interval: float = 0.0,
+                 max_login_failures: int = 3,
+                 connector: Optional[TCPConnector] = None):
+        self.accounts = dict()
+        self.login = login
+        self.health_check = health_check
+        self.min_interval = min_interval
+        self.max_login_failures = max_login_failures
+        self._connector = connector
+        self._login_semaphore = asyncio.Semaphore(max_concurrent_logins)
+        self._condition = asyncio.Condition()
+
+    def add(self, username: str, password: str) -> PoolAccount:
+        account = PoolAccount(username, password)
+        self.accounts[username] = account
+        return account
+
+    def _session(self, account: PoolAccount) -> ClientSession:
+        if account.sess is None:
+            if self._connector is None:
+                self._connector = create_connector()
+            # DEFAULT_HEADER and the host limits at session level, the connector is not owned
+            account.sess = create_session(connector=self._connector)
+            account.oa = OaRequest(account.sess)
+        return account.sess
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def login_account(self, account: PoolAccount) -> bool:
+        """
+        Log in a single account, waiting for a free login slot.
+        :param account:
+        :return: True if logged in.
+        """
+        self._session(account)
+        async with self._login_semaphore:
+            try:
+                account.logged_in = await self.login(account.oa, account)
+                account.last_error = None
+            except Exception as e:
+                account.logged_in = False
+                account.last_error = e
+        account.healthy = account.logged_in
+        account.login_failures = 0 if account.logged_in else account.login_failures + 1
+        await self._notify()
+        return account.logged_in
+
+    async def login_all(self) -> Dict[str, bool]:
+        """
+        Log in all the accounts which are not logged in yet.
+        :return: the login results, keyed by username.
+        """
+        pending = [x for x in self.accounts.values()
+                   if not x.logged_in and x.login_failures < self.max_login_failures]
+        results = await asyncio.gather(*(self.login_account(x) for x in pending))
+        return {x.username: result for x, result in zip(pending, results)}
+
+    async def check_health(self, relogin: bool = True) -> Dict[str, bool]:
+        """
+        Run the health check on every idle logged-in account.
+        An account is held like an acquired one during its check (and its relogin),
+        acquire does not hand it out meanwhile.
+        :param relogin: log in again the accounts which failed the check.
+        :return: the check results, keyed by username.
+        """
+        async def check(account: PoolAccount) -> bool:
+            try:
+                try:
+                    account.healthy = await self.health_check(account)
+                except Exception as e:
+                    account.healthy = False
+                    account.last_error = e
+                if not account.healthy:
+                    account.logged_in = False
+                    if relogin:
+                        return await self.login_account(account)
+                return account.healthy
+            finally:
+                account.in_use = False
+                await self._notify()
+
+        async with self._condition:
+            idle = [x for x in self.accounts.values() if x.logged_in and not x.in_use]
+            for account in idle:
+                account.in_use = True
+        results = await asyncio.gather(*(check(x) for x in idle))
+        return {x.username: result for x, result in zip(idle, results)}
+
+    async def run_health_checks(self, interval: float):
+        """
+        Periodically check the health of the accounts, until cancelled.
+        :param interval: seconds between two checks.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.check_health()
+
+    async def acquire(self) -> PoolAccount:
+        """
+        Take the least recently used available account, waiting until one is released if needed.
+        The account must be given back with release.
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while True:
+                candidates = [x for x in self.accounts.values() if x.available]
+                if candidates:
+                    break
+                if not any(x.logged_in and x.healthy for x in self.accounts.values()):
+                    raise RuntimeError("No healthy account in the pool.")
+                await self._condition.wait()
+            account = min(candidates, key=lambda x: x.next_available)
+            account.in_use = True
+        delay = account.next_available - loop.time()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # cancelled while waiting for the rate limit, the account is given back
+                account.in_use = False
+                await self._notify()
+                raise
+        account.next_available = loop.time() + self.min_interval
+        return account
+
+    async def release(self, account: PoolAccount, healthy: bool = True):
+        """
+        Give back an account.
+        :param account:
+        :param healthy: False if the caller detected that the account is no longer usable.
+        """
+        account.in_use = False
+        if not healthy:
+            account.healthy = False
+        await self._notify()
+
+    @asynccontextmanager
+    async def use(self) -> AsyncIterator[PoolAccount]:
+        account = await self.acquire()
+        try:
+            yield account
+        finally:
+            await self.release(account)
+
+    async def close(self):
+        for account in self.accounts.values():
+            if account.sess is not None:
+                await account.sess.close()
+        if self._connector is not None:
+            await self._connector.close()
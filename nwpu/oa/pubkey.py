@@ -0,0 +1,98 @@
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Iterable, List, Optional
+
+from nwpu.oa.oa_request import OaRequest
+from nwpu.utils.crypto import process_password, public_key_fingerprint
+
+
+class PublicKeyManager:
+    """
+    Caches the CAS RSA public key, so that it is fetched once per ttl instead of once per login.
+    The RSA encryption runs in an executor, so bulk logins do not block the event loop.
+    An instance can be used from successive event loops (e.g. one asyncio.run per command),
+    its lock is created for the running loop.
+    """
+    ttl: float
+    pinned_fingerprint: Optional[str]
+    public_key: Optional[str]
+    fingerprint: Optional[str]
+
+    def __init__(self, ttl: float = 3600.0,
+                 pinned_fingerprint: Optional[str] = None,
+                 executor: Optional[Executor] = None):
+        """
+        :param ttl: seconds before the key is fetched again.
+        :param pinned_fingerprint: if set, a fetched key whose fingerprint differs is rejected.
+        :param executor: where the RSA work runs, the default executor of the loop if None.
+        """
+        self.ttl = ttl
+        self.pinned_fingerprint = pinned_fingerprint
+        self.public_key = None
+        self.fingerprint = None
+        self._executor = executor
+        # time.monotonic(), the clock of the loops
+        self._expires_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        # an asyncio.Lock is bound to the loop it was first contended on
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def invalidate(self):
+        """
+        Force the key to be fetched again, e.g. after a login failed because of the password encryption.
+        """
+        self._expires_at = 0.0
+
+    async def get(self, oa: OaRequest) -> str:
+        """
+        Get the public key, fetching it through the given OaRequest when missing or expired.
+        :param oa:
+        :return: the PEM public key.
+        :raise ValueError: if the fingerprint does not match pinned_fingerprint.
+        """
+        async with self._get_lock():
+            if self.public_key is None or time.monotonic() >= self._expires_at:
+                public_key = await oa.get_public_key()
+                fingerprint = public_key_fingerprint(public_key)
+                if self.pinned_fingerprint is not None and fingerprint != self.pinned_fingerprint:
+                    raise ValueError(f"Unexpected public key fingerprint: {fingerprint}")
+                self.public_key = public_key
+                self.fingerprint = fingerprint
+                self._expires_at = time.monotonic() + self.ttl
+        return self.public_key
+
+    async def process_password(self, oa: OaRequest, password: str) -> str:
+        """
+        Same as nwpu.utils.crypto.process_password, with the cached key, off the event loop.
+        :param oa:
+        :param password: the plain password.
+        :return: the password to be sent to the login form.
+        """
+        public_key = await self.get(oa)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, process_password, password, public_key)
+
+    async def process_passwords(self, oa: OaRequest, passwords: Iterable[str]) -> List[str]:
+        """
+        Encrypt many passwords concurrently.
+        :param oa:
+        :param passwords:
+        :return: the processed passwords, in order.
+        """
+        public_key = await self.get(oa)
+        loop = asyncio.get_running_loop()
+        return list(await asyncio.gather(*(
+            loop.run_in_executor(self._executor, process_password, password, public_key)
+            for password in passwords)))
+
+
+# shared by the login helpers of the package
+public_keys = PublicKeyManager()
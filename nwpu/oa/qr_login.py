@@ -0,0 +1,134 @@
+import asyncio
+from enum import Enum
+from typing import AsyncIterator, List, Optional
+
+from pydantic import BaseModel, Field
+from yarl import URL
+
+from nwpu.oa.oa_request import OaRequest
+from nwpu.oa.qrcode import QrLoginFormRequest, QrStatus
+from nwpu.utils.parse import generate_fake_browser_fingerprint
+
+
+class QrLoginEventType(str, Enum):
+    image = "image"  # a new qr code is ready to be displayed
+    scanned = "scanned"  # scanned on the mobile app, waiting for confirmation
+    valid = "valid"  # confirmed on the mobile app
+    expired = "expired"  # the qr code has expired, a new one will follow
+    cancelled = "cancelled"  # cancelled on the mobile app, the login ends
+    finished = "finished"  # the login has finished, redirects are available
+
+
+class QrLoginEvent(BaseModel):
+    type: QrLoginEventType
+    state_key: str
+    status: Optional[QrStatus] = None
+    # the png image, for QrLoginEventType.image
+    image: Optional[bytes] = None
+    # the redirect history, for QrLoginEventType.finished
+    redirects: List[URL] = Field(default_factory=list)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class QrLoginDriver:
+    """
+    Drives the QR code login, yielding the state transitions as events.
+
+    The comet endpoint is a long poll: when the server holds the request, it is sent again right away;
+    when the server answers immediately, the polling backs off exponentially up to max_delay
+    (min_delay only after the code has been scanned, to finish quickly once confirmed).
+
+    Usage:
+        async for event in QrLoginDriver(oa, redirect_url).events():
+            if event.type == QrLoginEventType.image:
+                show(event.image)
+            elif event.type == QrLoginEventType.finished:
+                redirects = event.redirects
+    """
+    oa: OaRequest
+    redirect_url: str
+    max_refreshes: int
+    min_delay: float
+    max_delay: float
+    long_poll_threshold: float
+
+    def __init__(self, oa: OaRequest, redirect_url: str = '',
+                 max_refreshes: int = 3,
+                 min_delay: float = 0.2,
+                 max_delay: float = 3.0,
+                 long_poll_threshold: float = 1.0):
+        """
+        :param oa:
+        :param redirect_url: the redirect url of the targeted application.
+        :param max_refreshes: how many times an expired qr code is replaced before giving up.
+        :param min_delay: the shortest delay between two polls, in seconds.
+        :param max_delay: the longest delay between two polls, in seconds.
+        :param long_poll_threshold: a comet answer slower than this (seconds) is considered held by the server.
+        """
+        self.oa = oa
+        self.redirect_url = redirect_url
+        self.max_refreshes = max_refreshes
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.long_poll_threshold = long_poll_threshold
+
+    def __aiter__(self) -> AsyncIterator[QrLoginEvent]:
+        return self.events()
+
+    async def _poll(self, state_key: str, status: Optional[QrStatus]) -> AsyncIterator[QrStatus]:
+        """
+        Poll the comet endpoint, yielding every status change.
+        """
+        loop = asyncio.get_running_loop()
+        delay = self.min_delay
+        while True:
+            start = loop.time()
+            comet = await self.oa.qr_comet()
+            elapsed = loop.time() - start
+            current = comet.data.qr_code.status if comet.data is not None else QrStatus.expired
+
+            if current != status:
+                status = current
+                delay = self.min_delay
+                yield status
+
+            if elapsed < self.long_poll_threshold:
+                await asyncio.sleep(delay)
+                cap = self.min_delay if status == QrStatus.scanned else self.max_delay
+                delay = min(delay * 2, cap)
+
+    async def events(self) -> AsyncIterator[QrLoginEvent]:
+        """
+        Run the login.
+        :return: async iterator of the events, ending after finished / cancelled,
+        or after the qr code has expired more than max_refreshes times.
+        """
+        await self.oa.begin_login(self.redirect_url)
+
+        for _ in range(self.max_refreshes + 1):
+            init = await self.oa.qr_init()
+            state_key = init.data.state_key
+            yield QrLoginEvent(type=QrLoginEventType.image,
+                               state_key=state_key,
+                               status=init.data.qr_code.status,
+                               image=await self.oa.qr_get_image())
+
+            async for status in self._poll(state_key, init.data.qr_code.status):
+                if status == QrStatus.scanned:
+                    yield QrLoginEvent(type=QrLoginEventType.scanned, state_key=state_key, status=status)
+                elif status == QrStatus.valid:
+                    yield QrLoginEvent(type=QrLoginEventType.valid, state_key=state_key, status=status)
+                    form = QrLoginFormRequest(qr_state_key=state_key,
+                                              fingerprint=generate_fake_browser_fingerprint()[0])
+                    redirects = await self.oa.finish_qr_login(form, self.redirect_url)
+                    yield QrLoginEvent(type=QrLoginEventType.finished, state_key=state_key,
+                                       status=status, redirects=redirects)
+                    return
+                elif status == QrStatus.cancel:
+                    yield QrLoginEvent(type=QrLoginEventType.cancelled, state_key=state_key, status=status)
+                    return
+                elif status in (QrStatus.expired, QrStatus.invalid):
+                    yield QrLoginEvent(type=QrLoginEventType.expired, state_key=state_key, status=status)
+                    break
@@ -0,0 +1,318 @@
+import hashlib
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Type, TypeVar
+
+from aiohttp import ClientSession
+from pydantic import BaseModel
+from yarl import URL
+
+from nwpu.utils.decode import _utf8, parse_response, validate_json
+from nwpu.utils.metrics import endpoint_name
+from nwpu.utils.parse import decode_jwt_payload
+
+T = TypeVar('T', bound=BaseModel)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# seconds a response stays fresh, by endpoint tag; the endpoints not listed are not cached
+DEFAULT_TTLS: Dict[str, int] = {
+    'IdleClassroomUrl.CLASSROOM_ALL_CAMPUS': 7 * DAY,
+    'IdleClassroomUrl.CLASSROOM_TEACHING_BUILDINGS': 7 * DAY,
+    'IdleClassroomUrl.CLASSROOM_TEACHING_WEEKS': DAY,
+    'IdleClassroomUrl.CLASSROOM_ROOM_TYPES': 7 * DAY,
+    'IdleClassroomUrl.CLASSROOM_SEAT_CODES': 7 * DAY,
+    'MarketUrls.MARKET_ITEM_CLASSIFICATION': DAY,
+    'MarketUrls.MARKET_CAMPUS_INFO': 7 * DAY,
+    'MarketUrls.MARKET_COMPLAINT_TYPE': 7 * DAY,
+    'ECampusUrl.NEWS_FEED_COLUMN_LIST': DAY,
+    'ECampusUrl.USER_EVENT_CALENDAR': HOUR,
+}
+
+# endpoints answering per user, cached under the identity of the client
+USER_SCOPED: FrozenSet[str] = frozenset({
+    'ECampusUrl.NEWS_FEED_COLUMN_LIST',
+    'ECampusUrl.USER_EVENT_CALENDAR',
+})
+
+# jwt claims naming the user, in order of preference
+IDENTITY_CLAIMS = ('sub', 'username', 'user_name', 'uid', 'userId')
+
+
+def token_identity(token: Optional[str]) -> Optional[str]:
+    """
+    The identity of the user of a service token, to scope the cache entries.
+    :param token: the X-Id-Token of a client.
+    :return: the user claim of the JWT, else a hash of the token, None without a token.
+    """
+    if not token:
+        return None
+    try:
+        claims = decode_jwt_payload(token)
+        for claim in IDENTITY_CLAIMS:
+            if claims.get(claim):
+                return str(claims[claim])
+    except (IndexError, TypeError, ValueError):
+        pass
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class CacheEntry:
+    body: bytes  # utf-8 json
+    expires_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    def __init__(self, body: bytes, expires_at: float, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.body = body
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def fresh(self) -> bool:
+        return self.expires_at > time.time()
+
+
+class CacheBackend:
+    """
+    Storage of the cache entries, keyed by string.
+    """
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CacheEntry):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Least recently used entries are evicted past max_entries.
+    """
+    max_entries: int
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: CacheEntry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Entries kept on disk, shared by the runs of the jobs.
+    The stale entries are kept, for revalidation, until purge() is called.
+    """
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, body BLOB NOT NULL, expires_at REAL NOT NULL, '
+                         'etag TEXT, last_modified TEXT)')
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self._db.execute('SELECT body, expires_at, etag, last_modified FROM responses WHERE key = ?',
+                               (key,)).fetchone()
+        return CacheEntry(*row) if row is not None else None
+
+    def set(self, key: str, entry: CacheEntry):
+        self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                         (key, entry.body, entry.expires_at, entry.etag, entry.last_modified))
+        self._db.commit()
+
+    def delete(self, key: str):
+        self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+        self._db.commit()
+
+    def clear(self):
+        self._db.execute('DELETE FROM responses')
+        self._db.commit()
+
+    def purge(self, older_than: float = 0.0):
+        """
+        Delete the entries expired for more than older_than seconds.
+        """
+        self._db.execute('DELETE FROM responses WHERE expires_at < ?', (time.time() - older_than,))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def _cacheable(result: BaseModel) -> bool:
+    # the campus apis answer errors with a 200 and no data
+    return getattr(result, 'data', True) is not None and getattr(result, 'success', True) is not False
+
+
+class ResponseCache:
+    """
+    Cache of the reference data responses: campuses, buildings, dictionaries...
+    The entries are looked up in memory, then on disk if a disk backend is given. A stale entry
+    carrying an ETag / Last-Modified is revalidated with a conditional request, a 304 refreshes it.
+
+    Usage:
+        cache = ResponseCache(disk=SQLiteBackend('cache.db'))
+        classroom = IdleClassroomRequest(sess, token, cache=cache)
+        await classroom.get_all_campus()  # requested once a week
+    """
+    memory: MemoryBackend
+    disk: Optional[CacheBackend]
+    ttls: Dict[str, int]
+    user_scoped: FrozenSet[str]
+    cacheable: Callable[[BaseModel], bool]
+    hits: int
+    misses: int
+    revalidations: int
+
+    def __init__(self,
+                 disk: Optional[CacheBackend] = None,
+                 max_entries: int = 1024,
+                 ttls: Optional[Dict[str, int]] = None,
+                 user_scoped: Iterable[str] = USER_SCOPED,
+                 cacheable: Callable[[BaseModel], bool] = _cacheable):
+        """
+        :param disk: a second level, e.g. SQLiteBackend.
+        :param max_entries: of the memory level.
+        :param ttls: endpoint tag -> seconds, defaults to DEFAULT_TTLS.
+        :param user_scoped: the endpoint tags whose entries are kept per user.
+        :param cacheable: whether a validated response may be cached, by default the responses with data.
+        """
+        self.memory = MemoryBackend(max_entries)
+        self.disk = disk
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.user_scoped = frozenset(user_scoped)
+        self.cacheable = cacheable
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    @staticmethod
+    def key(url: URL, scope: Optional[str]) -> str:
+        return f"{scope or ''}|{url.with_query(sorted(url.query.items()))}"
+
+    def _get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.set(key, entry)
+        return entry
+
+    def _set(self, key: str, entry: CacheEntry):
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            self.disk.set(key, entry)
+
+    def invalidate(self, url: str | URL, params: Optional[Dict[str, Any]] = None, identity: Optional[str] = None):
+        url = URL(url).update_query(params or {})
+        key = self.key(url, identity if endpoint_name(url) in self.user_scoped else None)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    async def get(self,
+                  sess: ClientSession,
+                  url: str,
+                  model: Type[T],
+                  identity: Optional[str] = None,
+                  content_type: Optional[str] = 'application/json',
+                  params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None) -> T:
+        """
+        GET and validate a json response, through the cache when the endpoint has a ttl.
+        :param sess:
+        :param url:
+        :param model: the response model.
+        :param identity: the user of the client, required to cache the user scoped endpoints.
+        :param content_type: see parse_response.
+        :param params: query params.
+        :param headers:
+        :return: the validated model.
+        """
+        full_url = URL(url).update_query(params or {})
+        tag = endpoint_name(full_url)
+        ttl = self.ttls.get(tag)
+        user_scoped = tag in self.user_scoped
+        if ttl is None or (user_scoped and identity is None):
+            resp = await sess.get(url, params=params, headers=headers)
+            return await parse_response(resp, model, content_type)
+
+        key = self.key(full_url, identity if user_scoped else None)
+        entry = self._get(key)
+        if entry is not None and entry.fresh:
+            self.hits += 1
+            return validate_json(model, entry.body)
+
+        headers = dict(headers or {})
+        if entry is not None and entry.etag is not None:
+            headers['If-None-Match'] = entry.etag
+        if entry is not None and entry.last_modified is not None:
+            headers['If-Modified-Since'] = entry.last_modified
+        resp = await sess.get(url, params=params, headers=headers)
+        if resp.status == 304 and entry is not None:
+            resp.release()
+            self.revalidations += 1
+            entry.expires_at = time.time() + ttl
+            self._set(key, entry)
+            return validate_json(model, entry.body)
+
+        self.misses += 1
+        result = await parse_response(resp, model, content_type)
+        if resp.status == 200 and self.cacheable(result):
+            body = _utf8(resp, await resp.read())
+            self._set(key, CacheEntry(body.encode() if isinstance(body, str) else body,
+                                      time.time() + ttl,
+                                      resp.headers.get('ETag'),
+                                      resp.headers.get('Last-Modified')))
+        return result
+
+
+async def cached_get(sess: ClientSession,
+                     url: str,
+                     model: Type[T],
+                     cache: Optional[ResponseCache] = None,
+                     identity: Optional[str] = None,
+                     headers: Optional[Dict[str, str]] = None) -> T:
+    """
+    GET and validate a json response, through the cache of the client if it has one.
+    """
+    if cache is not None:
+        return await cache.get(sess, url, model, identity, headers=headers)
+    resp = await sess.get(url, headers=headers)
+    return await parse_response(resp, model)
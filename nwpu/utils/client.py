@@ -0,0 +1,111 @@
+import asyncio
+from typing import Dict, Iterable, Optional
+
+from aiohttp import ClientRequest, ClientResponse, ClientSession, ClientTimeout, TCPConnector, TraceConfig
+from aiohttp.client_middlewares import ClientHandlerType, ClientMiddlewareType
+
+from nwpu.utils.common import DEFAULT_HEADER
+
+# max concurrent requests per campus host, a request holds its slot until its response is released
+HOST_LIMITS: Dict[str, int] = {
+    'uis.nwpu.edu.cn': 8,
+    'ecampus.nwpu.edu.cn': 16,
+    'authx-service.nwpu.edu.cn': 8,
+    'portal-service.nwpu.edu.cn': 8,
+    'mail.nwpu.edu.cn': 16,
+    'hq-bus.nwpu.edu.cn': 4,
+    'idle-classroom.nwpu.edu.cn': 8,
+    'secondhand-market.nwpu.edu.cn': 8,
+}
+
+DEFAULT_TIMEOUT = ClientTimeout(total=30, connect=10, sock_connect=10, sock_read=20)
+
+
+class HostLimiter:
+    """
+    aiohttp client middleware bounding the concurrent requests per host.
+    TCPConnector only supports a single limit_per_host, the campus hosts do not all cope with the same load.
+    A slot is held from the request until its response is released (body read, release() or the end
+    of `async with`), so it also bounds the connections in use for the host. The limits are per
+    HostLimiter, i.e. per session of create_session.
+    Innermost middleware of create_session: a slot is only held during the exchange of one request,
+    not while an outer middleware waits (a TokenRefresher refreshing, a retry backoff), whose own
+    requests may need a slot of the same host.
+    """
+    limits: Dict[str, int]
+
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = dict(limits)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {
+            host: asyncio.Semaphore(limit) for host, limit in self.limits.items()}
+
+    async def __call__(self, req: ClientRequest, handler: ClientHandlerType) -> ClientResponse:
+        semaphore = self._semaphores.get(req.url.host)
+        if semaphore is None:
+            return await handler(req)
+        await semaphore.acquire()
+        try:
+            resp = await handler(req)
+        except BaseException:
+            semaphore.release()
+            raise
+        if resp.connection is None:
+            # the body was already read and the connection released
+            semaphore.release()
+        else:
+            resp.connection.add_callback(semaphore.release)
+        return resp
+
+
+def create_connector(limit: int = 100,
+                     limit_per_host: int = max(HOST_LIMITS.values()),
+                     keepalive_timeout: float = 30.0,
+                     dns_ttl: int = 300,
+                     **kwargs) -> TCPConnector:
+    """
+    Connector tuned for the campus hosts, to be created inside a running event loop.
+    Can be shared by many sessions, e.g. AccountPool(connector=create_connector()).
+    :param limit: max connections in total.
+    :param limit_per_host: max connections per host, for all the hosts and all the sessions of the
+        connector. The lower limits of HOST_LIMITS are applied per session by HostLimiter.
+    :param keepalive_timeout: seconds an idle connection is kept open for reuse.
+    :param dns_ttl: seconds the resolved addresses are cached.
+    :param kwargs: passed to TCPConnector, e.g. resolver.
+    :return:
+    """
+    return TCPConnector(limit=limit,
+                        limit_per_host=limit_per_host,
+                        keepalive_timeout=keepalive_timeout,
+                        use_dns_cache=True,
+                        ttl_dns_cache=dns_ttl,
+                        **kwargs)
+
+
+def create_session(connector: Optional[TCPConnector] = None,
+                   host_limits: Optional[Dict[str, int]] = None,
+                   timeout: ClientTimeout = DEFAULT_TIMEOUT,
+                   headers: Optional[Dict[str, str]] = None,
+                   middlewares: Iterable[ClientMiddlewareType] = (),
+                   trace_configs: Optional[Iterable[TraceConfig]] = None,
+                   **kwargs) -> ClientSession:
+    """
+    Build a ClientSession for the campus services, to be called inside a running event loop.
+    The headers are sent with every request, the request classes do not pass them again.
+    :param connector: defaults to create_connector(), owned by the session.
+    :param host_limits: max concurrent requests per host, defaults to HOST_LIMITS.
+    :param timeout:
+    :param headers: session level headers, defaults to DEFAULT_HEADER.
+    :param middlewares: extra client middlewares, e.g. a TokenRefresher, outside of the HostLimiter.
+    :param trace_configs:
+    :param kwargs: passed to ClientSession.
+    :return:
+    """
+    connector_owner = connector is None
+    return ClientSession(connector=connector or create_connector(),
+                         connector_owner=connector_owner,
+                         timeout=timeout,
+                         headers=headers if headers is not None else DEFAULT_HEADER,
+                         middlewares=(*middlewares,
+                                      HostLimiter(host_limits if host_limits is not None else HOST_LIMITS)),
+                         trace_configs=list(trace_configs) if trace_configs is not None else None,
+                         **kwargs)
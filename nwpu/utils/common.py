@@ -1,8 +1,12 @@
-import pickle
+import json
 import time
+from email.utils import formatdate
 from enum import Enum
+from http.cookies import Morsel
+from typing import Optional
 
 from aiohttp import ClientSession
+from yarl import URL
 
 DEFAULT_HEADER = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.90 Safari/537.36 Edg/89.0.774.54"}
 
@@ -20,6 +24,71 @@ class BoolString(str, Enum):
     true = "true"
     false = "false"
 
+def _cookie_expiry(session: ClientSession, cookie: Morsel) -> Optional[float]:
+    """
+    :return: the unix time at which the cookie expires, None for a session cookie.
+    """
+    # the deadline computed by the jar when the cookie was received, CookieJar has no public accessor
+    deadlines = getattr(session.cookie_jar, '_expirations', None) or dict()
+    deadline = deadlines.get((cookie['domain'], cookie['path'].rstrip('/'), cookie.key))
+    if deadline is None and cookie['max-age']:
+        deadline = time.time() + int(cookie['max-age'])
+    return deadline
+
+
 def dump_session(session: ClientSession) -> bytes:
-    return pickle.dumps(session.cookie_jar)
+    """
+    Serialize the cookies of the session.
+    The expiry is stored as an absolute time, not as the max-age, which would start again at every load.
+    :param session:
+    :return: the cookies, as json bytes. Use load_session to restore them.
+    """
+    # (domain, path, name) in aiohttp >= 3.12, (domain, name) before
+    host_only = {(x[0], x[-1]) for x in session.cookie_jar.host_only_cookies}
+    cookies = [{
+        'name': cookie.key,
+        'value': cookie.value,
+        'domain': cookie['domain'],
+        'path': cookie['path'],
+        # unix time, None for a session cookie
+        'expires_at': _cookie_expiry(session, cookie),
+        'secure': bool(cookie['secure']),
+        'httponly': bool(cookie['httponly']),
+        # sent to its domain only, not to the subdomains
+        'host_only': (cookie['domain'], cookie.key) in host_only,
+    } for cookie in session.cookie_jar]
+    return json.dumps(cookies).encode(encoding='utf-8')
+
+def load_session(session: ClientSession, data: bytes) -> int:
+    """
+    Restore the cookies dumped by dump_session into the session, the expired ones are dropped.
+    :param session:
+    :param data: the output of dump_session.
+    :return: the number of cookies restored.
+    """
+    cookies = json.loads(data)
+    if not isinstance(cookies, list):
+        raise ValueError("Invalid session dump.")
+    restored = 0
+    for item in cookies:
+        if not isinstance(item, dict) or not isinstance(item.get('name'), str) or not isinstance(item.get('value'), str):
+            raise ValueError("Invalid cookie in session dump.")
+        if item.get('expires_at') is not None and item['expires_at'] <= time.time():
+            continue
+        morsel = Morsel()
+        morsel.set(item['name'], item['value'], item['value'])
+        for attr in ('domain', 'path', 'expires', 'max-age', 'secure', 'httponly'):
+            if item.get(attr):
+                morsel[attr] = item[attr]
+        if item.get('expires_at') is not None:
+            morsel['expires'] = formatdate(item['expires_at'], usegmt=True)
+        domain = item.get('domain') or ''
+        if item.get('host_only'):
+            # without a domain attribute the jar keeps the cookie for the host of the url only
+            morsel['domain'] = ''
+        session.cookie_jar.update_cookies(
+            {item['name']: morsel},
+            URL(f"https://{domain}{item.get('path') or '/'}") if domain else URL())
+        restored += 1
+    return restored
 
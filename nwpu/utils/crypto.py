@@ -1,13 +1,39 @@
 import base64
+import hashlib
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from Crypto.PublicKey import RSA
-from Crypto.Cipher import PKCS1_v1_5
+# pycryptodome is imported by the functions using it, not when the package is imported
+if TYPE_CHECKING:
+    from Crypto.Cipher.PKCS1_v1_5 import PKCS115_Cipher
+    from Crypto.PublicKey.RSA import RsaKey
 
 ENCRYPTED_PASSWORD_PREFIX = '__RSA__'
 
+@lru_cache(maxsize=8)
+def load_public_key(public_key: str) -> 'RsaKey':
+    """
+    Parse the PEM public key, cached per key.
+    :param public_key:
+    :return:
+    """
+    from Crypto.PublicKey import RSA
+    return RSA.import_key(public_key)
+
+@lru_cache(maxsize=8)
+def load_cipher(public_key: str) -> 'PKCS115_Cipher':
+    from Crypto.Cipher import PKCS1_v1_5
+    return PKCS1_v1_5.new(load_public_key(public_key))
+
+def public_key_fingerprint(public_key: str) -> str:
+    """
+    :param public_key: the PEM public key.
+    :return: sha256 of the DER encoded key, in hex.
+    """
+    return hashlib.sha256(load_public_key(public_key).export_key(format='DER')).hexdigest()
+
 def encrypt_password(password: str, public_key: str) -> str:
-    rsa_key = RSA.import_key(public_key)
-    cipher = PKCS1_v1_5.new(rsa_key)
+    cipher = load_cipher(public_key)
     encrypted_text = base64.b64encode(cipher.encrypt(password.encode(encoding='utf-8')))
     return encrypted_text.decode(encoding='utf-8')
 
@@ -16,8 +42,53 @@ def wrap_password(password_encrypted: str):
     return ENCRYPTED_PASSWORD_PREFIX + password_encrypted
 
 def process_password(password: str, public_key: str) -> str:
-    password_rsa = encrypt_password(password, public_key)
-    if password_rsa.startswith(ENCRYPTED_PASSWORD_PREFIX):
-        return password_rsa
-    else:
-        return wrap_password(encrypt_password(password, public_key))
\ No newline at end of file
+    # base64 never starts with the prefix, so the result is always wrapped.
+    return wrap_password(encrypt_password(password, public_key))
+
+
+AES_NONCE_SIZE = 12
+AES_TAG_SIZE = 16
+
+def derive_key(passphrase: str | bytes, salt: bytes) -> bytes:
+    """
+    Derive an AES-256 key from a passphrase.
+    :param passphrase:
+    :param salt:
+    :return: 32 bytes of key.
+    """
+    from Crypto.Protocol.KDF import scrypt
+    if isinstance(passphrase, str):
+        passphrase = passphrase.encode(encoding='utf-8')
+    return scrypt(passphrase, salt, key_len=32, N=2 ** 14, r=8, p=1)
+
+def encrypt_blob(key: bytes, data: bytes, associated_data: bytes = b'') -> bytes:
+    """
+    Encrypt with AES-GCM.
+    :param key:
+    :param data:
+    :param associated_data: authenticated but not encrypted, must be the same when decrypting.
+    :return: nonce + tag + ciphertext
+    """
+    from Crypto.Cipher import AES
+    from Crypto.Random import get_random_bytes
+    nonce = get_random_bytes(AES_NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(associated_data)
+    encrypted, tag = cipher.encrypt_and_digest(data)
+    return nonce + tag + encrypted
+
+def decrypt_blob(key: bytes, blob: bytes, associated_data: bytes = b'') -> bytes:
+    """
+    Decrypt the output of encrypt_blob.
+    :param key:
+    :param blob:
+    :param associated_data:
+    :return: the plain data.
+    :raise ValueError: if the key is wrong or the blob has been tampered with.
+    """
+    from Crypto.Cipher import AES
+    nonce = blob[:AES_NONCE_SIZE]
+    tag = blob[AES_NONCE_SIZE:AES_NONCE_SIZE + AES_TAG_SIZE]
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(associated_data)
+    return cipher.decrypt_and_verify(blob[AES_NONCE_SIZE + AES_TAG_SIZE:], tag)
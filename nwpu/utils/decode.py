@@ -0,0 +1,138 @@
+import json
+import time
+from typing import Any, Dict, Optional, Type, TypeVar
+
+from aiohttp import ClientResponse, ContentTypeError
+from pydantic import BaseModel
+
+from nwpu.utils.metrics import Phase, endpoint_name, get_instrumentation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+T = TypeVar('T', bound=BaseModel)
+
+UTF8_CHARSETS = ('utf-8', 'utf8')
+
+# the two ways to turn a json body into a model
+JSON = 'json'  # model_validate_json on the raw body, decoding and validation in one pass
+PYTHON = 'python'  # loads (orjson when installed), then model_validate of the python objects
+
+# model -> PYTHON for the models measured faster on that path by benchmarks/bench_decode.py
+# (pydantic keeps the parsed json around to try the members of a `SubModel | Any` union),
+# the others use JSON
+DECODE_PATHS: Dict[Type[BaseModel], str] = dict()
+
+
+def loads(data: bytes | str) -> Any:
+    """
+    json.loads, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def check_content_type(resp: ClientResponse, content_type: Optional[str] = 'application/json'):
+    """
+    Same check as ClientResponse.json.
+    :param resp:
+    :param content_type: the expected content type, None to skip the check.
+    :raise ContentTypeError:
+    """
+    if content_type is not None and content_type not in resp.content_type:
+        raise ContentTypeError(resp.request_info, resp.history, status=resp.status,
+                               message=f"Attempt to decode JSON with unexpected mimetype: {resp.content_type}",
+                               headers=resp.headers)
+
+
+def _utf8(resp: ClientResponse, body: bytes) -> bytes | str:
+    # pydantic and orjson read utf-8 bytes directly, the rare other charsets are decoded first
+    if resp.charset is not None and resp.charset.lower() not in UTF8_CHARSETS:
+        return body.decode(resp.charset)
+    return body
+
+
+def decode_path(model: Type[BaseModel]) -> str:
+    """
+    :return: JSON or PYTHON, the path of the model: JSON unless pinned in DECODE_PATHS.
+    """
+    return DECODE_PATHS.get(model, JSON)
+
+
+def _validate(model: Type[T], body: bytes | str) -> tuple[T, Optional[float], float]:
+    """
+    :return: the model, the decoding seconds (None on the JSON path, decoded while validating)
+        and the validation seconds.
+    """
+    path = decode_path(model)
+    start = time.perf_counter()
+    if path == JSON:
+        result = model.model_validate_json(body)
+        decoded = None
+        validated = time.perf_counter() - start
+    else:
+        data = loads(body)
+        middle = time.perf_counter()
+        result = model.model_validate(data)
+        decoded = middle - start
+        validated = time.perf_counter() - middle
+    return result, decoded, validated
+
+
+def validate_json(model: Type[T], body: bytes | str) -> T:
+    """
+    Decode and validate a json document into the model, along its path, see decode_path.
+    :param model:
+    :param body:
+    :return:
+    """
+    return _validate(model, body)[0]
+
+
+async def read_json(resp: ClientResponse, content_type: Optional[str] = 'application/json') -> Any:
+    """
+    Decode a json response into python objects, for the callers which need a dict rather than a model.
+    :param resp:
+    :param content_type: the expected content type, None to skip the check.
+    :return: the decoded body, None if it is empty.
+    """
+    body = await resp.read()
+    check_content_type(resp, content_type)
+    if not body.strip():
+        return None
+    return loads(_utf8(resp, body))
+
+
+async def parse_response(resp: ClientResponse, model: Type[T], content_type: Optional[str] = 'application/json') -> T:
+    """
+    Validate a json response into a model.
+    The raw body is handed to pydantic's json parser, without building the intermediate dicts,
+    or decoded with orjson (when available) then validated for the models pinned in DECODE_PATHS.
+    The body read, the decoding and the validation are timed when an instrumentation is installed;
+    on the first path the decoding is part of the validation, no decode phase is reported.
+    :param resp:
+    :param model: the response model.
+    :param content_type: the expected content type, "text/x-json" for coremail, None to skip the check.
+    :return: the validated model.
+    """
+    instrumentation = get_instrumentation()
+    if not instrumentation.enabled:
+        body = await resp.read()
+        check_content_type(resp, content_type)
+        return validate_json(model, _utf8(resp, body))
+
+    start = time.perf_counter()
+    body = await resp.read()
+    read = time.perf_counter()
+    check_content_type(resp, content_type)
+    result, decoded, validated = _validate(model, _utf8(resp, body))
+
+    endpoint = endpoint_name(resp.url)
+    instrumentation.observe(endpoint, Phase.BODY, read - start)
+    if decoded is not None:
+        instrumentation.observe(endpoint, Phase.DECODE, decoded)
+    instrumentation.observe(endpoint, Phase.VALIDATE, validated)
+    return result
@@ -0,0 +1,145 @@
+import copy
+import operator
+import typing
+from functools import lru_cache, reduce
+from types import UnionType
+from typing import Annotated, Any, Dict, FrozenSet, Iterable, Optional, Type, TypeVar
+
+from pydantic import AfterValidator, BaseModel, create_model
+
+T = TypeVar('T', bound=BaseModel)
+
+
+@lru_cache(maxsize=None)
+def _projection(model: Type[T], fields: FrozenSet[str]) -> Type[T]:
+    unknown = fields - model.model_fields.keys()
+    if unknown:
+        raise ValueError(f"Unknown fields of {model.__name__}: {', '.join(sorted(unknown))}")
+    return create_model(f"{model.__name__}Projection",
+                        __config__=model.model_config,
+                        __module__=model.__module__,
+                        **{name: (field.annotation, copy.copy(field))
+                           for name, field in model.model_fields.items() if name in fields})
+
+
+def projection(model: Type[T], fields: Iterable[str]) -> Type[T]:
+    """
+    A model with only some fields of another one, the others are neither validated nor kept.
+    :param model: e.g. ECampusNewsFeedContentItem
+    :param fields: the python names of the kept fields, e.g. {'id', 'title', 'create_time'}
+    :return: the projected model, cached.
+    """
+    return _projection(model, frozenset(fields))
+
+
+class LazyModel:
+    """
+    Keeps the decoded json object of a model and validates its fields one by one, on first access.
+    A field is validated the same way as by the model, aliases and defaults included.
+
+    Usage:
+        item = LazyModel(ECampusNewsFeedContentItem, {'id': '1', 'title': 'Notice', ...})
+        item.title  # only title is validated
+        item.materialize()  # the full ECampusNewsFeedContentItem
+    """
+    __slots__ = ('_model', '_raw', '_values')
+
+    def __init__(self, model: Type[BaseModel], raw: Dict[str, Any]):
+        self._model = model
+        self._raw = raw
+        self._values = dict()
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_') or name not in self._model.model_fields:
+            raise AttributeError(f"'{self._model.__name__}' object has no attribute '{name}'")
+        if name not in self._values:
+            # a single field model validates the field with its alias, default and validators
+            self._values[name] = getattr(projection(self._model, (name,)).model_validate(self._raw), name)
+        return self._values[name]
+
+    @property
+    def raw(self) -> Dict[str, Any]:
+        return self._raw
+
+    @property
+    def model(self) -> Type[BaseModel]:
+        return self._model
+
+    def materialize(self) -> BaseModel:
+        """
+        :return: the fully validated model.
+        """
+        return self._model.model_validate(self._raw)
+
+    def model_dump(self, **kwargs) -> Dict[str, Any]:
+        return self.materialize().model_dump(**kwargs)
+
+    def __repr__(self) -> str:
+        return f"Lazy{self._model.__name__}({', '.join(f'{k}={v!r}' for k, v in self._values.items())})"
+
+
+def _lazy(model: Type[BaseModel], raw: Any) -> Any:
+    # the `| Any` fallbacks of the models also accept non-objects, these are kept as is
+    return LazyModel(model, raw) if isinstance(raw, dict) else raw
+
+
+def _substitute(annotation: Any, old: type, new: Any) -> Any:
+    if annotation is old:
+        return new
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return _variant(annotation, old, new)
+    args = typing.get_args(annotation)
+    if not args:
+        return annotation
+    new_args = tuple(_substitute(x, old, new) for x in args)
+    if new_args == args:
+        return annotation
+    origin = typing.get_origin(annotation)
+    if origin is UnionType:
+        return reduce(operator.or_, new_args)
+    if origin is typing.Union:
+        return typing.Union[new_args]
+    if origin is Annotated:
+        return Annotated[(new_args[0], *annotation.__metadata__)]
+    return origin[new_args]
+
+
+@lru_cache(maxsize=None)
+def _variant(model: Type[T], old: type, new: Any) -> Type[T]:
+    fields = dict()
+    for name, field in model.model_fields.items():
+        annotation = _substitute(field.annotation, old, new)
+        if annotation is not field.annotation:
+            fields[name] = (annotation, copy.copy(field))
+    if not fields:
+        return model
+    # a subclass, isinstance checks and type hints of the callers still hold
+    return create_model(model.__name__, __base__=model, __module__=model.__module__, **fields)
+
+
+@lru_cache(maxsize=None)
+def _response_model(model: Type[T], item: Type[BaseModel], lazy: bool, fields: Optional[FrozenSet[str]]) -> Type[T]:
+    if fields is not None:
+        new = new_item = projection(item, fields)
+    elif lazy:
+        new = new_item = item
+    else:
+        return model
+    if lazy:
+        new = Annotated[Any, AfterValidator(lambda raw: _lazy(new_item, raw))]
+    return _variant(model, item, new)
+
+
+def response_model(model: Type[T],
+                   item: Type[BaseModel],
+                   lazy: bool = False,
+                   fields: Optional[Iterable[str]] = None) -> Type[T]:
+    """
+    The response model to use for the lazy / projected validation of its items.
+    :param model: the response model, e.g. ECampusNewsFeedContentResponse
+    :param item: the model of the items nested in the response, e.g. ECampusNewsFeedContentItem
+    :param lazy: the items are LazyModel, validated field by field on access.
+    :param fields: only validate and keep these fields of the items.
+    :return: model itself when neither lazy nor fields is given, the variants are cached.
+    """
+    return _response_model(model, item, lazy, frozenset(fields) if fields is not None else None)
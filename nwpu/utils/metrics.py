@@ -0,0 +1,207 @@
+import asyncio
+from bisect import bisect_left
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import TraceConfig, TraceConnectionCreateEndParams, TraceConnectionCreateStartParams, \
+    TraceDnsResolveHostEndParams, TraceDnsResolveHostStartParams, TraceRequestEndParams, \
+    TraceRequestExceptionParams, TraceRequestHeadersSentParams, TraceRequestStartParams, ClientSession
+from yarl import URL
+
+
+class Phase:
+    DNS = 'dns'
+    CONNECT = 'connect'  # includes dns and tls, when a new connection is needed
+    TTFB = 'ttfb'  # from the request headers sent to the response headers received
+    BODY = 'body'  # reading the response body
+    DECODE = 'decode'  # json decoding, when the body is decoded before the validation (orjson)
+    VALIDATE = 'validate'  # pydantic validation, including the json decoding when done in one pass
+    TOTAL = 'total'  # from the request start to the response headers received
+
+
+# (url without query, func query param) -> "ClassName.CONSTANT"
+_endpoints: Dict[Tuple[str, Optional[str]], str] = dict()
+# longest first, for the urls built with concat_url
+_prefixes: List[Tuple[str, str]] = list()
+
+
+def register_endpoints(url_class: type, funcs: Optional[Dict[str, str]] = None):
+    """
+    Register the url constants of a request module, so that the metrics are tagged by constant name.
+    :param url_class: e.g. ECampusUrl
+    :param funcs: constant name -> `func` query param, for the endpoints sharing the same url (coremail).
+    """
+    funcs = funcs or dict()
+    for name, value in vars(url_class).items():
+        if name.startswith('_') or not isinstance(value, str) or not value.startswith('http'):
+            continue
+        tag = f"{url_class.__name__}.{name}"
+        url = value.split('?', 1)[0]
+        _endpoints.setdefault((url, funcs.get(name)), tag)
+        _prefixes.append((url.rstrip('/') + '/', tag))
+    _prefixes.sort(key=lambda x: len(x[0]), reverse=True)
+
+
+def endpoint_name(url: URL | str) -> str:
+    """
+    :param url: the requested url.
+    :return: the name of the registered url constant, or "<host>" if unknown.
+    """
+    url = URL(url)
+    bare = str(url.with_query(None).with_fragment(None))
+    func = url.query.get('func')
+    if (tag := _endpoints.get((bare, func))) is not None or (tag := _endpoints.get((bare, None))) is not None:
+        return tag
+    for prefix, tag in _prefixes:
+        if bare.startswith(prefix):
+            return tag
+    return url.host or bare
+
+
+class Instrumentation:
+    """
+    Receives the timings of every outgoing request. The default one does nothing.
+    Install another one with set_instrumentation, and pass trace_config() to the session:
+        metrics = MetricsRecorder()
+        set_instrumentation(metrics)
+        sess = create_session(trace_configs=[metrics.trace_config()])
+    """
+    enabled: bool = False
+
+    def observe(self, endpoint: str, phase: str, seconds: float):
+        pass
+
+    def trace_config(self) -> TraceConfig:
+        """
+        :return: a TraceConfig reporting the network phases (dns, connect, ttfb, total) to observe.
+        """
+        trace = TraceConfig()
+        loop_time = lambda: asyncio.get_running_loop().time()
+
+        async def on_request_start(sess: ClientSession, ctx: SimpleNamespace, params: TraceRequestStartParams):
+            ctx.endpoint = endpoint_name(params.url)
+            ctx.start = ctx.sent = loop_time()
+
+        async def on_dns_start(sess: ClientSession, ctx: SimpleNamespace, params: TraceDnsResolveHostStartParams):
+            ctx.dns_start = loop_time()
+
+        async def on_dns_end(sess: ClientSession, ctx: SimpleNamespace, params: TraceDnsResolveHostEndParams):
+            self.observe(ctx.endpoint, Phase.DNS, loop_time() - ctx.dns_start)
+
+        async def on_connect_start(sess: ClientSession, ctx: SimpleNamespace,
+                                   params: TraceConnectionCreateStartParams):
+            ctx.connect_start = loop_time()
+
+        async def on_connect_end(sess: ClientSession, ctx: SimpleNamespace, params: TraceConnectionCreateEndParams):
+            self.observe(ctx.endpoint, Phase.CONNECT, loop_time() - ctx.connect_start)
+
+        async def on_headers_sent(sess: ClientSession, ctx: SimpleNamespace, params: TraceRequestHeadersSentParams):
+            ctx.sent = loop_time()
+
+        async def on_request_end(sess: ClientSession, ctx: SimpleNamespace, params: TraceRequestEndParams):
+            now = loop_time()
+            self.observe(ctx.endpoint, Phase.TTFB, now - ctx.sent)
+            self.observe(ctx.endpoint, Phase.TOTAL, now - ctx.start)
+
+        async def on_request_exception(sess: ClientSession, ctx: SimpleNamespace, params: TraceRequestExceptionParams):
+            self.observe(ctx.endpoint, Phase.TOTAL, loop_time() - ctx.start)
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_dns_resolvehost_start.append(on_dns_start)
+        trace.on_dns_resolvehost_end.append(on_dns_end)
+        trace.on_connection_create_start.append(on_connect_start)
+        trace.on_connection_create_end.append(on_connect_end)
+        trace.on_request_headers_sent.append(on_headers_sent)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    buckets: Tuple[float, ...]
+    counts: List[int]
+    count: int
+    sum: float
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRecorder(Instrumentation):
+    """
+    Aggregates the timings into histograms per endpoint and phase, exportable in Prometheus text format.
+    """
+    enabled = True
+    histograms: Dict[Tuple[str, str], Histogram]
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = dict()
+
+    def observe(self, endpoint: str, phase: str, seconds: float):
+        key = (endpoint, phase)
+        if key not in self.histograms:
+            self.histograms[key] = Histogram(self.buckets)
+        self.histograms[key].observe(seconds)
+
+    def to_prometheus(self, name: str = 'nwpu_request_phase_seconds') -> str:
+        """
+        :param name: the metric name.
+        :return: the histograms in Prometheus text exposition format.
+        """
+        lines = [f'# HELP {name} Duration of the phases of the requests to the campus services.',
+                 f'# TYPE {name} histogram']
+        for (endpoint, phase), histogram in sorted(self.histograms.items()):
+            labels = f'endpoint="{endpoint}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """
+    Reports the timings to an OpenTelemetry histogram, requires opentelemetry-api.
+    """
+    enabled = True
+
+    def __init__(self, meter_name: str = 'nwpu', histogram_name: str = 'nwpu.request.phase.duration'):
+        from opentelemetry import metrics
+
+        self._histogram = metrics.get_meter(meter_name).create_histogram(
+            histogram_name, unit='s', description='Duration of the phases of the requests to the campus services.')
+
+    def observe(self, endpoint: str, phase: str, seconds: float):
+        self._histogram.record(seconds, {'endpoint': endpoint, 'phase': phase})
+
+
+_instrumentation: Instrumentation = Instrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation]):
+    """
+    Install the instrumentation used by the request modules, None restores the no-op one.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation if instrumentation is not None else Instrumentation()
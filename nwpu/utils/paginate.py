@@ -0,0 +1,142 @@
+import asyncio
+import math
+from collections import deque
+from contextlib import aclosing
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Iterator, Optional
+
+from pydantic import BaseModel
+
+# pages requested ahead of the consumer
+DEFAULT_PREFETCH = 4
+
+
+def lookup(obj: Any, path: str) -> Any:
+    """
+    Follow a dotted attribute path, e.g. lookup(resp, 'data.records').
+    :return: None when a step is missing, e.g. the data of a failed response.
+    """
+    for name in path.split('.'):
+        obj = getattr(obj, name, None)
+        if obj is None:
+            return None
+    return obj
+
+
+class Paginator:
+    """
+    Async iterator over all the records of a paged endpoint.
+    The first page gives the total, the next pages are then requested `prefetch` at a time,
+    concurrently, and handed out in order. A page is only requested when the consumer has
+    taken one of the pages ahead of it, so at most `prefetch` pages are buffered.
+
+    Usage:
+        async for item in market.iter_item_list(MarketItemListRequest(page_size=50)):
+            ...
+        async for page in market.iter_item_list(...).pages():
+            ...
+    """
+    fetch: Callable[[Any], Awaitable[Any]]
+    request: BaseModel
+    records: str
+    total: str
+    page_field: str
+    size_field: str
+    base: int
+    offset: bool
+    prefetch: int
+    max_pages: Optional[int]
+
+    def __init__(self,
+                 fetch: Callable[[Any], Awaitable[Any]],
+                 request: BaseModel,
+                 records: str,
+                 total: str,
+                 page_field: str,
+                 size_field: str,
+                 base: int = 1,
+                 offset: bool = False,
+                 prefetch: int = DEFAULT_PREFETCH,
+                 max_pages: Optional[int] = None):
+        """
+        :param fetch: the request method, e.g. MarketRequest.get_item_list.
+        :param request: the request of the first page, its page field is the first page fetched.
+        :param records: attribute path of the records in a response, e.g. 'data.records'.
+        :param total: attribute path of the total number of records in a response, e.g. 'data.total'.
+        :param page_field: the page number field of the request, or the offset field if offset is True.
+        :param size_field: the page size field of the request.
+        :param base: the number of the first page of the endpoint, 0 or 1.
+        :param offset: the page field is the offset of the first record, e.g. MailListRequest.start.
+        :param prefetch: pages requested concurrently, 1 to walk the pages one after the other.
+        :param max_pages: stop after this many pages.
+        """
+        if prefetch < 1:
+            raise ValueError("prefetch must be at least 1.")
+        self.fetch = fetch
+        self.request = request
+        self.records = records
+        self.total = total
+        self.page_field = page_field
+        self.size_field = size_field
+        self.base = base
+        self.offset = offset
+        self.prefetch = prefetch
+        self.max_pages = max_pages
+
+    def _request(self, value: int) -> BaseModel:
+        return self.request.model_copy(update={self.page_field: value})
+
+    def _next_values(self, first: int, total: Optional[int]) -> Iterator[int]:
+        """
+        The page field values after the first page, all of them up to the total if it is known.
+        """
+        size = getattr(self.request, self.size_field)
+        if total is None:
+            value = first
+            while True:
+                value += size if self.offset else 1
+                yield value
+        elif self.offset:
+            yield from range(first + size, total, size)
+        else:
+            yield from range(first + 1, self.base + math.ceil(total / size))
+
+    async def pages(self) -> AsyncIterator[Any]:
+        """
+        The responses, in page order.
+        """
+        first = await self.fetch(self.request)
+        yield first
+        if not lookup(first, self.records):
+            return
+
+        total = lookup(first, self.total)
+        values = self._next_values(getattr(self.request, self.page_field), total)
+        if self.max_pages is not None:
+            values = islice(values, self.max_pages - 1)
+        # without a total, the end is the first empty page: no pages are requested ahead
+        prefetch = self.prefetch if total is not None else 1
+
+        pending: Deque[asyncio.Task] = deque()
+        try:
+            for value in islice(values, prefetch):
+                pending.append(asyncio.create_task(self.fetch(self._request(value))))
+            while pending:
+                page = await pending.popleft()
+                if not lookup(page, self.records):
+                    # the total shrank while paging
+                    return
+                value = next(values, None)
+                if value is not None:
+                    pending.append(asyncio.create_task(self.fetch(self._request(value))))
+                yield page
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        async with aclosing(self.pages()) as pages:
+            async for page in pages:
+                for record in lookup(page, self.records):
+                    yield record
@@ -4,7 +4,7 @@ import hashlib
 import json
 import random
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from urllib.parse import urlencode
 import uuid
 
@@ -98,3 +98,26 @@ def generate_fake_tracer_id() -> str:
 def find_tracer_id(html: str) -> list[str]:
     regex = re.compile(r'<input\s+[^>]*name=["\']execution["\'][^>]*value=["\']([^"\']+)["\']')
     return regex.findall(html)
+
+
+def decode_jwt_payload(token: str) -> Dict[str, Any]:
+    """
+    Decode the payload (claims) part of a JWT, without verifying the signature.
+    :param token: the JWT.
+    :return: the claims.
+    """
+    payload = token.split('.')[1]
+    payload += '=' * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload))
+
+
+def jwt_expiry(token: str) -> Optional[int]:
+    """
+    Get the `exp` claim of a JWT.
+    :param token: the JWT.
+    :return: the expiry as a unix timestamp in seconds, or None if the token is not a JWT or has no expiry.
+    """
+    try:
+        return int(decode_jwt_payload(token)['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
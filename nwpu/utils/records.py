@@ -0,0 +1,125 @@
+import dataclasses
+import sys
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from nwpu.utils.lazy import LazyModel
+
+# typecodes of the columns packed into arrays
+ARRAY_TYPECODES: Dict[type, str] = {
+    int: 'q',
+    float: 'd',
+}
+
+
+@lru_cache(maxsize=None)
+def _record_type(model: Type[BaseModel], fields: Optional[FrozenSet[str]]) -> type:
+    if fields is not None:
+        unknown = fields - model.model_fields.keys()
+        if unknown:
+            raise ValueError(f"Unknown fields of {model.__name__}: {', '.join(sorted(unknown))}")
+    return dataclasses.make_dataclass(
+        f"{model.__name__}Record",
+        [(name, field.annotation) for name, field in model.model_fields.items()
+         if fields is None or name in fields],
+        slots=True,
+        namespace={'__module__': model.__module__})
+
+
+def record_type(model: Type[BaseModel], fields: Optional[Iterable[str]] = None) -> type:
+    """
+    A slotted dataclass with the fields of the model, without the per instance __dict__
+    and fields-set bookkeeping of pydantic models.
+    :param model: e.g. MailListItem
+    :param fields: the python names of the kept fields, all of them by default.
+    :return: the record type, cached.
+    """
+    return _record_type(model, frozenset(fields) if fields is not None else None)
+
+
+def _model_of(item: BaseModel | LazyModel) -> Type[BaseModel]:
+    return item.model if isinstance(item, LazyModel) else type(item)
+
+
+def _values(item: BaseModel | LazyModel, names: Tuple[str, ...], intern: bool) -> List[Any]:
+    values = [getattr(item, name) for name in names]
+    if intern:
+        values = [sys.intern(x) if type(x) is str else x for x in values]
+    return values
+
+
+def to_records(items: Iterable[BaseModel | LazyModel],
+               fields: Optional[Iterable[str]] = None,
+               intern: bool = True) -> list:
+    """
+    Convert validated list results into slotted records.
+    The items which are not models (the `| Any` fallbacks of the response models) are skipped.
+
+    Usage:
+        mails = await mail.get_mail_list(MailListRequest(limit=1000))
+        headers = to_records(mails.categories, fields=('id', 'from_', 'subject', 'received_date'))
+
+    :param items: e.g. MailListResponse.categories
+    :param fields: the python names of the kept fields, all of them by default.
+    :param intern: intern the strings, the values repeated over many records (dates, types, names)
+        are then stored once.
+    :return: the records, in the same order.
+    """
+    records = list()
+    record = names = model = None
+    for item in items:
+        if not isinstance(item, (BaseModel, LazyModel)):
+            continue
+        if _model_of(item) is not model:
+            model = _model_of(item)
+            record = record_type(model, fields)
+            names = tuple(x.name for x in dataclasses.fields(record))
+        records.append(record(*_values(item, names, intern)))
+    return records
+
+
+def _column(values: List[Any], annotation: Any) -> list | array:
+    typecode = ARRAY_TYPECODES.get(annotation)
+    if typecode is None:
+        return values
+    try:
+        return array(typecode, values)
+    except (TypeError, OverflowError):
+        # missing values or unexpected types, kept as python objects
+        return values
+
+
+def to_columns(items: Iterable[BaseModel | LazyModel],
+               fields: Optional[Iterable[str]] = None,
+               intern: bool = True) -> Dict[str, list | array]:
+    """
+    Columnar view of list results, for analytics.
+    The int and float columns are packed into arrays, the others are lists.
+
+    Usage:
+        costs = await ecampus.get_user_consumption_history(...)
+        columns = to_columns(costs.data.data.cost_list, fields=('balance', 'occurrence_time'))
+        sum(columns['balance'])
+
+    :param items: models of the same type, the items which are not models are skipped.
+    :param fields: the python names of the kept fields, all of them by default.
+    :param intern: intern the strings.
+    :return: a list of values per field, keyed by the field name.
+    """
+    items = [x for x in items if isinstance(x, (BaseModel, LazyModel))]
+    if not items:
+        return dict()
+    model = _model_of(items[0])
+    names = fields if fields is not None else model.model_fields.keys()
+    columns = dict()
+    for name in names:
+        if name not in model.model_fields:
+            raise ValueError(f"Unknown field of {model.__name__}: {name}")
+        values = [getattr(x, name) for x in items]
+        if intern:
+            values = [sys.intern(x) if type(x) is str else x for x in values]
+        columns[name] = _column(values, model.model_fields[name].annotation)
+    return columns
@@ -0,0 +1,156 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiohttp import ClientRequest, ClientResponse, ContentTypeError
+from aiohttp.client_middlewares import ClientHandlerType
+
+from nwpu.utils.decode import read_json
+
+OA_HOST = 'uis.nwpu.edu.cn'
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# the 2xx json bodies larger than this are not read for a failure code, the error bodies are small
+SNIFF_MAX_BYTES = 4096
+
+# set while a refresh is running, so that the authorize requests are not intercepted
+_refreshing: ContextVar[bool] = ContextVar('nwpu_refreshing', default=False)
+
+
+class RefreshTarget:
+    hosts: tuple[str, ...]
+    refresh: Callable[[], Awaitable[Any]]
+    # bumped after every successful refresh
+    generation: int
+    # the latest refresh result, a token if the service uses X-Id-Token
+    result: Any
+    inflight: Optional[asyncio.Future]
+    # read the json bodies for a failure code, for the services answering 200 {"code": 401}
+    sniff_body: bool
+
+    def __init__(self, hosts: Iterable[str], refresh: Callable[[], Awaitable[Any]], sniff_body: bool = False):
+        self.hosts = tuple(hosts)
+        self.refresh = refresh
+        self.sniff_body = sniff_body
+        self.generation = 0
+        self.result = None
+        self.inflight = None
+
+
+class TokenRefresher:
+    """
+    aiohttp client middleware that re-authorizes a service when its token / session expires,
+    then replays the failed request once.
+    Concurrent failures of the same service share a single in-flight refresh.
+
+    Usage:
+        refresher = TokenRefresher()
+        sess = create_session(middlewares=[refresher])
+        ecampus = ECampusRequest(sess, token)
+        refresher.register(('ecampus.nwpu.edu.cn', 'portal-service.nwpu.edu.cn'), ecampus.get_token, sniff_body=True)
+
+    An auth failure is any of:
+        - a status in failure_statuses (401, 403 by default)
+        - a redirect to the CAS login (uis.nwpu.edu.cn)
+        - for the targets registered with sniff_body, a json body whose `code` is in failure_codes
+          (401, 403 by default). Only the non-2xx bodies and the 2xx ones of at most sniff_max_bytes
+          are read, the other responses are not decoded twice.
+    """
+    failure_statuses: tuple[int, ...]
+    failure_codes: tuple[int | str, ...]
+    sniff_max_bytes: int
+    _targets: Dict[str, RefreshTarget]
+
+    def __init__(self,
+                 failure_statuses: Iterable[int] = (401, 403),
+                 failure_codes: Iterable[int | str] = (401, 403),
+                 sniff_max_bytes: int = SNIFF_MAX_BYTES):
+        self.failure_statuses = tuple(failure_statuses)
+        self.failure_codes = tuple(failure_codes)
+        self.sniff_max_bytes = sniff_max_bytes
+        self._targets = dict()
+
+    def register(self, hosts: str | Iterable[str], refresh: Callable[[], Awaitable[Any]],
+                 sniff_body: bool = False) -> RefreshTarget:
+        """
+        Register the refresh function of a service.
+        :param hosts: the hosts serving the api of the service.
+        :param refresh: coroutine function re-running the authorization,
+        e.g. ECampusRequest.get_token or `lambda: BusOaRequest.authorize(sess)`.
+        If it returns a string, it is used as the new X-Id-Token of the replayed request.
+        :param sniff_body: the service reports an expired token in the `code` of its json bodies.
+        :return:
+        """
+        target = RefreshTarget((hosts,) if isinstance(hosts, str) else hosts, refresh, sniff_body)
+        for host in target.hosts:
+            self._targets[host] = target
+        return target
+
+    def _should_sniff(self, resp: ClientResponse) -> bool:
+        if 'json' not in resp.content_type:
+            return False
+        if not 200 <= resp.status < 300:
+            return True
+        # a chunked body has no length, it is not read
+        return resp.content_length is not None and resp.content_length <= self.sniff_max_bytes
+
+    async def is_auth_failure(self, resp: ClientResponse, sniff_body: bool = False) -> bool:
+        """
+        :param resp:
+        :param sniff_body: also look for a failure code in the json body, see TokenRefresher.
+        :return:
+        """
+        if resp.status in self.failure_statuses:
+            return True
+        if resp.status in REDIRECT_STATUSES:
+            location = resp.headers.get('Location', '')
+            return OA_HOST in location.split('?', 1)[0]
+        if not sniff_body or not self._should_sniff(resp):
+            return False
+        try:
+            # the body is cached by aiohttp, the caller can still read it
+            payload = await read_json(resp, content_type=None)
+        except (ContentTypeError, ValueError):
+            return False
+        return isinstance(payload, dict) and payload.get('code') in self.failure_codes
+
+    async def _run_refresh(self, target: RefreshTarget) -> Any:
+        _refreshing.set(True)
+        try:
+            target.result = await target.refresh()
+            target.generation += 1
+            return target.result
+        finally:
+            target.inflight = None
+
+    async def refresh(self, target: RefreshTarget) -> Any:
+        """
+        Refresh the target, joining the in-flight refresh if there is one.
+        :param target:
+        :return: the refresh result.
+        """
+        if target.inflight is None:
+            target.inflight = asyncio.ensure_future(self._run_refresh(target))
+        return await asyncio.shield(target.inflight)
+
+    def _apply(self, req: ClientRequest, target: RefreshTarget):
+        if isinstance(target.result, str) and 'X-Id-Token' in req.headers:
+            req.headers['X-Id-Token'] = target.result
+        req.update_cookies(req.session.cookie_jar.filter_cookies(req.url))
+
+    async def __call__(self, req: ClientRequest, handler: ClientHandlerType) -> ClientResponse:
+        target = self._targets.get(req.url.host)
+        if target is None or _refreshing.get():
+            return await handler(req)
+
+        generation = target.generation
+        resp = await handler(req)
+        if not await self.is_auth_failure(resp, target.sniff_body):
+            return resp
+
+        # someone else has refreshed while this request was in flight
+        if target.generation == generation:
+            await self.refresh(target)
+
+        resp.release()
+        self._apply(req, target)
+        return await handler(req)
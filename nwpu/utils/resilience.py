@@ -0,0 +1,202 @@
+import asyncio
+import random
+import time
+from enum import Enum
+from typing import Dict, Iterable, Optional
+
+from aiohttp import ClientConnectionError, ClientError, ClientRequest, ClientResponse
+from aiohttp.client_middlewares import ClientHandlerType
+
+from nwpu.utils.metrics import endpoint_name
+
+
+class CircuitState(str, Enum):
+    closed = "closed"  # requests go through
+    open = "open"  # requests fail fast
+    half_open = "half_open"  # a single probe request is let through
+
+
+class CircuitOpenError(ClientError):
+    def __init__(self, host: str):
+        super().__init__(f"Circuit open for host {host}")
+        self.host = host
+
+
+class CircuitBreaker:
+    failure_threshold: int
+    reset_timeout: float
+    state: CircuitState
+    failures: int
+    opened_at: float
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        :param failure_threshold: consecutive failures opening the circuit.
+        :param reset_timeout: seconds before a probe request is allowed through an open circuit.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == CircuitState.open and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = CircuitState.half_open
+            self._probing = False
+        if self.state == CircuitState.half_open:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+        return self.state == CircuitState.closed
+
+    def record_success(self):
+        self.state = CircuitState.closed
+        self.failures = 0
+        self._probing = False
+
+    def release_probe(self):
+        """
+        The request let through ended without telling anything about the host (cancelled, invalid url...),
+        another probe may be sent.
+        """
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == CircuitState.half_open or self.failures >= self.failure_threshold:
+            self.state = CircuitState.open
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class EndpointStats:
+    requests: int
+    successes: int
+    failures: int
+    retries: int
+    rejected: int
+    last_error: Optional[str]
+
+    def __init__(self):
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+        self.last_error = None
+
+    def as_dict(self) -> dict:
+        return dict(requests=self.requests, successes=self.successes, failures=self.failures,
+                    retries=self.retries, rejected=self.rejected, last_error=self.last_error)
+
+
+class Resilience:
+    """
+    aiohttp client middleware retrying transient failures and failing fast on dead hosts.
+
+    - idempotent requests (GET, HEAD, OPTIONS) are retried on connection errors, timeouts
+      and retry_statuses, with jittered exponential backoff.
+    - every host has a CircuitBreaker, an open circuit raises CircuitOpenError without sending anything.
+    - when retry_statuses are still returned after the retries, ClientResponseError is raised,
+      instead of failing later when parsing the error page.
+
+    Usage:
+        resilience = Resilience()
+        sess = create_session(middlewares=[resilience])
+        ...
+        resilience.report()
+    """
+    retries: int
+    backoff: float
+    max_backoff: float
+    retry_statuses: tuple[int, ...]
+    retry_methods: tuple[str, ...]
+    breakers: Dict[str, CircuitBreaker]
+    stats: Dict[str, EndpointStats]
+
+    def __init__(self,
+                 retries: int = 3,
+                 backoff: float = 0.2,
+                 max_backoff: float = 5.0,
+                 retry_statuses: Iterable[int] = (500, 502, 503, 504),
+                 retry_methods: Iterable[str] = ('GET', 'HEAD', 'OPTIONS'),
+                 failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self.retry_methods = tuple(retry_methods)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.breakers = dict()
+        self.stats = dict()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[host]
+
+    def endpoint_stats(self, req: ClientRequest) -> EndpointStats:
+        # the registered url constant: the urls with an id in their path share one entry
+        key = f"{req.method} {endpoint_name(req.url)}"
+        if key not in self.stats:
+            self.stats[key] = EndpointStats()
+        return self.stats[key]
+
+    def delay(self, attempt: int) -> float:
+        """
+        Full jitter backoff.
+        :param attempt: 0 for the first retry.
+        :return: seconds to wait.
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def report(self) -> Dict[str, dict]:
+        """
+        :return: the statistics of every endpoint, keyed by "<METHOD> <ClassName.CONSTANT>", see endpoint_name.
+        """
+        return {key: stats.as_dict() for key, stats in self.stats.items()}
+
+    async def __call__(self, req: ClientRequest, handler: ClientHandlerType) -> ClientResponse:
+        breaker = self.breaker(req.url.host)
+        stats = self.endpoint_stats(req)
+        attempts = self.retries + 1 if req.method in self.retry_methods else 1
+
+        for attempt in range(attempts):
+            if not breaker.allow():
+                stats.rejected += 1
+                raise CircuitOpenError(req.url.host)
+            if attempt > 0:
+                stats.retries += 1
+            stats.requests += 1
+            last = attempt == attempts - 1
+
+            try:
+                resp = await handler(req)
+            except (ClientConnectionError, asyncio.TimeoutError) as e:
+                stats.failures += 1
+                stats.last_error = repr(e)
+                breaker.record_failure()
+                if last:
+                    raise
+            except BaseException:
+                breaker.release_probe()
+                raise
+            else:
+                if resp.status not in self.retry_statuses:
+                    stats.successes += 1
+                    breaker.record_success()
+                    return resp
+                stats.failures += 1
+                stats.last_error = f"HTTP {resp.status}"
+                breaker.record_failure()
+                if last:
+                    resp.release()
+                    resp.raise_for_status()
+                resp.release()
+
+            await asyncio.sleep(self.delay(attempt))
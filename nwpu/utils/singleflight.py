@@ -0,0 +1,108 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from pydantic import BaseModel
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call is in flight, the callers asking for the
+    same key wait for it and get its result (or its exception) instead of starting another one.
+    Nothing is kept once the call is done, see ResponseCache for caching.
+    """
+    enabled: bool
+    calls: int
+    shared: int
+
+    def __init__(self, enabled: bool = True):
+        """
+        :param enabled: False to run every call, e.g. for load tests.
+        """
+        self._flights: Dict[Hashable, asyncio.Future] = dict()
+        self.enabled = enabled
+        self.calls = 0
+        self.shared = 0
+
+    def _done(self, key: Hashable, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # retrieved here too, for the flights whose callers were all cancelled
+        if not flight.cancelled():
+            flight.exception()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        :param key: identifies the call, e.g. (method, url, params, user).
+        :param func: starts the call, only invoked if no call with this key is in flight.
+        :return: the result of the call.
+        """
+        if not self.enabled:
+            self.calls += 1
+            return await func()
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = asyncio.ensure_future(func())
+            self._flights[key] = flight
+            flight.add_done_callback(functools.partial(self._done, key))
+        else:
+            self.shared += 1
+        # a cancelled caller does not cancel the call of the others
+        return await asyncio.shield(flight)
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+# shared by the client methods decorated with single_flight
+default_group = SingleFlight()
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, BaseModel):
+        return type(value).__qualname__, value.model_dump_json()
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return type(value).__name__, tuple(_freeze(x) for x in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def client_identity(client: Any) -> Hashable:
+    """
+    The user of a service client: its token identity when it has one, else its session.
+    """
+    identity = getattr(client, 'identity', None)
+    if identity is not None:
+        return identity
+    return id(getattr(client, 'sess', None) or getattr(client, 'session', None) or client)
+
+
+def single_flight(method: Optional[Callable] = None, group: Optional[SingleFlight] = None):
+    """
+    Decorator of the read methods of the clients: concurrent calls of the method with the same
+    arguments, for the same user, share one request and its parsed result.
+    The result is shared as is, the callers should not modify it.
+
+    Usage:
+        @single_flight
+        async def get_user_card(self) -> ECampusUserCardResponse:
+    """
+    def decorate(method: Callable) -> Callable:
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            flights = group if group is not None else default_group
+            key = (method.__qualname__, client_identity(self), _freeze(args), _freeze(kwargs))
+            return await flights.do(key, lambda: method(self, *args, **kwargs))
+        return wrapper
+
+    if method is not None:
+        return decorate(method)
+    return decorate
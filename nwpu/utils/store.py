@@ -0,0 +1,221 @@
+import hashlib
+import os
+import tempfile
+import time
+from typing import Dict, Optional
+
+from aiohttp import ClientSession
+from pydantic import BaseModel, Field
+
+from nwpu.utils.common import dump_session, load_session, timestamp_sec
+from nwpu.utils.crypto import decrypt_blob, derive_key, encrypt_blob
+from nwpu.utils.parse import jwt_expiry
+
+CAS_URL = 'https://uis.nwpu.edu.cn/cas/'
+MAIL_URL = 'https://mail.nwpu.edu.cn'
+
+
+class StoredToken(BaseModel):
+    token: str
+    # unix timestamp in seconds, None if unknown
+    expires_at: Optional[int] = None
+
+
+class StoredCredential(BaseModel):
+    username: str
+    # output of dump_session
+    cookies: Optional[str] = None
+    # CAS SESSION cookie
+    session: Optional[str] = None
+    session_expires_at: Optional[int] = None
+    # Coremail.sid
+    mail_sid: Optional[str] = None
+    # service name -> X-Id-Token
+    tokens: Dict[str, StoredToken] = Field(default_factory=dict)
+    updated_at: int = Field(default_factory=timestamp_sec)
+
+
+class CredentialStore:
+    """
+    On-disk credential store, encrypted with AES-GCM, one file per username.
+    Tokens carry their expiry (from the JWT `exp` claim when possible),
+    expired entries are never returned.
+    """
+    directory: str
+    session_ttl: int
+    token_ttl: int
+    leeway: int
+
+    SALT_FILE = '.salt'
+    SALT_SIZE = 16
+
+    def __init__(self, directory: str, passphrase: str | bytes,
+                 session_ttl: int = 2 * 3600, token_ttl: int = 3600, leeway: int = 60):
+        """
+        :param directory: where the credential files are stored.
+        :param passphrase: used to derive the encryption key.
+        :param session_ttl: lifetime of the CAS session, in seconds, as the server does not tell it.
+        :param token_ttl: lifetime of tokens which are not JWTs, in seconds.
+        :param leeway: entries expiring in less than this many seconds are treated as expired.
+        """
+        self.directory = directory
+        self.session_ttl = session_ttl
+        self.token_ttl = token_ttl
+        self.leeway = leeway
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._key = derive_key(passphrase, self._load_salt())
+
+    def _load_salt(self) -> bytes:
+        path = os.path.join(self.directory, self.SALT_FILE)
+        try:
+            # O_EXCL: when several processes start together, one of them creates the salt
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return self._read_salt(path)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(self.SALT_SIZE))
+        return self._read_salt(path)
+
+    def _read_salt(self, path: str, timeout: float = 5) -> bytes:
+        # the creator may not have written the salt yet
+        deadline = time.monotonic() + timeout
+        while True:
+            with open(path, 'rb') as f:
+                salt = f.read()
+            if len(salt) >= self.SALT_SIZE:
+                return salt
+            if time.monotonic() > deadline:
+                raise ValueError(f"Incomplete salt file: {path}")
+            time.sleep(0.01)
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        # a temporary file of our own, concurrent writers do not share it
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _path(self, username: str) -> str:
+        name = hashlib.sha256(username.encode(encoding='utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, name + '.cred')
+
+    def _is_valid(self, expires_at: Optional[int]) -> bool:
+        return expires_at is None or expires_at - self.leeway > timestamp_sec()
+
+    def load(self, username: str) -> Optional[StoredCredential]:
+        """
+        Load the credentials of a user.
+        :param username:
+        :return: None if nothing is stored, or the file cannot be decrypted.
+        """
+        path = self._path(username)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            blob = f.read()
+        try:
+            data = decrypt_blob(self._key, blob, username.encode(encoding='utf-8'))
+        except ValueError:
+            return None
+        return StoredCredential.model_validate_json(data)
+
+    def save(self, credential: StoredCredential):
+        credential.updated_at = timestamp_sec()
+        username = credential.username.encode(encoding='utf-8')
+        blob = encrypt_blob(self._key, credential.model_dump_json().encode(encoding='utf-8'), username)
+        self._write(self._path(credential.username), blob)
+
+    def delete(self, username: str):
+        path = self._path(username)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _load_or_new(self, username: str) -> StoredCredential:
+        return self.load(username) or StoredCredential(username=username)
+
+    def put_session(self, username: str, sess: ClientSession, expires_at: Optional[int] = None):
+        """
+        Store the cookies of a logged-in session, including the CAS SESSION and the Coremail sid.
+        :param username:
+        :param sess:
+        :param expires_at: expiry of the CAS session, defaults to now + session_ttl.
+        :return:
+        """
+        credential = self._load_or_new(username)
+        credential.cookies = dump_session(sess).decode(encoding='utf-8')
+        if (session := sess.cookie_jar.filter_cookies(CAS_URL).get('SESSION')) is not None:
+            credential.session = session.value
+            credential.session_expires_at = expires_at or timestamp_sec() + self.session_ttl
+        if (sid := sess.cookie_jar.filter_cookies(MAIL_URL).get('Coremail.sid')) is not None:
+            credential.mail_sid = sid.value
+        self.save(credential)
+
+    def restore_session(self, username: str, sess: ClientSession) -> bool:
+        """
+        Restore the stored cookies into the session, if the CAS session has not expired.
+        :param username:
+        :param sess:
+        :return: True if restored, False if there is no CAS SESSION cookie to restore.
+        """
+        credential = self.load(username)
+        if credential is None or credential.cookies is None or credential.session is None \
+                or not self._is_valid(credential.session_expires_at):
+            return False
+        load_session(sess, credential.cookies.encode(encoding='utf-8'))
+        # e.g. the SESSION cookie has expired in the dump
+        return sess.cookie_jar.filter_cookies(CAS_URL).get('SESSION') is not None
+
+    def put_token(self, username: str, service: str, token: str, expires_at: Optional[int] = None):
+        """
+        Store the token of a service.
+        :param username:
+        :param service: service name, e.g. 'ecampus', 'market', 'classroom'.
+        :param token:
+        :param expires_at: defaults to the `exp` claim of the token, then now + token_ttl.
+        :return:
+        """
+        self.put_tokens(username, {service: token}, expires_at)
+
+    def put_tokens(self, username: str, tokens: Dict[str, str], expires_at: Optional[int] = None):
+        credential = self._load_or_new(username)
+        for service, token in tokens.items():
+            credential.tokens[service] = StoredToken(
+                token=token,
+                expires_at=expires_at or jwt_expiry(token) or timestamp_sec() + self.token_ttl)
+        self.save(credential)
+
+    def get_token(self, username: str, service: str) -> Optional[str]:
+        """
+        :param username:
+        :param service:
+        :return: the token, or None if not stored or expired.
+        """
+        return self.get_tokens(username).get(service)
+
+    def get_tokens(self, username: str) -> Dict[str, str]:
+        """
+        :param username:
+        :return: all the unexpired tokens, keyed by service name.
+        """
+        credential = self.load(username)
+        if credential is None:
+            return dict()
+        return {service: stored.token for service, stored in credential.tokens.items()
+                if self._is_valid(stored.expires_at)}
+
+    def put_mail_sid(self, username: str, sid: str):
+        credential = self._load_or_new(username)
+        credential.mail_sid = sid
+        self.save(credential)
+
+    def get_mail_sid(self, username: str) -> Optional[str]:
+        credential = self.load(username)
+        if credential is None or not self._is_valid(credential.session_expires_at):
+            return None
+        return credential.mail_sid